@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# alerts.py
+# 警示規則引擎：規則以宣告式寫在 config.json 的 "alerts"（沒寫就用 DEFAULT_RULES），
+# 先編譯成對 交易日 × 代號 寬表的向量化運算，所有規則共用同一份寬表與子運算結果，
+# 一次算完全市場，輸出依分數排序的警示清單。
+#
+#   python alerts.py --days 30                        # 最近一個交易日觸發的警示
+#   python alerts.py --days 30 --all --top 100        # 期間內每一天的警示
+#   python alerts.py --stocks 2382 1301 --days 60     # 價格類欄位（收盤價、漲跌幅、指標）只對這些股票算
+#
+# 規則格式：
+#   {"name": "外資大買且收漲", "when": [["外資", ">", 2000], ["漲跌幅", ">", 3]]}
+#   {"name": "借券餘額5日增20%", "when": [["借券餘額.pct(5)", ">", 20]]}
+#   {"name": "法人大額買賣超", "any": [["外資.abs()", ">", 400], ["投信.abs()", ">", 400]]}
+# when 全部成立、any 任一成立（兩者都有時皆須滿足）；右邊可以是數字或另一個欄位運算式，例如 ["收盤價", ">", "MA20"]。
+# 運算式：欄位名稱後接 .pct(n) .diff(n) .mean(n) .max(n) .min(n) .shift(n) .abs()，n 為交易日數。
+# 全市場欄位來自 store 的每日資料集；STOCK_DAY 是逐檔下載，價格類欄位只對觀察清單（或 --stocks）計算。
+import re
+import sys
+import argparse
+
+import datasets
+import holdings
+import indicators
+import shares
+import store
+import twse
+from stockrate.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# 全市場每日資料集 → 欄位
+MARKET = {
+    'T86': ('外資', '投信', '自營商'),
+    'TWT38U': holdings.RATIOS,
+    'BWIBBU_d': ('千張大戶持股比率',),
+    'TWT93U': ('借券賣出', '借券還券', '借券餘額'),
+}
+PRICE = datasets.OHLCV + tuple(indicators.INDICATORS)
+SOURCES = {c: ds for ds, cols in MARKET.items() for c in cols}
+SOURCES.update({c: 'STOCK_DAY' for c in PRICE})
+# 由其他欄位算出的欄位：名稱 → (相依欄位, 函式)
+DERIVED = {
+    '三大法人': (('外資', '投信', '自營商'), lambda f: f['外資'] + f['投信'] + f['自營商']),
+    '漲跌幅': (('收盤價',), lambda f: f['收盤價'].pct_change(fill_method=None) * 100),
+    '換手率': (('成交量',), lambda f: shares.turnover(f['成交量']).astype('float64')),
+    '借券占比': (('借券餘額',), lambda f: shares.lending_ratio(f['借券餘額']).astype('float64')),
+}
+
+FUNCS = {
+    'pct': lambda x, n: x.pct_change(int(n), fill_method=None) * 100,
+    'diff': lambda x, n: x.diff(int(n)),
+    'mean': lambda x, n: x.rolling(int(n), min_periods=int(n)).mean(),
+    'max': lambda x, n: x.rolling(int(n), min_periods=int(n)).max(),
+    'min': lambda x, n: x.rolling(int(n), min_periods=int(n)).min(),
+    'shift': lambda x, n: x.shift(int(n)),
+    'abs': lambda x: x.abs(),
+}
+OPS = {'>': 'greater', '>=': 'greater_equal', '<': 'less', '<=': 'less_equal', '==': 'equal', '!=': 'not_equal'}
+
+# 原本寫死在各圖裡的門檻（plot_big_trades1 的 400 張、借券圖換手率 1.5%）也改用規則表示
+DEFAULT_RULES = [
+    {"name": "外資大買且收漲", "when": [["外資", ">", 2000], ["漲跌幅", ">", 3]]},
+    {"name": "借券餘額5日增20%", "when": [["借券餘額.pct(5)", ">", 20], ["借券餘額", ">", 1000000]]},
+    {"name": "法人大額買賣超", "any": [["外資.abs()", ">", 400], ["投信.abs()", ">", 400], ["自營商.abs()", ">", 400]]},
+    {"name": "換手率偏高", "when": [["換手率", ">", 1.5]]},
+]
+
+_TERM = re.compile(r'^\s*([^\s.()]+)((?:\.\w+\([^)]*\))*)\s*$')
+
+
+# ─── 編譯 ─────────────────────────────────────────
+class Term:
+    """欄位運算式，例如 借券餘額.pct(5)；fields 為需要的基本欄位。"""
+
+    def __init__(self, text):
+        m = _TERM.match(str(text))
+        if not m:
+            raise ValueError(f"無法解析運算式：{text}")
+        self.text = str(text).strip()
+        self.field = m.group(1)
+        if self.field not in SOURCES and self.field not in DERIVED:
+            raise ValueError(f"未知欄位：{self.field}（可用：{', '.join(list(SOURCES) + list(DERIVED))}）")
+        self.calls = []
+        for name, arg in re.findall(r'\.(\w+)\(([^)]*)\)', m.group(2)):
+            if name not in FUNCS:
+                raise ValueError(f"未知運算：.{name}()（可用：{', '.join(FUNCS)}）")
+            self.calls.append((name, [a.strip() for a in arg.split(',') if a.strip()]))
+        deps = DERIVED[self.field][0] if self.field in DERIVED else (self.field,)
+        self.fields = set(deps)
+
+
+class Cond:
+    def __init__(self, spec):
+        lhs, op, rhs = spec
+        if op not in OPS:
+            raise ValueError(f"未知比較：{op}（可用：{' '.join(OPS)}）")
+        self.lhs, self.op = Term(lhs), op
+        self.rhs = rhs if isinstance(rhs, (int, float)) else Term(rhs)
+        self.fields = self.lhs.fields | (self.rhs.fields if isinstance(self.rhs, Term) else set())
+
+    def evaluate(self, ctx):
+        """回傳 (成立與否, 超過門檻的幅度, 左邊的值)，皆為 交易日 × 代號 的陣列；缺值一律不成立。"""
+        lhs = ctx.term(self.lhs)
+        rhs = ctx.term(self.rhs) if isinstance(self.rhs, Term) else np.float64(self.rhs)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            hit = getattr(np, OPS[self.op])(lhs, rhs)
+            margin = np.abs(lhs - rhs) / np.maximum(np.abs(rhs), 1.0)
+        return hit, np.where(hit, margin, -np.inf), lhs
+
+    def __str__(self):
+        return f"{self.lhs.text} {self.op} {self.rhs.text if isinstance(self.rhs, Term) else self.rhs}"
+
+
+class Rule:
+    """when 全部成立且（有 any 時）any 任一成立；分數為 when 中最弱的幅度與 any 中最強的幅度取小。"""
+
+    def __init__(self, spec):
+        self.name = spec.get("name") or "unnamed"
+        self.when = [Cond(c) for c in spec.get("when", [])]
+        self.any = [Cond(c) for c in spec.get("any", [])]
+        if not self.when and not self.any:
+            raise ValueError(f"規則 {self.name} 沒有任何條件")
+        self.fields = set().union(*(c.fields for c in self.when + self.any))
+
+    @property
+    def datasets(self):
+        return {SOURCES[f] for f in _base(self.fields)}
+
+    def evaluate(self, ctx):
+        hit, score, values = ctx.ones(), np.full(ctx.shape, np.inf), []
+        for c in self.when:
+            h, m, v = c.evaluate(ctx)
+            hit &= h
+            score = np.minimum(score, m)
+            values.append((c.lhs.text, v))
+        if self.any:
+            any_hit, best = np.zeros(ctx.shape, bool), np.full(ctx.shape, -np.inf)
+            for c in self.any:
+                h, m, v = c.evaluate(ctx)
+                any_hit |= h
+                best = np.maximum(best, m)
+                values.append((c.lhs.text, v))
+            hit &= any_hit
+            score = np.minimum(score, best)
+        return hit, score, values
+
+
+def compile_rules(specs):
+    """規則設定（list of dict）→ [Rule]；欄位、運算、比較寫錯時在這裡就報錯，不等到計算。"""
+    return [Rule(s) for s in specs]
+
+
+def load_rules():
+    return compile_rules(twse._load_config().get("alerts") or DEFAULT_RULES)
+
+
+def _base(fields):
+    out = set()
+    for f in fields:
+        out |= set(DERIVED[f][0]) if f in DERIVED else {f}
+    return out
+
+
+# ─── 寬表 ─────────────────────────────────────────
+def _build_market(dataset, days):
+    frames = store.ingest_many(dataset, days)
+    rows = {pd.Timestamp(ds): df for ds, df in sorted(frames.items()) if df is not None}
+    out = {}
+    for col in MARKET[dataset]:
+        wide = pd.DataFrame({ts: df[col] for ts, df in rows.items() if col in df}).T
+        wide.index = pd.DatetimeIndex(wide.index, name='date')
+        out[col] = wide.astype('float64')
+    return out
+
+
+def market(dataset, days):
+    """全市場某資料集各欄位的 交易日 × 代號 寬表（float64）；存在 store 的 derived 區，
+    存檔後留在記憶體，最後一天尚未公布時每次重算。"""
+    return store.derived(dataset, 'alerts_wide', days, lambda: _build_market(dataset, days))
+
+
+class Context:
+    """一次評估共用的寬表：所有欄位對齊到同一組交易日與代號，運算式結果依文字快取，規則之間共用。"""
+
+    def __init__(self, fields, days, stocks=()):
+        days = tuple(days)
+        raw = {}
+        for ds in sorted({SOURCES[f] for f in _base(fields)} - {'STOCK_DAY'}):
+            raw.update(market(ds, days))
+        if any(SOURCES[f] == 'STOCK_DAY' for f in _base(fields)) and stocks:
+            p = indicators.panel(stocks, days)
+            raw.update({**p['ohlcv'], **p['indicators']})
+        raw = {f: w for f, w in raw.items() if f in _base(fields)}
+        index = sorted(set().union(*(w.index for w in raw.values()))) if raw else []
+        columns = sorted(set().union(*(w.columns for w in raw.values()))) if raw else []
+        self.index = pd.DatetimeIndex(index, name='date')
+        self.columns = pd.Index(columns, name='代號')
+        self.shape = (len(self.index), len(self.columns))
+        self.frames = {f: w.reindex(index=self.index, columns=self.columns) for f, w in raw.items()}
+        self._cache = {}
+
+    def ones(self):
+        return np.ones(self.shape, bool)
+
+    def field(self, name):
+        if name not in self.frames:
+            if name in DERIVED:
+                deps, fn = DERIVED[name]
+                self.frames[name] = fn({d: self.field(d) for d in deps})
+            else:   # 價格類欄位但沒有指定股票
+                self.frames[name] = pd.DataFrame(np.nan, index=self.index, columns=self.columns)
+        return self.frames[name]
+
+    def term(self, t):
+        if t.text not in self._cache:
+            x = self.field(t.field)
+            for name, args in t.calls:
+                x = FUNCS[name](x, *args)
+            self._cache[t.text] = x.to_numpy(dtype='float64')
+        return self._cache[t.text]
+
+
+# ─── 評估 ─────────────────────────────────────────
+def evaluate(rules, days, stocks=(), on='last'):
+    """一次評估所有規則；on='last' 只列最後一個交易日，'all' 列每一天，或給 YYYYMMDD 只列那一天。
+    回傳依分數排序的 DataFrame：date、代號、規則、分數、數值。"""
+    fields = set().union(*(r.fields for r in rules)) if rules else set()
+    ctx = Context(fields, days, tuple(str(s) for s in stocks))
+    cols = ['date', '代號', '規則', '分數', '數值']
+    if not ctx.shape[0] or not ctx.shape[1]:
+        return pd.DataFrame(columns=cols)
+    if on == 'all':
+        rows = slice(None)
+    elif on == 'last':
+        rows = slice(len(ctx.index) - 1, None)
+    else:
+        pos = ctx.index.get_indexer([pd.Timestamp(on)])[0]
+        if pos < 0:
+            return pd.DataFrame(columns=cols)
+        rows = slice(pos, pos + 1)
+    offset = rows.start or 0
+    parts = []
+    for rule in rules:
+        hit, score, values = rule.evaluate(ctx)
+        r, c = np.nonzero(hit[rows])
+        if not len(r):
+            continue
+        r = r + offset
+        shown = [[f"{text}={v:,.2f}" for v in arr[r, c]] for text, arr in values]
+        parts.append(pd.DataFrame({
+            'date': ctx.index[r], '代號': ctx.columns[c], '規則': rule.name, '分數': score[r, c],
+            '數值': [", ".join(t) for t in zip(*shown)],
+        }))
+    if not parts:
+        return pd.DataFrame(columns=cols)
+    out = pd.concat(parts, ignore_index=True)
+    return out.sort_values(['分數', 'date'], ascending=False, ignore_index=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="全市場警示規則（向量化評估）")
+    ap.add_argument("--days", type=int, default=30, help="最近幾個平日（需涵蓋規則用到的最長天數）")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 --days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument("--stocks", nargs="+", help="價格類欄位計算的股票（預設 config.json 的 watchlist）")
+    ap.add_argument("--all", action="store_true", help="列出期間內每一天的警示")
+    ap.add_argument("--top", type=int, default=50)
+    args = ap.parse_args(argv)
+
+    try:
+        rules = load_rules()
+    except ValueError as e:
+        print(f"❌ 規則設定錯誤：{e}")
+        return 1
+    stocks = args.stocks or [str(s) for s in twse._load_config().get("watchlist", [])]
+    out = evaluate(rules, store.span(args.days, args.start, args.end), stocks, on='all' if args.all else 'last')
+    if out.empty:
+        print("✅ 沒有觸發任何警示")
+        return 0
+    print(f"🚨 {len(out)} 筆警示（前 {min(args.top, len(out))} 筆）：")
+    out = out.head(args.top).assign(date=lambda d: d['date'].dt.strftime('%Y-%m-%d'))
+    print(out.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,14 @@
 # app.py
 import os
-import io
-import time
-import requests
+import json
 import datetime
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")  # 使用非 GUI 后端，避免 RuntimeError
-import matplotlib.pyplot as plt
 import webbrowser
-from flask import Flask, render_template, request
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file
+import dashboard
+import metrics
+import pipeline
+import twse
+from stockrate.institutional import plot_institutional_chart, iter_records, fetch_within
 
 # ——————————————————————————————————————————————————————————————————————————
 # 1. 静态文件夹挂到根路径
@@ -18,166 +17,168 @@ app = Flask(
     static_folder="output",   # 图表都保存到 output/
     static_url_path=""        # 挂在 / 也就是 http://.../xxx.png 能直接访问
 )
+metrics.instrument(app, "app")   # 请求计时 + /metrics
 # ——————————————————————————————————————————————————————————————————————————
 
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
-plt.rcParams['axes.unicode_minus'] = False
-
 TODAY      = datetime.date.today().strftime("%Y%m%d")
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 DEFAULT_DAYS = 60
 
-def get_trading_days(n):
-    days = []
-    dt = datetime.date.today()
-    while len(days) < n:
-        if dt.weekday() < 5:
-            days.append(dt.strftime("%Y%m%d"))
-        dt -= datetime.timedelta(days=1)
-    return list(reversed(days))
-
-def fetch_institutional_data(dates, stock_no):
-    recs = []
-    api = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
-    for d in dates:
-        try:
-            j = requests.get(api.format(d), timeout=5).json()
-        except:
-            continue
-        if j.get('stat') != 'OK': 
-            continue
-        fields = j.get('fields', [])
-        data   = j.get('data', [])
-        if '證券代號' not in fields:
-            continue
-        idx  = fields.index('證券代號')
-        try:
-            f_idx = fields.index('外陸資買賣超股數(不含外資自營商)')
-            i_idx = fields.index('投信買賣超股數')
-            d_idx = fields.index('自營商買賣超股數')
-        except ValueError:
-            continue
-        for row in data:
-            if str(row[idx]).strip('=" ') == stock_no:
-                recs.append({
-                    'date':   pd.to_datetime(d, format="%Y%m%d"),
-                    '外資':   int(str(row[f_idx]).replace(',', '')) // 1000,
-                    '投信':   int(str(row[i_idx]).replace(',', '')) // 1000,
-                    '自營商': int(str(row[d_idx]).replace(',', '')) // 1000,
-                })
-                break
-        time.sleep(0.05)
-    df = pd.DataFrame(recs)
-    if df.empty:
-        return df
-    return df.set_index('date').sort_index()
-
-def fetch_price_data(dates, stock_no):
-    # 如果前端一开始就没给 days，dates 可能为空
-    if not dates:
-        return pd.DataFrame()
-
-    months = sorted({pd.to_datetime(d, format='%Y%m%d').strftime('%Y%m01') for d in dates})
-    records = []
-    for m in months:
-        url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={stock_no}"
-        try:
-            raw = requests.get(url, timeout=5).text
-            lines = raw.splitlines()
-            header = next(i for i, ln in enumerate(lines) if '日期' in ln)
-            df = pd.read_csv(io.StringIO('\n'.join(lines[header:])), encoding='big5')
-        except:
-            continue
-        df.columns = [c.strip() for c in df.columns]
-        df = df[df['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
-        ymd = df['日期'].str.split('/', expand=True).astype(int)
-        df['date'] = [datetime.date(y+1911, mm, dd) 
-                      for y, mm, dd in zip(ymd[0], ymd[1], ymd[2])]
-        df['收盤價'] = pd.to_numeric(df['收盤價'].astype(str).str.replace(',', ''), errors='coerce')
-        df['成交量'] = pd.to_numeric(df['成交股數'].astype(str).str.replace(',', ''), errors='coerce') // 1000
-        records.append(df[['date','收盤價','成交量']])
-        time.sleep(0.05)
-
-    # 如果一条都没抓到，直接返回空 DF
-    if not records:
-        return pd.DataFrame()
-
-    dfp = pd.concat(records)\
-            .drop_duplicates('date')\
-            .set_index('date')\
-            .sort_index()
-    return dfp
+
+def date_range(args, chart, stock_no):
+    """表单或网址的 days、start、end（YYYY-MM-DD 或 YYYYMMDD）→ (days, start, end, dates)。
+    给了 start 就取 start～end 的区间（例如 2024 Q3），否则取到 end 为止的最近 days 个平日；
+    end 预设且不晚于该图所有资料都已公布的最后一天。日期格式错误时丢出 ValueError。"""
+    days_str = args.get("days", "").strip()
+    days = int(days_str) if days_str.isdigit() else DEFAULT_DAYS
+    start = args.get("start", "").strip().replace("-", "") or None
+    latest = pipeline.latest_end(chart, stock_no)
+    end = min(args.get("end", "").strip().replace("-", "") or latest, latest)
+    dates = pipeline.window(days, start, end)
+    return (len(dates) if start else days), start, end, dates
 
 @app.route("/", methods=["GET","POST"])
 def index():
     chart_file = None
+    full_file = None
+    export_args = None
     msg = None
 
     if request.method == "POST":
         stock_no = request.form.get("stock_no","").strip()
-        days_str = request.form.get("days","").strip()
-        # 2. 默认值保护
-        if days_str.isdigit():
-            days = int(days_str)
-        else:
-            days = DEFAULT_DAYS
 
         if not stock_no:
             msg = "請輸入股票代號"
         else:
-            dates   = get_trading_days(days)
-            df_i    = fetch_institutional_data(dates, stock_no)
-            df_p    = fetch_price_data(dates, stock_no)
-            df      = df_i.join(df_p, how="inner")
-
-            if df.empty:
-                msg = "查無資料或網路超時"
+            # 2. 只取已公布的日期；排程器（scheduler.py）收盘后预先画好的图直接沿用
+            try:
+                days, start, end, dates = date_range(request.form, "institutional", stock_no)
+            except ValueError as e:
+                return render_template("index.html", msg=f"日期格式错误：{e}", form=request.form)
+            export_args = dict(chart="institutional", stock_no=stock_no, days=days, start=start, end=end)
+
+            def load():
+                # 超过 request_deadline 秒就先用已抓到的日期画图，其余的在后台继续抓进快取
+                df = fetch_within(dates, stock_no, deadline=twse.deadline())
+                return None if df[["外資", "收盤價"]].dropna().empty and not df.attrs["late"] else df
+
+            # 3. 先画低解析度预览马上显示，完整解析度在后台画好后由页面替换
+            filepath, state = pipeline.progressive(
+                "institutional", stock_no, dates, load,
+                lambda df, path, dpi: plot_institutional_chart(df, stock_no, days, path, dpi=dpi))
+            if filepath:
+                chart_file = os.path.basename(filepath)
+                if state == "preview":
+                    full_file = os.path.basename(pipeline.chart_path("institutional", stock_no, dates))
+                elif state == "partial":
+                    msg = "部分日期仍在抓取中或抓取失败（灰色区段），稍后重新整理即可看到完整图表"
             else:
-                # 3. 画图
-                fig_w = max(12, len(df)*0.24)
-                fig, ax1 = plt.subplots(figsize=(fig_w,5))
-                x = list(range(len(df)))
-
-                ax1.plot(x, df['外資'].values, label='外資', color='blue')
-                ax1.plot(x, df['投信'].values, label='投信', color='orange', linestyle='--')
-                ax1.plot(x, df['自營商'].values, label='自營商', color='green', linestyle=':')
-                ax1.set_ylabel("法人買賣超 (張)")
-                ax1.grid(True, linestyle="--", alpha=0.3)
-
-                ax2 = ax1.twinx()
-                ax2.plot(x, df['收盤價'].values, color='red', label='收盤價')
-                ax2.set_ylabel("收盤價", color='red')
-                ax2.tick_params(axis='y', labelcolor='red')
-
-                ax3 = ax1.twinx()
-                ax3.spines['right'].set_position(('outward',60))
-                ax3.bar(x, df['成交量'].values, color='gray', alpha=0.3, width=0.6)
-                ax3.set_ylabel("成交量 (張)", color='gray')
-                ax3.tick_params(axis='y', labelcolor='gray')
-
-                labels = [d.strftime("%m/%d") for d in df.index]
-                ax1.set_xticks(x)
-                ax1.set_xticklabels(labels, rotation=45, fontsize=8)
-                ax1.set_xlim(-0.5, len(x)-0.5)
-
-                lines1, lbls1 = ax1.get_legend_handles_labels()
-                lines2, lbls2 = ax2.get_legend_handles_labels()
-                ax1.legend(lines1+lines2, lbls1+lbls2, loc='upper left')
-
-                plt.title(f"{stock_no}｜法人買賣超、收盤價、成交量（近{days}交易日）")
-                fig.tight_layout()
-
-                filename = f"{stock_no}_chart_{TODAY}.png"
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                plt.savefig(filepath, dpi=300, bbox_inches="tight")
-                plt.close(fig)
-
-                chart_file = filename
+                msg = "查無資料或網路超時"
 
     return render_template("index.html",
                            chart_file=chart_file,
-                           msg=msg)
+                           full_file=full_file,
+                           export_args=export_args,
+                           msg=msg,
+                           form=request.form)
+
+@app.route("/dashboard")
+def dashboard_view():
+    """一次抓齐法人、持股比率、千张大户、借券与股价，画成共用 X 轴的多面板图；format=json 则回传资料。"""
+    stock_no = request.args.get("stock_no", "").strip()
+    days_str = request.args.get("days", "").strip()
+    days = int(days_str) if days_str.isdigit() else DEFAULT_DAYS
+    want_json = request.args.get("format") == "json"
+    form = dict(stock_no=stock_no, days=days, start=request.args.get("start", ""), end=request.args.get("end", ""))
+
+    if not stock_no:
+        if want_json:
+            return jsonify(error="請輸入股票代號"), 400
+        return render_template("dashboard.html", chart_file=None, msg=None, form=form)
+
+    try:
+        days, start, end, dates = date_range(request.args, "dashboard", stock_no)
+    except ValueError as e:
+        if want_json:
+            return jsonify(error=f"日期格式错误：{e}"), 400
+        return render_template("dashboard.html", chart_file=None, msg=f"日期格式错误：{e}", form=form)
+    if want_json:
+        dates, frames = pipeline.collect(stock_no, days, ["dashboard"], end=end, start=start)
+        df = dashboard.dashboard_frame(frames, stock_no, dates)
+        return jsonify(stock_no=stock_no, days=days, start=dates[0], end=dates[-1],
+                       columns=list(df.columns), records=dashboard.to_records(df))
+
+    def load():
+        _, frames = pipeline.collect(stock_no, days, ["dashboard"], end=end, start=start)
+        df = dashboard.dashboard_frame(frames, stock_no, dates)
+        df.attrs["missing"] = frames.missing_for("dashboard", stock_no, dates)   # 抓取失败的只画 partial
+        return None if df.empty else df
+
+    filepath, state = pipeline.progressive(
+        "dashboard", stock_no, dates, load,
+        lambda df, path, dpi: dashboard.plot_dashboard(df, stock_no, days, path, dpi=dpi))
+    chart_file = os.path.basename(filepath) if filepath else None
+    full_file = os.path.basename(pipeline.chart_path("dashboard", stock_no, dates)) if state == "preview" else None
+    msg = None if filepath else "查無資料或網路超時"
+    return render_template("dashboard.html", chart_file=chart_file, full_file=full_file, msg=msg,
+                           form=form, export_args=dict(stock_no=stock_no, days=days, start=start, end=end))
+
+@app.route("/export")
+def export():
+    """下载用的高解析度图（300 dpi），只在使用者要求时才画。"""
+    chart = request.args.get("chart", "institutional")
+    stock_no = request.args.get("stock_no", "").strip()
+    if chart not in pipeline.CHARTS or not stock_no:
+        abort(400)
+    try:
+        days, start, end, _ = date_range(request.args, chart, stock_no)
+    except ValueError:
+        abort(400)
+    filepath = pipeline.export(chart, stock_no, days, end=end, start=start)
+    if not filepath:
+        abort(404)
+    return send_file(os.path.abspath(filepath), as_attachment=True)
+
+@app.route("/live")
+def live():
+    """边抓边画：页面用 EventSource 接 /stream，每收到一天就补一笔。"""
+    stock_no = request.args.get("stock_no", "").strip()
+    days_str = request.args.get("days", "").strip()
+    days = int(days_str) if days_str.isdigit() else DEFAULT_DAYS
+    return render_template("live.html", stock_no=stock_no, days=days,
+                           start=request.args.get("start", ""), end=request.args.get("end", ""))
+
+@app.route("/stream")
+def stream():
+    """Server-Sent Events：先送日期列表，之后每抓完一天的法人资料、每个月的股价就送出，最后送 done。"""
+    stock_no = request.args.get("stock_no", "").strip()
+    if not stock_no:
+        abort(400)
+    try:
+        _, _, _, dates = date_range(request.args, "institutional", stock_no)
+    except ValueError:
+        abort(400)
+    dates = list(dates)
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def events():
+        yield sse("dates", dates)
+        missing = []
+        for rec in iter_records(dates, stock_no):
+            if rec[0] == "price":
+                yield sse("price", {"date": rec[1], "收盤價": rec[2], "成交量": rec[3]})
+            elif rec[0] == "institutional":
+                flows = dict(zip(["外資", "投信", "自營商"], rec[2])) if rec[2] else None
+                yield sse("institutional", {"date": rec[1], "flows": flows})
+            else:
+                missing.append({"endpoint": rec[1], "key": rec[2]})
+        yield sse("done", {"missing": missing})
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 if __name__ == "__main__":
     # 浏览器自动打开
@@ -1,10 +1,10 @@
-import requests
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import io
 import os
 from datetime import datetime, timedelta
+import twse
 
 # 中文顯示
 plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
@@ -15,9 +15,9 @@ OUTPUT_FOLDER = './output'
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
 def fetch_bwibbu_csv(date_str):
-    url = f"https://www.twse.com.tw/fund/BWIBBU_d?response=csv&date={date_str}&selectType=ALL"
+    url = f"{twse.BASE_URL}/fund/BWIBBU_d?response=csv&date={date_str}&selectType=ALL"
     headers = {'User-Agent': 'Mozilla/5.0'}
-    r = requests.get(url, headers=headers)
+    r = twse.get(url, headers=headers)
     if r.status_code == 200 and len(r.text) > 100:
         return r.text
     return None
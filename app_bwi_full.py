@@ -1,33 +1,18 @@
 # app_bwi_full.py
 from flask import Flask, render_template, request
 import os
-import io
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
-import requests
 from datetime import datetime, timedelta
+import datasets
+import metrics
+import schema
+import store
+import twse
+from stockrate.institutional import plot_thousand_chart
 
 app = Flask(__name__)
+metrics.instrument(app, "app_bwi_full")
 
-# 中文顯示
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# ---- 抓取千張大戶比例 ----
-def fetch_thousand_ratio(date):
-    url = f"https://www.twse.com.tw/fund/BWIBBU_d?response=csv&date={date}&selectType=ALL"
-    res = requests.get(url)
-    if res.ok:
-        return res.text
-    return None
-
-def parse_thousand_ratio(csv_text, stock_id):
-    df = pd.read_csv(io.StringIO(csv_text.replace('"', '')), header=1)
-    df = df[df['證券代號'] == stock_id]
-    if not df.empty:
-        return float(df.iloc[0]['千張大戶持股比率(%)'])
-    return None
 
 def get_recent_dates(days):
     today = datetime.today()
@@ -38,108 +23,57 @@ def get_recent_dates(days):
         today -= timedelta(days=1)
     return result[::-1]  # oldest to newest
 
-# ---- 抓取 T86 三大法人買賣超 ----
-def fetch_t86(date):
-    url = f"https://www.twse.com.tw/fund/T86?response=csv&date={date}&selectType=ALLBUT0999"
-    res = requests.get(url)
-    return res.text if res.ok else None
-
-def parse_t86(csv_text, stock_id):
-    df = pd.read_csv(io.StringIO(csv_text.replace('"','')), header=1)
-    df = df[df['證券代號'] == stock_id]
-    if df.empty:
-        return None
-    row = df.iloc[0]
-    return {
-        '外資': int(str(row['外陸資買賣超股數']).replace(',', '')) / 1000,  # 張
-        '投信': int(str(row['投信買賣超股數']).replace(',', '')) / 1000,
-        '自營商': int(str(row['自營商買賣超股數']).replace(',', '')) / 1000,
-    }
-
-# ---- 抓取收盤價 ----
-def fetch_price_data(stock_id, date):
-    y, m = date[:4], date[4:6]
-    url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={y}{m}01&stockNo={stock_id}"
-    res = requests.get(url)
-    return res.text if res.ok else None
-
-def parse_price_data(csv_text, target_date):
-    df = pd.read_csv(io.StringIO(csv_text.replace('"','')), header=1)
-    df.columns = [col.strip() for col in df.columns]
-    df = df.dropna()
-    df['日期'] = df['日期'].str.replace('/', '-')
-    df = df[df['日期'].str.replace('-', '') == target_date]
-    if df.empty:
-        return None
-    return float(str(df.iloc[0]['收盤價']).replace(',', ''))
+# ---- 千張大戶比例、三大法人：全市場每日只抓一次，存進 store 後本地切片 ----
+# 超過 request_deadline 秒（config.json）就先用已抓到的部分畫圖，其餘的在背景繼續抓進 store 與快取
+def load_stock_history(stock_id, dates, deadline=None):
+    ratio = store.series('BWIBBU_d', stock_id, dates, deadline)
+    t86 = store.series('T86', stock_id, dates, deadline)
+    months = sorted({d[:6] for d in dates})
+    results, late_months = twse.within({m: (datasets.fetch_stock_day, stock_id, m) for m in months}, deadline)
+    prices = []
+    for month, px in results.items():
+        if isinstance(px, (twse.TWSEUnavailable, schema.SchemaDrift)):
+            twse.report_missing('STOCK_DAY', [month])
+        elif isinstance(px, Exception):
+            raise px
+        elif px is not None:
+            prices.append(px)
+    price = pd.concat(prices) if prices else pd.DataFrame(columns=['收盤價'])
+    late = set(ratio.attrs.get('late', [])) | set(t86.attrs.get('late', []))
+    late |= {d for d in dates if d[:6] in late_months}
+    idx = pd.DatetimeIndex([pd.Timestamp(d) for d in dates])
+    col = lambda df, c: [None if pd.isna(v) else float(v) for v in df[c].reindex(idx)] if c in df else [None] * len(idx)
+    return (col(ratio, '千張大戶持股比率'), col(t86, '外資'), col(t86, '投信'),
+            col(t86, '自營商'), col(price, '收盤價'), sorted(late))
 
 # ---- 分析與繪圖 ----
 @app.route('/', methods=['GET', 'POST'])
 def index():
     chart_path = None
+    message = None
     if request.method == 'POST':
-        stock_id = request.form['stock_id']
+        stock_id = (request.form.get('stock_id') or request.form.get('stock_no', '')).strip()
         days = int(request.form['days'])
-
-        dates = get_recent_dates(days)
-        thousand_ratios, foreigns, trusts, dealers, prices = [], [], [], [], []
-        
-        for d in dates:
-            ratio = None
-            t86 = None
-            price = None
-
-            try:
-                text = fetch_thousand_ratio(d)
-                if text:
-                    ratio = parse_thousand_ratio(text, stock_id)
-            except: pass
-
-            try:
-                text = fetch_t86(d)
-                if text:
-                    t86 = parse_t86(text, stock_id)
-            except: pass
-
-            try:
-                text = fetch_price_data(stock_id, d)
-                if text:
-                    price = parse_price_data(text, d)
-            except: pass
-
-            thousand_ratios.append(ratio if ratio else None)
-            foreigns.append(t86['外資'] if t86 else None)
-            trusts.append(t86['投信'] if t86 else None)
-            dealers.append(t86['自營商'] if t86 else None)
-            prices.append(price if price else None)
+        start = request.form.get('start', '').replace('-', '') or None
+        end = request.form.get('end', '').replace('-', '') or None
+
+        # 有填起訖日就取區間，否則取最近 days 個平日
+        try:
+            dates = store.span(days, start, end) if (start or end) else get_recent_dates(days)
+        except ValueError as e:
+            return render_template('index_bwi.html', chart_path=None, message=f"日期格式錯誤：{e}")
+        thousand_ratios, foreigns, trusts, dealers, prices, late = load_stock_history(
+            stock_id, dates, twse.deadline())
+        if late:
+            message = f"{len(late)} 天的資料仍在抓取中（灰色區段），稍後重新整理即可看到完整圖表"
 
         # 繪圖
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-        ax2 = ax1.twinx()
-        x = range(len(dates))
-
-        ax1.plot(x, thousand_ratios, label='千張大戶比例(%)', marker='o')
-        ax1.plot(x, pd.Series(foreigns).cumsum(), label='外資持股變動(累積張)', linestyle='--')
-        ax1.plot(x, pd.Series(trusts).cumsum(), label='投信持股變動(累積張)', linestyle='--')
-        ax1.plot(x, pd.Series(dealers).cumsum(), label='自營商持股變動(累積張)', linestyle='--')
-        ax1.set_ylabel('持股比例 / 持股變動')
-        ax1.legend(loc='upper left')
-
-        ax2.plot(x, prices, label='收盤價', color='black')
-        ax2.set_ylabel('股價')
-        ax2.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:.0f}'))
-
-        ax1.set_xticks(x)
-        ax1.set_xticklabels([d[4:] for d in dates], rotation=45)
-        ax1.set_title(f"{stock_id}｜千張大戶與三大法人比較")
-
         os.makedirs('static', exist_ok=True)
         chart_path = f'static/{stock_id}_compare.png'
-        plt.tight_layout()
-        plt.savefig(chart_path)
-        plt.close()
+        plot_thousand_chart(stock_id, dates, thousand_ratios, foreigns, trusts, dealers, prices,
+                            chart_path, gaps=late)
 
-    return render_template('index_bwi.html', chart_path=chart_path)
+    return render_template('index_bwi.html', chart_path=chart_path, message=message)
 
 if __name__ == '__main__':
     app.run(debug=True)
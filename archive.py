@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# archive.py
+# 原始回應的壓縮存檔（目前用於 data/twt93u）：每天一個 gzip 檔（<名稱>.gz），讀取時自動解壓，
+# 舊的未壓縮檔照樣讀得到。假日、尚未公布時 TWSE 回的「查無資料」頁，內容只差標題上的日期，
+# 把日期抽掉後的內容只存一份在 _nodata/<雜湊>.gz，每天只留一個記錄雜湊與日期的小檔（<名稱>.nodata）。
+#
+#   python archive.py data/twt93u            # 把舊的 .csv 轉成壓縮檔、查無資料的檔案去重
+import os
+import re
+import sys
+import gzip
+import hashlib
+import argparse
+
+GZ = ".gz"
+NODATA = ".nodata"
+NODATA_DIR = "_nodata"
+_PLACEHOLDER = b"{date}"
+# 標題上的民國日期（cp950 與 utf-8 的「年月日」編碼不同，兩種都找）
+_DATES = [re.compile(r"\d{2,3}年\d{2}月\d{2}日".encode(enc)) for enc in ("cp950", "utf-8")]
+
+
+def _atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _template(content):
+    """把第一個民國日期換成佔位字串，回傳 (樣板, 原本的日期)。"""
+    for pat in _DATES:
+        m = pat.search(content)
+        if m:
+            return content[:m.start()] + _PLACEHOLDER + content[m.end():], m.group(0)
+    return content, b""
+
+
+def write(folder, name, content, nodata=False):
+    """存一份原始回應；nodata=True 表示內容是查無資料頁，樣板共用一份。"""
+    base = os.path.join(folder, name)
+    if nodata:
+        template, date = _template(content)
+        digest = hashlib.sha1(template).hexdigest()[:16]
+        shared = os.path.join(folder, NODATA_DIR, digest + GZ)
+        if not os.path.exists(shared):
+            _atomic(shared, gzip.compress(template, mtime=0))
+        _atomic(base + NODATA, digest.encode() + b"\n" + date)
+        _remove(base + GZ)
+    else:
+        _atomic(base + GZ, gzip.compress(content, mtime=0))
+        _remove(base + NODATA)
+    _remove(base)
+
+
+def has_data(folder, name):
+    base = os.path.join(folder, name)
+    return os.path.exists(base + GZ) or (os.path.exists(base) and os.path.getsize(base) > 0)
+
+
+def is_nodata(folder, name):
+    return os.path.exists(os.path.join(folder, name + NODATA))
+
+
+def nodata_since(folder, name):
+    """記下查無資料的時間（epoch 秒，即紀錄檔的修改時間）；沒有紀錄回傳 None。給 twse.nodata_fresh() 判斷是否要重抓。"""
+    try:
+        return os.path.getmtime(os.path.join(folder, name + NODATA))
+    except OSError:
+        return None
+
+
+def read(folder, name):
+    """原始回應的位元組（自動解壓、查無資料頁依日期還原）；沒有存過回傳 None。"""
+    base = os.path.join(folder, name)
+    if os.path.exists(base + GZ):
+        with gzip.open(base + GZ, "rb") as f:
+            return f.read()
+    if os.path.exists(base):
+        with open(base, "rb") as f:
+            return f.read()
+    if os.path.exists(base + NODATA):
+        with open(base + NODATA, "rb") as f:
+            digest, _, date = f.read().partition(b"\n")
+        with gzip.open(os.path.join(folder, NODATA_DIR, digest.decode() + GZ), "rb") as f:
+            template = f.read()
+        return template.replace(_PLACEHOLDER, date, 1) if date else template
+    return None
+
+
+def names(folder, prefix="", nodata=False):
+    """folder 裡存過的名稱（去掉 .gz／.nodata），由小到大；nodata=True 時連查無資料的也列出。"""
+    if not os.path.isdir(folder):
+        return []
+    out = set()
+    for f in os.listdir(folder):
+        if not f.startswith(prefix) or f.endswith(".tmp"):
+            continue
+        if f.endswith(GZ):
+            out.add(f[:-len(GZ)])
+        elif f.endswith(NODATA):
+            if nodata:
+                out.add(f[:-len(NODATA)])
+        elif os.path.getsize(os.path.join(folder, f)) > 0:
+            out.add(f)
+    return sorted(out)
+
+
+def migrate(folder, is_empty):
+    """把未壓縮的舊檔轉存；is_empty(內容) 為 True 的當作查無資料頁去重。回傳 (轉換前位元組, 轉換後位元組)。"""
+    before = after = 0
+    for f in sorted(os.listdir(folder)):
+        path = os.path.join(folder, f)
+        if not os.path.isfile(path) or f.endswith((GZ, NODATA, ".tmp")):
+            continue
+        with open(path, "rb") as fh:
+            content = fh.read()
+        before += len(content)
+        write(folder, f, content, nodata=not content or is_empty(content))
+    for root, _, files in os.walk(folder):
+        after += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return before, after
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="原始資料壓縮存檔與查無資料去重")
+    ap.add_argument("folder", nargs="?", default=os.path.join("data", "twt93u"))
+    args = ap.parse_args(argv)
+
+    import datasets
+    before, after = migrate(args.folder, lambda content: datasets.parse_twt93u(content) is None)
+    print(f"✅ {args.folder}：未壓縮舊檔 {before / 1e6:.1f} MB → 目錄共 {after / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# benchmark.py
+# 以錄存／合成的 TWSE 回應離線重播，分段計時 抓取解析 → 對齊 → 繪圖，
+# 結果存到 bench_results/ 以便前後比較。
+#
+#   python benchmark.py                 # 預設 2382、60 交易日、重複 3 次
+#   python benchmark.py --days 250 --repeat 5
+#   python benchmark.py --compare       # 與上一次結果比較
+#   python benchmark.py --render-scaling  # 60 → 1000 交易日的繪圖時間應大致持平
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tempfile
+import logging
+
+import matplotlib
+matplotlib.use("Agg")
+import requests
+import pandas as pd
+
+import archive
+import cache
+import twse_replay
+
+RESULT_DIR = "bench_results"
+
+# 各命令列入口與批次程式「import 完、可以開始工作」的時間上限（秒，含直譯器啟動）。
+# 重量級套件要等第一次用到才載入，啟動時不該出現在 sys.modules。
+STARTUP_BUDGETS = {
+    'daily_foreign_analysis': 0.35,
+    'fetch_foreign_vs_price6': 0.35,
+    'pipeline': 0.4,
+    'scheduler': 0.4,
+    'trace_summary': 0.3,
+}
+STARTUP_FORBIDDEN = ('flask', 'pandas', 'matplotlib')
+
+
+def bench_dates(days, end=None):
+    """以最新一份 TWT93U 檔的日期為終點，往前取 N 個平日，讓借券資料也能命中本地檔。"""
+    if end is None:
+        files = archive.names(twse_replay.TWT93U_DIR, 'TWT93U_')
+        end = files[-1][7:15] if files else datetime.date.today().strftime('%Y%m%d')
+    dt = datetime.datetime.strptime(end, '%Y%m%d').date()
+    out = []
+    while len(out) < days:
+        if dt.weekday() < 5:
+            out.append(dt.strftime('%Y%m%d'))
+        dt -= datetime.timedelta(days=1)
+    return list(reversed(out))
+
+
+class Replay:
+    """把 requests.get 換成重播函式；回應先全部備妥，計時只包含解析與處理。"""
+
+    def __init__(self, with_sleep=False):
+        self.with_sleep = with_sleep
+        self._memo = {}
+
+    def get(self, url, params=None, **kwargs):
+        key = (url, tuple(sorted((params or {}).items())))
+        if key not in self._memo:
+            self._memo[key] = twse_replay.replay_get(url, params=params)
+        return self._memo[key]
+
+    def __enter__(self):
+        self._orig_get, self._orig_sleep = requests.get, time.sleep
+        self._orig_cache, cache.ENABLED = cache.ENABLED, False   # 不讀也不寫真實快取
+        requests.get = self.get
+        if not self.with_sleep:
+            time.sleep = lambda s: None
+        return self
+
+    def __exit__(self, *exc):
+        requests.get, time.sleep = self._orig_get, self._orig_sleep
+        cache.ENABLED = self._orig_cache
+
+
+def timeit(fn, repeat):
+    runs, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return result, {
+        'runs': [round(r, 6) for r in runs],
+        'min': round(min(runs), 6),
+        'median': round(statistics.median(runs), 6),
+        'mean': round(statistics.fmean(runs), 6),
+        'max': round(max(runs), 6),
+    }
+
+
+def git_rev():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ''
+
+
+def run(stock_no, days, repeat, with_sleep=False):
+    import borrow_analysis1
+    from stockrate import institutional
+
+    dates = bench_dates(days)
+    stages = {}
+    with Replay(with_sleep) as rp:
+        # 先暖身一次，讓所有回應都進入記憶體
+        institutional.fetch_institutional_data(dates, stock_no)
+        institutional.fetch_price_data(dates, stock_no)
+
+        df_i, stages['fetch_institutional_data'] = timeit(
+            lambda: institutional.fetch_institutional_data(dates, stock_no), repeat)
+        df_p, stages['fetch_price_data'] = timeit(
+            lambda: institutional.fetch_price_data(dates, stock_no), repeat)
+        _, stages['read_borrow_data'] = timeit(
+            lambda: borrow_analysis1.read_borrow_data(dates), repeat)
+        df, stages['join'] = timeit(lambda: df_i.join(df_p, how="inner"), repeat)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"{stock_no}_bench.png")
+            _, stages['render'] = timeit(
+                lambda: institutional.plot_institutional_chart(df, stock_no, days, path), repeat)
+        requests_served = len(rp._memo)
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_rev': git_rev(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'matplotlib': matplotlib.__version__,
+        'stock_no': stock_no,
+        'days': days,
+        'repeat': repeat,
+        'with_sleep': with_sleep,
+        'dates': [dates[0], dates[-1]],
+        'rows': len(df),
+        'responses': requests_served,
+        'stages': stages,
+    }
+
+
+def measure_startup(module, repeat):
+    """另開直譯器 import 模組，回傳 (整個行程耗時中位數, 啟動時就被真正載入的重量級套件)。"""
+    code = (f"import sys, types; import {module}; "
+            f"print(','.join(n for n in {STARTUP_FORBIDDEN!r} "
+            f"if type(sys.modules.get(n)) is types.ModuleType))")
+    runs, loaded = [], ''
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        runs.append(time.perf_counter() - t0)
+        loaded = out.stdout.strip()
+    return statistics.median(runs), [n for n in loaded.split(',') if n]
+
+
+def check_startup(repeat):
+    print(f"{'entry point':<26}{'median(ms)':>12}{'budget(ms)':>12}  heavy imports")
+    ok = True
+    for module, budget in STARTUP_BUDGETS.items():
+        median, loaded = measure_startup(module, repeat)
+        passed = median <= budget and not loaded
+        ok &= passed
+        print(f"{module:<26}{median * 1000:>12.0f}{budget * 1000:>12.0f}  "
+              f"{','.join(loaded) or '-'}  {'✅' if passed else '❌'}")
+    return ok
+
+
+def synth_frame(n):
+    """n 個交易日的合成資料，欄位涵蓋法人、借券、股價各圖。"""
+    import numpy as np
+    rng = np.random.default_rng(n)
+    idx = pd.bdate_range(end='2025-04-25', periods=n, name='date')
+    price = 300 + rng.normal(0, 3, n).cumsum()
+    return pd.DataFrame({
+        '外資': rng.integers(-5000, 5000, n), '投信': rng.integers(-800, 800, n),
+        '自營商': rng.integers(-600, 600, n), '收盤價': price, '成交量': rng.integers(1000, 30000, n),
+        '外資持股比率': 40 + rng.normal(0, 0.1, n).cumsum(), '千張大戶持股比率': 70 + rng.normal(0, 0.05, n).cumsum(),
+        '借券賣出': rng.integers(0, 2000, n), '借券還券': rng.integers(0, 2000, n),
+        '借券餘額': 50000 + rng.integers(-500, 500, n).cumsum(),
+    }, index=idx)
+
+
+def check_render_scaling(horizons=(60, 250, 1000), limit=3.0):
+    """各圖在不同天數的繪圖時間；最長天數不得超過最短天數的 limit 倍。"""
+    from stockrate import institutional
+    import borrow_analysis1
+    import dashboard
+    out_dir = tempfile.mkdtemp()
+    borrow_analysis1.OUTPUT_FOLDER = out_dir
+    charts = {
+        'institutional': lambda df: institutional.plot_institutional_chart(
+            df, '2382', len(df), os.path.join(out_dir, 'i.png')),
+        'borrow': lambda df: borrow_analysis1.render_borrow_chart(
+            '2382', df.reset_index().rename(columns={'date': '日期'}), 3.8e9, len(df), fname='b.png'),
+        'dashboard': lambda df: dashboard.plot_dashboard(df, '2382', len(df), os.path.join(out_dir, 'd.png')),
+    }
+    print(f"{'chart':<16}" + ''.join(f"{f'{n}d(s)':>10}" for n in horizons) + "  ratio")
+    ok = True
+    for name, fn in charts.items():
+        secs = []
+        for n in horizons:
+            df = synth_frame(n)
+            t0 = time.perf_counter()
+            fn(df)
+            secs.append(time.perf_counter() - t0)
+        ratio = secs[-1] / secs[0]
+        ok &= ratio <= limit
+        print(f"{name:<16}" + ''.join(f"{t:>10.2f}" for t in secs) + f"  {ratio:.1f}x {'✅' if ratio <= limit else '❌'}")
+    return ok
+
+
+def save(result):
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(RESULT_DIR, f"bench_{stamp}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def previous_result(exclude=None):
+    if not os.path.isdir(RESULT_DIR):
+        return None
+    files = sorted(f for f in os.listdir(RESULT_DIR) if f.startswith('bench_') and f.endswith('.json'))
+    files = [os.path.join(RESULT_DIR, f) for f in files]
+    files = [f for f in files if f != exclude]
+    return files[-1] if files else None
+
+
+def report(result, baseline=None):
+    print(f"▶️ {result['stock_no']} 近 {result['days']} 交易日 "
+          f"({result['dates'][0]} → {result['dates'][1]})，重複 {result['repeat']} 次，"
+          f"{result['rows']} 筆對齊資料")
+    print(f"{'stage':<26}{'median(ms)':>12}{'min(ms)':>10}{'max(ms)':>10}{'Δ median':>12}")
+    for name, st in result['stages'].items():
+        delta = ''
+        if baseline and name in baseline['stages']:
+            old = baseline['stages'][name]['median']
+            if old > 0:
+                delta = f"{(st['median'] - old) / old * 100:+.1f}%"
+        print(f"{name:<26}{st['median'] * 1000:>12.2f}{st['min'] * 1000:>10.2f}"
+              f"{st['max'] * 1000:>10.2f}{delta:>12}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="TWSE 抓取／解析／對齊／繪圖 分段效能測試（離線重播）")
+    ap.add_argument('--stock', default='2382')
+    ap.add_argument('--days', type=int, default=60)
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--with-sleep', action='store_true', help="保留各抓取迴圈中的 time.sleep 節流")
+    ap.add_argument('--compare', nargs='?', const='', default=None,
+                    help="與指定結果檔（省略則為上一次）比較")
+    ap.add_argument('--no-save', action='store_true')
+    ap.add_argument('--startup', action='store_true', help="檢查各入口的啟動時間是否在預算內")
+    ap.add_argument('--render-scaling', action='store_true', help="檢查長天數的繪圖時間是否持平")
+    args = ap.parse_args(argv)
+
+    if args.startup:
+        return 0 if check_startup(max(args.repeat, 5)) else 1
+
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    if args.render_scaling:
+        return 0 if check_render_scaling() else 1
+    result = run(args.stock, args.days, args.repeat, args.with_sleep)
+    path = None if args.no_save else save(result)
+
+    baseline = None
+    if args.compare is not None:
+        base_path = args.compare or previous_result(exclude=path)
+        if base_path:
+            with open(base_path, encoding='utf-8') as f:
+                baseline = json.load(f)
+            print(f"比較基準：{base_path}")
+        else:
+            print("⚠️ 沒有可比較的先前結果")
+    report(result, baseline)
+    if path:
+        print(f"✅ 結果已儲存：{path}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
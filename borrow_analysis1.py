@@ -2,61 +2,73 @@
 
 import sys
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-import requests
 import io
 from datetime import datetime, timedelta
-import matplotlib.ticker as mticker
 import numpy as np
-
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'Arial']
-plt.rcParams['axes.unicode_minus'] = False
+import archive
+import datasets
+import metrics
+import shared
+import shares
+import twse
+from stockrate.plotting import Sampler, figwidth, pyplot
 
 DATA_FOLDER = './data/twt93u/'
 OUTPUT_FOLDER = './output/'
-BORROW_URL = 'https://www.twse.com.tw/exchangeReport/TWT93U?response=csv&date={date}'
-PRICE_URL = 'https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={date}&stockNo={stock}'
+BORROW_URL = twse.BASE_URL + '/exchangeReport/TWT93U?response=csv&date={date}'
+PRICE_URL = twse.BASE_URL + '/exchangeReport/STOCK_DAY?response=csv&date={date}&stockNo={stock}'
 
+@metrics.timed('fetch_twt93u')
 def get_available_days(n):
     os.makedirs(DATA_FOLDER, exist_ok=True)
     days = []
     today = datetime.today()
     count = 0
     max_lookback = 150
+    missing = []
 
     while count < n and max_lookback > 0:
         if today.weekday() < 5:
             d = today.strftime('%Y%m%d')
-            file_path = os.path.join(DATA_FOLDER, f'TWT93U_{d}.csv')
-            if download_csv(BORROW_URL.format(date=d), file_path):
-                if os.path.getsize(file_path) > 0:
-                    days.append(d)
-                    count += 1
+            name = f'TWT93U_{d}.csv'
+            try:
+                ok = archive.has_data(DATA_FOLDER, name) or (
+                    not twse.nodata_fresh('TWT93U', d, archive.nodata_since(DATA_FOLDER, name))
+                    and download_csv(BORROW_URL.format(date=d), name))
+            except twse.TWSEUnavailable:
+                missing.append(d)
+                ok = False
+            if ok:
+                days.append(d)
+                count += 1
         today -= timedelta(days=1)
         max_lookback -= 1
 
+    twse.report_missing('TWT93U', missing)
     return sorted(days)
 
-def download_csv(url, path):
-    try:
-        r = requests.get(url)
-        if r.status_code == 200:
-            with open(path, 'wb') as f:
-                f.write(r.content)
-            return True
-        return False
-    except:
+def download_csv(url, name):
+    """下載並存進 archive；查無資料（假日、尚未公布）只記去重紀錄並回傳 False。"""
+    r = twse.get(url)
+    if r.status_code != 200:
         return False
+    nodata = datasets.parse_twt93u(r.content) is None
+    if nodata and not datasets.twt93u_nodata(r, name[7:15]):
+        return False        # 空白或不完整的回應：不記成查無資料，下次重抓
+    archive.write(DATA_FOLDER, name, r.content, nodata=nodata)
+    return not nodata
 
+@metrics.timed('parse_twt93u')
 def read_borrow_data(dates):
-    records = []
+    records, broken = [], []
     for d in dates:
-        f = os.path.join(DATA_FOLDER, f'TWT93U_{d}.csv')
-        if not os.path.exists(f) or os.path.getsize(f) == 0:
+        name = f'TWT93U_{d}.csv'
+        if not archive.has_data(DATA_FOLDER, name):   # 沒下載過或查無資料（假日）
             continue
+        raw = archive.read(DATA_FOLDER, name)
         try:
-            df = pd.read_csv(f, encoding='cp950', header=1).iloc[1:, :15]
+            df = pd.read_csv(io.BytesIO(raw), encoding='cp950', header=1).iloc[1:, :15]
             df.columns = ['代號', '名稱', '融券前日', '融券賣出', '融券買進', '融券現券',
                           '融券今日餘額', '融券次限額', '借券前日', '借券賣出', '借券還券',
                           '借券調整', '借券餘額', '借券次限額', '備註']
@@ -72,73 +84,101 @@ def read_borrow_data(dates):
                     '借券還券': row['借券還券'],
                     '借券餘額': row['借券餘額'],
                 })
-        except:
-            continue
+        except (ValueError, KeyError):      # 檔案內容格式不符（欄位數、編碼）
+            broken.append(d)
+    twse.report_missing('TWT93U', broken, reason="存檔無法解析")
     return pd.DataFrame(records)
 
+@metrics.timed('fetch_price')
 def read_price_data(stock, dates):
     months = sorted({(int(d[:4]), int(d[4:6])) for d in dates})
-    frames = []
+    frames, missing, broken = [], [], []
     for y, m in months:
         try:
             url = PRICE_URL.format(date=f"{y}{m:02d}01", stock=stock)
-            content = requests.get(url).content.decode('big5')
+            content = twse.get(url).content.decode('big5')
             dfm = pd.read_csv(io.StringIO(content), skiprows=1, encoding='big5')
-        except:
+            dfm.columns = [c.strip() for c in dfm.columns]
+            dfm = dfm[dfm['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
+            ymd = dfm['日期'].str.split('/', expand=True).astype(int)
+            dfm['日期'] = [datetime(y + 1911, mo, d).date() for y, mo, d in zip(ymd[0], ymd[1], ymd[2])]
+            dfm['收盤價'] = pd.to_numeric(dfm['收盤價'], errors='coerce')
+            dfm['成交量'] = pd.to_numeric(dfm['成交股數'].str.replace(',', ''), errors='coerce')
+        except twse.TWSEUnavailable:
+            missing.append(f"{y}{m:02d}")
+            continue
+        except (ValueError, KeyError):      # 空白或格式不符的回應（查無資料的月份沒有表頭）
+            broken.append(f"{y}{m:02d}")
             continue
-        dfm.columns = [c.strip() for c in dfm.columns]
-        dfm = dfm[dfm['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
-        ymd = dfm['日期'].str.split('/', expand=True).astype(int)
-        dfm['日期'] = [datetime(y + 1911, mo, d).date() for y, mo, d in zip(ymd[0], ymd[1], ymd[2])]
-        dfm['收盤價'] = pd.to_numeric(dfm['收盤價'], errors='coerce')
-        dfm['成交量'] = pd.to_numeric(dfm['成交股數'].str.replace(',', ''), errors='coerce')
         frames.append(dfm[['日期', '收盤價', '成交量']])
+    twse.report_missing('STOCK_DAY', missing)
+    twse.report_missing('STOCK_DAY', broken, reason="回應無法解析")
     if not frames:
         return pd.DataFrame()
     return pd.concat(frames).drop_duplicates('日期').sort_values('日期').reset_index(drop=True)
 
-def plot_borrow_chart(stock, float_shares, days):
+def plot_borrow_chart(stock, float_shares=None, days=60):
     days_list = get_available_days(days)
     borrow_df = read_borrow_data(days_list)
     price_df = read_price_data(stock, days_list)
+    df = merge_borrow_price(stock, borrow_df, price_df)
+    return render_borrow_chart(stock, df, float_shares, days)
 
+def merge_borrow_price(stock, borrow_df, price_df):
+    """以股價日期為主合併借券資料；股數換算成千張。"""
     df = price_df.copy()
     borrow = borrow_df[borrow_df['代號'] == stock][['日期', '借券賣出', '借券還券', '借券餘額']]
     df = df.merge(borrow, how='left', on='日期')
     df[['借券賣出', '借券還券']] = df[['借券賣出', '借券還券']].fillna(0)
     df['借券餘額'] = df['借券餘額'].ffill().bfill()
     df[['借券賣出', '借券還券', '借券餘額', '成交量']] /= 1000
-
-    x = np.arange(len(df))
-    fig, ax1 = plt.subplots(figsize=(max(12, len(df) * 0.22), 6))
-    ax1.bar(x, df['借券賣出'], label='借券賣出', alpha=0.6)
-    ax1.bar(x, -df['借券還券'], label='借券還券', alpha=0.6)
-    ax1.plot(x, df['借券餘額'], label='借券餘額', marker='o')
+    return df
+
+@metrics.timed('render')
+def render_borrow_chart(stock, df, float_shares=None, days=None, fname=None, dpi=150):
+    """float_shares 未提供時查 shares.py 的發行股數參考表；查不到就不標換手率。"""
+    plt = pyplot()
+    import matplotlib.ticker as mticker
+    float_shares = float_shares or shares.lookup(stock)
+    days = days or len(df)
+    s = Sampler(len(df))
+    mark = None if s.active else 'o'
+    fig, ax1 = plt.subplots(figsize=(figwidth(len(df), per_day=0.22), 6))
+    bx, bh, bw = s.bar(df['借券賣出'])
+    ax1.bar(bx, bh, width=bw, label='借券賣出', alpha=0.6)
+    bx, bh, bw = s.bar(-df['借券還券'])
+    ax1.bar(bx, bh, width=bw, label='借券還券', alpha=0.6)
+    ax1.plot(*s.line(df['借券餘額']), label='借券餘額', marker=mark)
     ax1.set_ylabel('借券張數 (千張)')
     ax1.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.0f}'))
 
     ax2 = ax1.twinx()
-    ax2.plot(x, df['收盤價'], label='收盤價', linestyle='--', marker='s', color='red')
+    ax2.plot(*s.line(df['收盤價']), label='收盤價', linestyle='--', marker=mark and 's', color='red')
     ax2.set_ylabel('收盤價 (NT$)')
     ax2.tick_params(axis='y', labelcolor='red')
 
     ax3 = ax1.twinx()
     ax3.spines['right'].set_position(('outward', 60))
-    ax3.bar(x, df['成交量'], label='成交量', alpha=0.3, color='tab:green')
+    bx, bh, bw = s.bar(df['成交量'])
+    ax3.bar(bx, bh, width=bw, label='成交量', alpha=0.3, color='tab:green')
     ax3.set_ylabel('成交量 (千張)')
     ax3.yaxis.set_major_formatter(mticker.StrMethodFormatter('{x:,.0f}'))
 
-    labels = [f"{d.month}/{d.day}" for d in df['日期']]
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(labels, rotation=45, fontsize=max(6, int(1000 / max(12, len(df) * 0.22))))
-    ax1.set_xlim(-0.5, len(x) - 0.5)
-
-    rates = (df['成交量'] / (float_shares / 1000) * 100).round(2)
-    ax1.text(x[0], -0.12, '換手率 (%)', transform=ax1.get_xaxis_transform(), ha='left')
-    for xi, rt in zip(x, rates):
-        color = 'red' if rt > 1.5 else 'black'
-        ax1.text(xi, -0.15, f"{rt:.2f}%", transform=ax1.get_xaxis_transform(),
-                 ha='center', va='top', color=color, rotation=90, fontsize=8)
+    # 日期標籤與換手率都只標在疏化後的位置，天數再多 artist 數量也固定
+    ticks = s.ticks()
+    dates = list(df['日期'])
+    ax1.set_xticks(ticks)
+    ax1.set_xticklabels([f"{dates[i].month}/{dates[i].day}" for i in ticks], rotation=45, fontsize=8)
+    ax1.set_xlim(-0.5, len(df) - 0.5)
+
+    if float_shares:
+        rates = (df['成交量'] / (float_shares / 1000) * 100).round(2).values
+        ax1.text(0, -0.12, '換手率 (%)', transform=ax1.get_xaxis_transform(), ha='left')
+        for xi in ticks:
+            rt = rates[xi]
+            color = 'red' if rt > 1.5 else 'black'
+            ax1.text(xi, -0.15, f"{rt:.2f}%", transform=ax1.get_xaxis_transform(),
+                     ha='center', va='top', color=color, rotation=90, fontsize=8)
 
     handles, labels = [], []
     for ax in [ax1, ax2, ax3]:
@@ -151,9 +191,10 @@ def plot_borrow_chart(stock, float_shares, days):
     plt.subplots_adjust(bottom=0.25, top=0.9)
 
     os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-    fname = f"{stock}_borrow_analysis_{datetime.today().strftime('%Y%m%d')}.png"
-    plt.savefig(os.path.join(OUTPUT_FOLDER, fname), dpi=150, bbox_inches='tight')
-    plt.close()
+    fname = fname or f"{stock}_borrow_analysis_{datetime.today().strftime('%Y%m%d')}.png"
+    with metrics.stage('savefig'):
+        shared.savefig(fig, os.path.join(OUTPUT_FOLDER, fname), dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
     return fname
     __all__ = [
         'get_available_days',
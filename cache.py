@@ -0,0 +1,134 @@
+# cache.py
+# twse.get() 的回應快取：已公布且內容完整的回應存到 data/cache/<端點>/，之後同一網址直接讀檔。
+# 過去日期的資料公布後不會再變，永久有效；會再變動的（當月 STOCK_DAY）由呼叫端給到期時間。
+# 「查無資料」的回應另外記住（meta 的 nodata），到期時間由 twse.nodata_expires() 依公布時間決定：
+# 尚未公布的短暫有效，假日這類確定沒有資料的永久有效。限流頁面、壞掉的 JSON 不存，下次照樣向上游詢問。
+import os
+import json
+import time
+import hashlib
+from urllib.parse import urlparse
+
+CACHE_DIR = os.path.join("data", "cache")
+ENABLED = os.environ.get("STOCKRATE_CACHE", "1") != "0"
+
+# TWSE 明確表示「查無資料」的訊息（JSON 的 stat）；其他 stat、空白或截斷的內容一律當作暫時性錯誤，不記住
+NODATA_MESSAGES = ("沒有符合條件的資料", "查無資料")
+# 查無資料的 CSV 頁（例如 TWT93U 假日）：標題、表頭、說明列都在，只是沒有資料列
+_CSV_NOTES = ["說明".encode("cp950"), "說明".encode("utf-8")]
+
+
+class CachedResponse:
+    """從快取讀回的回應，提供呼叫端用到的 requests.Response 介面。"""
+
+    def __init__(self, url, status_code, content, encoding=None, headers=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = headers or {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content.decode("utf-8"))
+
+
+def _path(url):
+    endpoint = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+    return os.path.join(CACHE_DIR, endpoint, key + ".bin")
+
+
+def complete(r):
+    """是否為可快取的完整資料：JSON 要 stat=OK 且有資料列；CSV 除了表頭之外至少要有一列資料。"""
+    if r.status_code != 200 or not r.content:
+        return False
+    body = r.content.lstrip()
+    if body.startswith(b"{"):
+        try:
+            j = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return False
+        return j.get("stat") == "OK" and bool(j.get("data") or j.get("tables"))
+    if body[:64].lower().startswith((b"<!doctype", b"<html")):
+        return False
+    return sum(1 for ln in body.splitlines() if ln.count(b",") > 2) >= 2
+
+
+def nodata_stat(stat):
+    """JSON 的 stat 是否為 TWSE 的「查無資料」訊息。"""
+    return any(m in (stat or "") for m in NODATA_MESSAGES)
+
+
+def empty(r):
+    """TWSE 明確回覆查無資料：JSON 的 stat 是查無資料訊息，或 CSV 是完整的查無資料頁（有表頭與說明列、沒有資料列）。
+    空白、截斷、無法解析的內容不算（可能是上游出錯），不會被記住。"""
+    if r.status_code != 200 or complete(r):
+        return False
+    body = r.content.strip()
+    if not body:
+        return False
+    if body.startswith(b"{"):
+        try:
+            j = json.loads(body.decode("utf-8"))
+        except ValueError:
+            return False
+        return nodata_stat(j.get("stat"))
+    if body[:64].lower().startswith((b"<!doctype", b"<html")):
+        return False
+    return any(ln.count(b",") > 2 for ln in body.splitlines()) and any(n in body for n in _CSV_NOTES)
+
+
+def lookup(url):
+    if not ENABLED:
+        return None
+    path = _path(url)
+    try:
+        with open(path, "rb") as f:
+            meta = json.loads(f.readline())
+            content = f.read()
+    except (OSError, ValueError):
+        return None
+    if meta.get("expires") and meta["expires"] < time.time():
+        return None
+    if meta.get("nodata") and not content.strip():
+        return None     # 舊版把空白回應當成查無資料存下來了，不沿用
+    return CachedResponse(url, meta["status"], content, meta.get("encoding"),
+                          {"Content-Type": meta.get("ctype", "")})
+
+
+def store(url, r, expires=None, nodata=False):
+    """存入完整的回應（nodata=True 時改存查無資料的回應）；expires 為到期的 epoch 秒數，None 表示永久有效。"""
+    if not ENABLED or not (empty(r) if nodata else complete(r)):
+        return False
+    path = _path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    meta = {
+        "url": url,
+        "status": r.status_code,
+        "encoding": r.encoding or getattr(r, "apparent_encoding", None),
+        "ctype": r.headers.get("Content-Type", ""),
+        "stored": time.time(),
+        "expires": expires,
+        "nodata": nodata,
+    }
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.write(r.content)
+    os.replace(tmp, path)
+    return True
+
+
+def evict(url):
+    try:
+        os.remove(_path(url))
+    except OSError:
+        pass
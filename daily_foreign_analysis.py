@@ -1,54 +1,96 @@
 # daily_foreign_analysis.py
-import datetime
+#   python daily_foreign_analysis.py                                   # 2382 最近 60 個平日
+#   python daily_foreign_analysis.py 2330 120
+#   python daily_foreign_analysis.py 2382 --start 20240701 --end 20240930
 import os
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-from app import get_trading_days, fetch_institutional_data, fetch_price_data
+import sys
+import time
+import argparse
+import metrics
+import pipeline
+import tracelog
+from stockrate.institutional import fetch_institutional_data, fetch_price_data
+from stockrate.plotting import Sampler, figwidth, pyplot
 
-def run_foreign_analysis(stock_no="2382", days=60):
-    today = datetime.date.today().strftime("%Y%m%d")
+METRICS_FILE = os.path.join("output", "daily_foreign_analysis.prom")
+
+def run_foreign_analysis(stock_no="2382", days=60, start=None, end=None):
+    """start／end（YYYYMMDD）與網頁相同，經 pipeline.window() 取日期；給了 start 就不看 days。"""
+    dates = list(pipeline.window(days, start, end))
+    with tracelog.run("daily_foreign_analysis", stock_no=stock_no, days=len(dates), start=dates[0], end=dates[-1]):
+        return _run_foreign_analysis(stock_no, dates)
+
+@metrics.timed('batch_foreign_analysis')
+def _run_foreign_analysis(stock_no, dates):
     output_dir = "output"
     os.makedirs(output_dir, exist_ok=True)
 
-    dates = get_trading_days(days)
     df_i = fetch_institutional_data(dates, stock_no)
     df_p = fetch_price_data(dates, stock_no)
-    df = df_i.join(df_p, how="inner")
+    with metrics.stage('join'):
+        df = df_i.join(df_p, how="inner")
+
+    got = set(df.index.strftime("%Y%m%d")) if not df.empty else set()
+    missing = [d for d in dates if d not in got]
+    if missing:
+        tracelog.event("missing_dates", stock_no=stock_no, dates=missing)
 
     if df.empty:
         print("❌ 查無資料或網路錯誤")
         return
 
-    fig_w = max(12, len(df)*0.24)
-    fig, ax1 = plt.subplots(figsize=(fig_w, 5))
-    x = list(range(len(df)))
+    render_t0 = time.perf_counter()
+    plt = pyplot()
+    fig, ax1 = plt.subplots(figsize=(figwidth(len(df)), 5))
+    s = Sampler(len(df))
 
-    ax1.plot(x, df['外資'].values, label='外資', color='blue')
-    ax1.plot(x, df['投信'].values, label='投信', color='orange', linestyle='--')
-    ax1.plot(x, df['自營商'].values, label='自營商', color='green', linestyle=':')
+    ax1.plot(*s.line(df['外資'].values), label='外資', color='blue')
+    ax1.plot(*s.line(df['投信'].values), label='投信', color='orange', linestyle='--')
+    ax1.plot(*s.line(df['自營商'].values), label='自營商', color='green', linestyle=':')
 
     ax2 = ax1.twinx()
-    ax2.plot(x, df['收盤價'].values, color='red', label='收盤價')
+    ax2.plot(*s.line(df['收盤價'].values), color='red', label='收盤價')
 
     ax3 = ax1.twinx()
     ax3.spines['right'].set_position(('outward', 60))
-    ax3.bar(x, df['成交量'].values, color='gray', alpha=0.3, width=0.6)
+    bx, bh, bw = s.bar(df['成交量'].values)
+    ax3.bar(bx, bh, color='gray', alpha=0.3, width=bw)
 
-    labels = [d.strftime("%m/%d") for d in df.index]
-    ax1.set_xticks(x)
-    ax1.set_xticklabels(labels, rotation=45, fontsize=8)
+    ticks = s.ticks()
+    ax1.set_xticks(ticks)
+    ax1.set_xticklabels([df.index[i].strftime("%m/%d") for i in ticks], rotation=45, fontsize=8)
 
     lines1, lbls1 = ax1.get_legend_handles_labels()
     lines2, lbls2 = ax2.get_legend_handles_labels()
     ax1.legend(lines1+lines2, lbls1+lbls2, loc='upper left')
 
-    plt.title(f"{stock_no}｜法人買賣超、收盤價、成交量（近{days}交易日）")
+    plt.title(f"{stock_no}｜法人買賣超、收盤價、成交量（{dates[0]}～{dates[-1]}）")
     fig.tight_layout()
 
-    filename = f"{stock_no}_chart_{today}.png"
+    filename = f"{stock_no}_chart_{dates[-1]}.png"
     filepath = os.path.join(output_dir, filename)
-    plt.savefig(filepath, dpi=300, bbox_inches="tight")
+    with metrics.stage('savefig'):
+        plt.savefig(filepath, dpi=300, bbox_inches="tight")
     plt.close(fig)
+    metrics.observe_stage('render', time.perf_counter() - render_t0)
     print(f"✅ 產圖完成：{filepath}")
     return filepath
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="單一股票三大法人買賣超、收盤價、成交量圖")
+    ap.add_argument("stock", nargs="?", default="2382")
+    ap.add_argument("days", nargs="?", type=int, default=60, help="最近幾個平日")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    args = ap.parse_args(argv)
+    try:
+        pipeline.window(args.days, args.start, args.end)
+    except ValueError as e:
+        ap.error(f"日期格式錯誤：{e}")
+    try:
+        return 0 if run_foreign_analysis(args.stock, args.days, args.start, args.end) else 1
+    finally:
+        metrics.write_textfile(METRICS_FILE)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# dashboard.py
+# 單一股票的整合面板：法人買賣超、持股比率、千張大戶、借券餘額與股價成交量，
+# 共用 X 軸畫在同一張圖，或整理成一份 JSON。資料由 pipeline 一次抓齊。
+import math
+
+import metrics
+import shared
+from pipeline import Need
+from stockrate.plotting import Sampler, figwidth, pyplot
+
+COLUMNS = ['收盤價', '成交量', '外資', '投信', '自營商',
+           '外資持股比率', '投信持股比率', '自營商持股比率',
+           '千張大戶持股比率', '借券賣出', '借券還券', '借券餘額']
+
+
+def needs(stock, dates):
+    return [Need('STOCK_DAY', dates, stock), Need('T86', dates), Need('TWT38U', dates),
+            Need('BWIBBU_d', dates), Need('TWT93U', dates)]
+
+
+def dashboard_frame(frames, stock, dates):
+    """以股價有交易的日期為主，左合併其他資料集；借券股數換算成張。"""
+    df = frames.prices(stock, dates)
+    for ds in ('T86', 'TWT38U', 'BWIBBU_d', 'TWT93U'):
+        part = frames.daily(ds, stock, dates)
+        if not part.empty:
+            df = df.join(part, how='left')
+    for c in ('借券賣出', '借券還券', '借券餘額'):
+        if c in df:
+            df[c] = df[c] // 1000
+    return df.reindex(columns=[c for c in COLUMNS if c in df.columns])
+
+
+def to_records(df):
+    out = []
+    for ts, row in df.iterrows():
+        rec = {'date': ts.strftime('%Y-%m-%d')}
+        for c, v in row.items():
+            rec[c] = None if v is None or math.isnan(v) else float(v)
+        out.append(rec)
+    return out
+
+
+@metrics.timed('render')
+def plot_dashboard(df, stock, days, path, dpi=150):
+    plt = pyplot()
+    import matplotlib.ticker as mticker
+    panels = [p for p in (
+        ('price', ['收盤價']),
+        ('flows', ['外資', '投信', '自營商']),
+        ('holdings', ['外資持股比率', '投信持股比率', '自營商持股比率']),
+        ('thousand', ['千張大戶持股比率']),
+        ('borrow', ['借券餘額', '借券賣出', '借券還券']),
+    ) if any(c in df for c in p[1])]
+    s = Sampler(len(df))
+    mark = None if s.active else '.'
+    fig, axes = plt.subplots(len(panels), 1, sharex=True, squeeze=False,
+                             figsize=(figwidth(len(df), per_day=0.2), 2.6 * len(panels)))
+    axes = axes[:, 0]
+
+    for ax, (name, cols) in zip(axes, panels):
+        if name == 'price':
+            ax.plot(*s.line(df['收盤價']), color='red', label='收盤價')
+            ax.set_ylabel('收盤價')
+            if '成交量' in df:
+                axv = ax.twinx()
+                bx, bh, bw = s.bar(df['成交量'])
+                axv.bar(bx, bh, color='gray', alpha=0.3, width=bw, label='成交量')
+                axv.set_ylabel('成交量 (張)', color='gray')
+        elif name == 'flows':
+            for i, (c, color) in enumerate(zip(cols, ('blue', 'orange', 'green'))):
+                if c in df:
+                    bx, bh, bw = s.bar(df[c], width=0.81)
+                    ax.bar(bx + (i - 1) * bw / 3, bh, width=bw / 3, color=color, label=c)
+            ax.axhline(0, color='black', linewidth=0.5)
+            ax.set_ylabel('買賣超 (張)')
+        elif name == 'borrow':
+            if '借券賣出' in df:
+                bx, bh, bw = s.bar(df['借券賣出'])
+                ax.bar(bx, bh, width=bw, alpha=0.6, label='借券賣出')
+            if '借券還券' in df:
+                bx, bh, bw = s.bar(-df['借券還券'])
+                ax.bar(bx, bh, width=bw, alpha=0.6, label='借券還券')
+            if '借券餘額' in df:
+                axb = ax.twinx()
+                axb.plot(*s.line(df['借券餘額']), color='purple', marker=mark, label='借券餘額')
+                axb.set_ylabel('借券餘額 (張)', color='purple')
+            ax.set_ylabel('借券 (張)')
+        else:
+            for c in cols:
+                if c in df:
+                    ax.plot(*s.line(df[c]), marker=mark, label=c)
+            ax.set_ylabel('比率 (%)')
+        fmt = '{x:,.2f}' if name in ('holdings', 'thousand') else '{x:,.0f}'
+        ax.yaxis.set_major_formatter(mticker.StrMethodFormatter(fmt))
+        ax.grid(True, linestyle='--', alpha=0.3)
+        ax.legend(loc='upper left', fontsize=8)
+
+    ticks = s.ticks(30)
+    axes[-1].set_xticks(ticks)
+    axes[-1].set_xticklabels([df.index[i].strftime('%m/%d') for i in ticks], rotation=45, fontsize=8)
+    axes[-1].set_xlim(-0.5, len(df) - 0.5)
+    axes[0].set_title(f"{stock}｜整合面板（近{days}交易日）")
+    fig.tight_layout()
+    with metrics.stage('savefig'):
+        shared.savefig(fig, path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return path
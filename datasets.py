@@ -0,0 +1,270 @@
+# datasets.py
+# 全市場資料集：每個抓取單位（某一天的 T86／TWT38U／BWIBBU_d／TWT93U、某股某月的 STOCK_DAY）
+# 只下載一次並解析成 DataFrame，由 pipeline.py 合併各圖表的需求後共用。
+# 每日資料以證券代號為索引；STOCK_DAY 以日期為索引。查無資料（假日、尚未公布）回傳 None。
+import io
+import os
+import datetime
+
+import archive
+import cache
+import metrics
+import schema
+import twse
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+DAILY = ('T86', 'TWT38U', 'BWIBBU_d', 'TWT93U')
+TWT93U_FOLDER = os.path.join('data', 'twt93u')
+# 各欄位在記憶體中的型別：張數 int32、價格與比率 float32、股數（可能超過 int32）int64。
+# 整數欄位的缺值沒有意義（解析失敗），整列捨棄；成交量、成交金額缺值視為 0。
+DTYPES = {
+    '外資': 'int32', '投信': 'int32', '自營商': 'int32',
+    '外資持股比率': 'float32', '投信持股比率': 'float32', '自營商持股比率': 'float32',
+    '千張大戶持股比率': 'float32', '發行股數': 'int64',
+    '借券賣出': 'int64', '借券還券': 'int64', '借券餘額': 'int64',
+    '開盤價': 'float32', '最高價': 'float32', '最低價': 'float32', '收盤價': 'float32',
+    '成交量': 'int32', '成交金額': 'int64',
+}
+# STOCK_DAY 保留的欄位：開高低收（元）、成交量（張）、成交金額（元）
+OHLCV = ('開盤價', '最高價', '最低價', '收盤價', '成交量', '成交金額')
+TWT93U_COLUMNS = ['代號', '名稱', '融券前日', '融券賣出', '融券買進', '融券現券',
+                  '融券今日餘額', '融券次限額', '借券前日', '借券賣出', '借券還券',
+                  '借券調整', '借券餘額', '借券次限額', '備註']
+
+
+def _num(s):
+    return pd.to_numeric(s.astype(str).str.replace(',', '', regex=False).str.strip(), errors='coerce')
+
+
+def _code(s):
+    return s.astype(str).str.strip('=" ')
+
+
+def typed(df):
+    """依 DTYPES 轉成精簡型別；date 欄轉成 datetime64。"""
+    for c in ('成交量', '成交金額'):
+        if c in df:
+            df[c] = df[c].fillna(0)
+    ints = [c for c in df.columns if DTYPES.get(c, '').startswith('int')]
+    if ints:
+        df = df.dropna(subset=ints)
+    if 'date' in df:
+        df['date'] = pd.to_datetime(df['date'])
+    return df.astype({c: DTYPES[c] for c in df.columns if c in DTYPES})
+
+
+def select(frames, stock):
+    """{YYYYMMDD: 全市場 frame} → 單一股票、以 date 為索引的 frame，保留 DTYPES 的型別。"""
+    rows, index = [], []
+    for ds in sorted(frames):
+        df = frames[ds]
+        if df is not None and stock in df.index:
+            rows.append(df.loc[[stock]])
+            index.append(pd.Timestamp(ds))
+    if not rows:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='date'))
+    out = pd.concat(rows)
+    out.index = pd.DatetimeIndex(index, name='date')
+    return out
+
+
+def stack(frames):
+    """{YYYYMMDD: 全市場 frame} → 長表：date（datetime64）、代號（category）加上各欄位，一檔一天一列。"""
+    parts = [(pd.Timestamp(ds), frames[ds]) for ds in sorted(frames) if frames[ds] is not None]
+    if not parts:
+        return pd.DataFrame(columns=['date', '代號'])
+    out = pd.concat([df for _, df in parts]).reset_index()
+    out.insert(0, 'date', pd.DatetimeIndex([ts for ts, _ in parts]).repeat([len(df) for _, df in parts]))
+    out['代號'] = out['代號'].astype('category')
+    return out
+
+
+def _json_frame(endpoint, j):
+    """依 schema 登錄表取出需要的欄位（輸出名稱），以代號為索引；欄位變動時丟出 schema.SchemaDrift。
+    TWSE 明確回覆查無資料時回傳 None；其他 stat 丟出 ValueError（當作抓取失敗，不記成查無資料）。"""
+    if j.get('stat') != 'OK':
+        if cache.nodata_stat(j.get('stat')):
+            return None
+        raise ValueError(f"{endpoint} stat：{j.get('stat')}")
+    if not j.get('fields'):
+        raise ValueError(f"{endpoint} 回應沒有 fields")
+    cols = schema.extractor(endpoint, j['fields']).columns(j.get('data', []))
+    df = pd.DataFrame(cols)
+    df.index = _code(df.pop('代號'))
+    df.index.name = '代號'
+    return df
+
+
+def _csv_frame(text):
+    """TWSE 的 CSV 前面有標題列、後面有說明列；從含「證券代號」的表頭開始讀。"""
+    lines = text.splitlines()
+    header = next((i for i, ln in enumerate(lines) if '證券代號' in ln), None)
+    if header is None:
+        return None
+    body = [ln for ln in lines[header:] if ln.count(',') > 2]
+    df = pd.read_csv(io.StringIO('\n'.join(body)), dtype=str)
+    df.columns = [c.strip() for c in df.columns]
+    df.index = _code(df['證券代號'])
+    df.index.name = '代號'
+    return df
+
+
+# ─── T86 三大法人買賣超 ───────────────────────────
+@metrics.timed('parse_t86')
+def parse_t86(j):
+    df = _json_frame('T86', j)
+    if df is None:
+        return None
+    out = pd.DataFrame(index=df.index)
+    for c in ('外資', '投信', '自營商'):
+        out[c] = _num(df[c]) // 1000
+    return typed(out)
+
+
+def t86_url(ds):
+    return f"{twse.BASE_URL}/fund/T86?response=json&date={ds}&selectType=ALL"
+
+
+def fetch_t86(ds):
+    return parse_t86(twse.get(t86_url(ds)).json())
+
+
+def closed(ds):
+    """ds 是否休市：以 T86 的回覆為準（JSON 有明確的查無資料訊息）。
+    CSV 端點（BWIBBU_d、TWT93U）查無資料時可能只回空白內容，分不出是假日還是上游出錯，靠這裡判斷。"""
+    return cache.empty(twse.get(t86_url(ds)))
+
+
+# ─── TWT38U 外資及陸資持股 ─────────────────────────
+@metrics.timed('parse_twt38u')
+def parse_twt38u(j):
+    df = _json_frame('TWT38U', j)
+    if df is None:
+        return None
+    out = pd.DataFrame(index=df.index)
+    for c in ('外資持股比率', '投信持股比率', '自營商持股比率'):
+        out[c] = _num(df[c])
+    if '發行股數' in df:
+        out['發行股數'] = _num(df['發行股數']).fillna(0)
+    return typed(out)
+
+
+def fetch_twt38u(ds):
+    return parse_twt38u(twse.get(f"{twse.BASE_URL}/fund/TWT38U?response=json&date={ds}&selectType=ALLBUT0999").json())
+
+
+# ─── BWIBBU_d 千張大戶持股比率 ─────────────────────
+@metrics.timed('parse_bwibbu')
+def parse_bwibbu(text):
+    df = _csv_frame(text) if text else None
+    if df is None:
+        return None
+    col = schema.extractor('BWIBBU_d', list(df.columns)).source('千張大戶持股比率')
+    return typed(pd.DataFrame({'千張大戶持股比率': _num(df[col])}, index=df.index))
+
+
+def fetch_bwibbu(ds):
+    text = twse.get(f"{twse.BASE_URL}/fund/BWIBBU_d?response=csv&date={ds}&selectType=ALL").text
+    if not text.strip():
+        if closed(ds):
+            return None
+        raise ValueError(f"BWIBBU_d {ds} 回應是空白的")
+    df = parse_bwibbu(text)
+    if df is None:
+        raise ValueError(f"BWIBBU_d {ds} 回應沒有表頭")
+    return df
+
+
+# ─── TWT93U 借券賣出 ───────────────────────────────
+@metrics.timed('parse_twt93u')
+def parse_twt93u(content):
+    """content 為 cp950 編碼的原始 CSV 位元組；單位為股。"""
+    if not content:
+        return None
+    df = pd.read_csv(io.BytesIO(content), encoding='cp950', header=1, dtype=str).iloc[1:, :15]
+    if df.empty:
+        return None
+    df.columns = TWT93U_COLUMNS
+    code = df['代號'].astype(str).str.extract(r'(\d\w*)')[0]
+    df = df[code.notna()]
+    out = pd.DataFrame({c: _num(df[c]) for c in ['借券賣出', '借券還券', '借券餘額']})
+    out.index = code[code.notna()].values
+    out.index.name = '代號'
+    out = typed(out.dropna(how='all'))
+    return out if not out.empty else None
+
+
+def fetch_twt93u(ds):
+    """先看 data/twt93u 是否已有當天的資料（archive 壓縮檔），沒有才下載。
+    查無資料頁只記一筆共用的去重紀錄；假日永久不再下載，尚未公布的依 twse.nodata_expires() 過一陣子再問。"""
+    name = f'TWT93U_{ds}.csv'
+    if archive.has_data(TWT93U_FOLDER, name):
+        return parse_twt93u(archive.read(TWT93U_FOLDER, name))
+    if twse.nodata_fresh('TWT93U', ds, archive.nodata_since(TWT93U_FOLDER, name)):
+        return None
+    r = twse.get(f"{twse.BASE_URL}/exchangeReport/TWT93U?response=csv&date={ds}", use_cache=False)
+    if r.status_code != 200:
+        return None
+    df = parse_twt93u(r.content)
+    if df is None and not twt93u_nodata(r, ds):
+        raise ValueError(f"TWT93U {ds} 回應是空白或不完整的")
+    archive.write(TWT93U_FOLDER, name, r.content, nodata=df is None)
+    return df
+
+
+def twt93u_nodata(r, ds):
+    """沒有資料列的 TWT93U 回應是否確定是查無資料：完整的查無資料頁，或空白內容但當天休市。"""
+    return cache.empty(r) or (not r.content.strip() and closed(ds))
+
+
+# ─── STOCK_DAY 個股日成交 ──────────────────────────
+@metrics.timed('parse_stock_day')
+def parse_stock_day(raw):
+    lines = raw.splitlines()
+    header = next((i for i, ln in enumerate(lines) if '日期' in ln), None)
+    if header is None:
+        return None
+    df = pd.read_csv(io.StringIO('\n'.join(lines[header:])), dtype=str)
+    df.columns = [c.strip() for c in df.columns]
+    df = df[df['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
+    if df.empty:
+        return None
+    ymd = df['日期'].str.split('/', expand=True).astype(int)
+    out = pd.DataFrame(index=pd.DatetimeIndex(
+        [datetime.date(y + 1911, m, d) for y, m, d in zip(ymd[0], ymd[1], ymd[2])], name='date'))
+    for c, v in ohlcv(df).items():
+        out[c] = v.values
+    return typed(out[~out.index.duplicated()])
+
+
+def ohlcv(df):
+    """STOCK_DAY 原始欄位 → OHLCV 各欄（停牌日的價格為 '--'，轉成 NaN）。"""
+    src = schema.extractor('STOCK_DAY', list(df.columns)).source
+    return {
+        '開盤價': _num(df[src('開盤價')]),
+        '最高價': _num(df[src('最高價')]),
+        '最低價': _num(df[src('最低價')]),
+        '收盤價': _num(df[src('收盤價')]),
+        '成交量': _num(df[src('成交股數')]) // 1000,
+        '成交金額': _num(df[src('成交金額')]),
+    }
+
+
+def stock_day_url(stock, month):
+    return f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={month}01&stockNo={stock}"
+
+
+def fetch_stock_day(stock, month):
+    """month 為 YYYYMM。"""
+    return parse_stock_day(twse.get(stock_day_url(stock, month)).text)
+
+
+FETCHERS = {
+    'T86': fetch_t86,
+    'TWT38U': fetch_twt38u,
+    'BWIBBU_d': fetch_bwibbu,
+    'TWT93U': fetch_twt93u,
+    'STOCK_DAY': fetch_stock_day,
+}
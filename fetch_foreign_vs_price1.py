@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import os, io, time, requests, pandas as pd
-import datetime
+import os, pandas as pd
 import matplotlib.pyplot as plt
+import schema
+import twse
 
 # ─── 參數設定 ─────────────────────────────────────
 STOCK_NO = "2382"
@@ -27,31 +28,24 @@ def get_trading_dates_from_csv(path, n):
 def fetch_foreign_count(dates):
     """針對每個日期呼叫 T86 JSON 介面，動態擷取外資買賣超『張數』。"""
     recs = []
-    API = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
+    API = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
     for d in dates:
         try:
-            j = requests.get(API.format(d), timeout=5).json()
+            j = twse.get(API.format(d), timeout=5).json()
         except Exception:
             continue
         if j.get('stat') != 'OK':
             continue
         fields = j.get('fields', [])
         data = j.get('data', [])
-        if '證券代號' not in fields:
+        if not fields:
             continue
-        idx_code = fields.index('證券代號')
-        idx_foreign = next((i for i, col in enumerate(fields) if '外陸' in col and '買賣超' in col), None)
-        if idx_foreign is None:
-            print(f"⚠️ {d} 無法找到外資買賣超欄位，fields: {fields}")
-            continue
-        for row in data:
-            code = str(row[idx_code]).strip('=" ')
-            if code == STOCK_NO:
-                val = int(str(row[idx_foreign]).replace(',', '').strip()) // 1000  # 轉換為張數
-                recs.append({'date': pd.to_datetime(d, format='%Y%m%d'),
-                             '外資買賣超張數': val})
-                break
-        time.sleep(0.1)
+        ex = schema.extractor('T86', fields)
+        row = ex.find(data, STOCK_NO)
+        if row is not None:
+            val = int(str(ex.get(row, '外資')).replace(',', '').strip()) // 1000  # 轉換為張數
+            recs.append({'date': pd.to_datetime(d, format='%Y%m%d'),
+                         '外資買賣超張數': val})
     df = pd.DataFrame(recs)
     if df.empty:
         return df
@@ -60,31 +54,24 @@ def fetch_foreign_count(dates):
 def fetch_invest_count(dates):
     """針對每個日期呼叫 T86 JSON 介面，擷取投信買賣超『張數』。"""
     recs = []
-    API = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
+    API = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
     for d in dates:
         try:
-            j = requests.get(API.format(d), timeout=5).json()
+            j = twse.get(API.format(d), timeout=5).json()
         except Exception:
             continue
         if j.get('stat') != 'OK':
             continue
         fields = j.get('fields', [])
         data = j.get('data', [])
-        if '證券代號' not in fields:
-            continue
-        idx_code = fields.index('證券代號')
-        idx_invest = next((i for i, col in enumerate(fields) if '投信' in col and '買賣超' in col), None)
-        if idx_invest is None:
-            print(f"⚠️ {d} 無法找到投信買賣超欄位，fields: {fields}")
+        if not fields:
             continue
-        for row in data:
-            code = str(row[idx_code]).strip('=" ')
-            if code == STOCK_NO:
-                val = int(str(row[idx_invest]).replace(',', '').strip()) // 1000
-                recs.append({'date': pd.to_datetime(d, format='%Y%m%d'),
-                             '投信買賣超張數': val})
-                break
-        time.sleep(0.1)
+        ex = schema.extractor('T86', fields)
+        row = ex.find(data, STOCK_NO)
+        if row is not None:
+            val = int(str(ex.get(row, '投信')).replace(',', '').strip()) // 1000
+            recs.append({'date': pd.to_datetime(d, format='%Y%m%d'),
+                         '投信買賣超張數': val})
     df = pd.DataFrame(recs)
     if df.empty:
         return df
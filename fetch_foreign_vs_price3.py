@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
-import os, io, time, requests, pandas as pd
+import os, io, pandas as pd
 import datetime
 import matplotlib.pyplot as plt
+import schema
+import twse
 
 # ─── 參數設定 ───────────────────────────────────
 STOCK_NO = "2382"
@@ -25,36 +27,27 @@ def get_trading_dates_from_csv(path, n):
 
 # 抓取三大法人買賣超 (張)
 def fetch_institutional_counts(dates):
-    recs = []
-    API = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
+    recs, missing = [], []
+    API = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
     for d in dates:
         try:
-            j = requests.get(API.format(d), timeout=5).json()
-        except:
+            j = twse.get(API.format(d), timeout=5).json()
+        except (twse.TWSEUnavailable, ValueError):     # 連線失敗或回應不是 JSON
+            missing.append(d)
             continue
         if j.get('stat') != 'OK':
             continue
         fields, data = j.get('fields', []), j.get('data', [])
-        if '證券代號' not in fields:
+        if not fields:
             continue
-        idx = fields.index('證券代號')
-        try:
-            f_idx = fields.index('外陸資買賣超股數(不含外資自營商)')
-            i_idx = fields.index('投信買賣超股數')
-            d_idx = fields.index('自營商買賣超股數')
-        except ValueError:
-            print(f"⚠️ {d} 欄位傳回錯誤：{fields}")
-            continue
-        for row in data:
-            if str(row[idx]).strip('=" ') == STOCK_NO:
-                recs.append({
-                    'date': pd.to_datetime(d, format='%Y%m%d'),
-                    '外資': int(str(row[f_idx]).replace(',', '')) // 1000,
-                    '投信': int(str(row[i_idx]).replace(',', '')) // 1000,
-                    '自營商': int(str(row[d_idx]).replace(',', '')) // 1000
-                })
-                break
-        time.sleep(0.1)
+        ex = schema.extractor('T86', fields)
+        row = ex.find(data, STOCK_NO)
+        if row is not None:
+            recs.append({
+                'date': pd.to_datetime(d, format='%Y%m%d'),
+                **{c: int(str(ex.get(row, c)).replace(',', '')) // 1000 for c in ('外資', '投信', '自營商')}
+            })
+    twse.report_missing('T86', missing)
     df = pd.DataFrame(recs)
     return df.set_index('date').sort_index() if not df.empty else df
 
@@ -66,9 +59,9 @@ def fetch_price_data(dates):
     print(f"🔍 所需月份：{months}")
     records = []
     for m in months:
-        url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
+        url = f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
         try:
-            raw = requests.get(url, timeout=5).text
+            raw = twse.get(url, timeout=5).text
             lines = raw.splitlines()
             header_idx = next(i for i, ln in enumerate(lines) if '日期' in ln)
             csv_text = '\n'.join(lines[header_idx:])
@@ -83,7 +76,6 @@ def fetch_price_data(dates):
             records.append(df[['date','收盤價','成交量']])
         except Exception as e:
             print(f"⚠️ {m} 發生錯誤：{e}")
-        time.sleep(0.1)
     if records:
         df_all = pd.concat(records).drop_duplicates('date').set_index('date').sort_index()
         print("📆 收盤價資料日期：", df_all.index.tolist())
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
-import os, io, time, requests, pandas as pd
+import os, io, pandas as pd
 import datetime
 import matplotlib.pyplot as plt
 import sys
+import schema
+import twse
 
 # ─── 判斷是否從命令列讀取 ─────────────────────
 if len(sys.argv) >= 2:
@@ -19,7 +21,7 @@ if len(sys.argv) >= 3:
 else:
     try:
         DAYS = int(input("請輸入分析天數（如60）：").strip())
-    except:
+    except ValueError:
         DAYS = 60
 
 OUT_DIR  = "output"
@@ -44,11 +46,11 @@ def get_trading_days(n):
 # 抓取三大法人買賣超 (張)
 def fetch_institutional_counts(dates):
     recs = []
-    API = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
+    API = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
     for d in dates:
         try:
             print(f"Fetching data for date: {d}")
-            j = requests.get(API.format(d), timeout=5).json()
+            j = twse.get(API.format(d), timeout=5).json()
         except Exception as e:
             print(f"Error fetching data for {d}: {e}")
             continue
@@ -56,25 +58,15 @@ def fetch_institutional_counts(dates):
             print(f"No data available for {d}")
             continue
         fields, data = j.get('fields', []), j.get('data', [])
-        if '證券代號' not in fields:
-            continue
-        idx = fields.index('證券代號')
-        try:
-            f_idx = fields.index('外陸資買賣超股數(不含外資自營商)')
-            i_idx = fields.index('投信買賣超股數')
-            d_idx = fields.index('自營商買賣超股數')
-        except ValueError:
+        if not fields:
             continue
-        for row in data:
-            if str(row[idx]).strip('=" ') == STOCK_NO:
-                recs.append({
-                    'date': pd.to_datetime(d, format='%Y%m%d'),
-                    '外資': int(str(row[f_idx]).replace(',', '')) // 1000,
-                    '投信': int(str(row[i_idx]).replace(',', '')) // 1000,
-                    '自營商': int(str(row[d_idx]).replace(',', '')) // 1000
-                })
-                break
-        time.sleep(0.1)
+        ex = schema.extractor('T86', fields)
+        row = ex.find(data, STOCK_NO)
+        if row is not None:
+            recs.append({
+                'date': pd.to_datetime(d, format='%Y%m%d'),
+                **{c: int(str(ex.get(row, c)).replace(',', '')) // 1000 for c in ('外資', '投信', '自營商')}
+            })
     df = pd.DataFrame(recs)
     return df.set_index('date').sort_index() if not df.empty else df
 
@@ -84,10 +76,10 @@ def fetch_price_data(dates):
     months = sorted({d.strftime('%Y%m01') for d in dt_idx})
     records = []
     for m in months:
-        url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
+        url = f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
         try:
             print(f"Fetching price data for month: {m}")
-            raw = requests.get(url, timeout=5).text
+            raw = twse.get(url, timeout=5).text
             lines = raw.splitlines()
             header = next(i for i, ln in enumerate(lines) if '日期' in ln)
             dfm = pd.read_csv(io.StringIO('\n'.join(lines[header:])), encoding='big5')
@@ -101,7 +93,6 @@ def fetch_price_data(dates):
         dfm['收盤價'] = pd.to_numeric(dfm['收盤價'].astype(str).str.replace(',', ''), errors='coerce')
         dfm['成交量'] = pd.to_numeric(dfm['成交股數'].astype(str).str.replace(',', ''), errors='coerce') // 1000
         records.append(dfm[['date','收盤價','成交量']])
-        time.sleep(0.1)
     if records:
         dfp = pd.concat(records).drop_duplicates('date').set_index('date').sort_index()
         return dfp
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# holdings.py
+# 全市場三大法人持股比率（TWT38U）的寬表：列為交易日、欄為代號，
+# 連同前一交易日與 N 日的變動一次算好，存在 store 的 derived 區。
+# 任一檔的持股趨勢、全市場「外資持股增加最多」都是對寬表的切片與排序。
+#
+#   python holdings.py --days 60 --top 20 --change 5     # 最近 5 個交易日外資持股比率增加最多的 20 檔
+#   python holdings.py --days 60 --stock 2382            # 單一股票的持股比率與變動
+import sys
+import argparse
+
+import store
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+RATIOS = ('外資持股比率', '投信持股比率', '自營商持股比率')
+CHANGE_DAYS = (1, 5, 20)     # 預先算好的變動天數（交易日），其他天數查詢時才算
+
+
+class Panel:
+    """ratios[欄位] 是 交易日 × 代號 的 float32 寬表；changes[(欄位, n)] 是 n 個交易日前到當天的變動（百分點）。
+    傳入的 ratios、changes 可能是 store.derived() 的記憶體快取，只讀不改。"""
+
+    def __init__(self, ratios, changes=None):
+        self.ratios = ratios
+        # 另開一個 dict：change() 補算的其他天數只留在這個 Panel，不寫回共用的快取
+        self.changes = dict(changes) if changes is not None else \
+            {(col, n): wide.diff(n) for col, wide in ratios.items() for n in CHANGE_DAYS}
+
+    @property
+    def dates(self):
+        return self.ratios[RATIOS[0]].index
+
+    def change(self, n=1, column='外資持股比率'):
+        if (column, n) not in self.changes:
+            self.changes[(column, n)] = self.ratios[column].diff(n)
+        return self.changes[(column, n)]
+
+    def stock(self, stock):
+        """單一股票的三種持股比率，以 date 為索引；沒有資料的日子不列出。"""
+        df = pd.DataFrame({col: wide[stock] for col, wide in self.ratios.items() if stock in wide})
+        df.index.name = 'date'
+        return df.dropna(how='all')
+
+    def trend(self, stock, n=5, column='外資持股比率'):
+        """持股比率加上前一日與 n 日變動。"""
+        df = self.stock(stock)
+        if df.empty:
+            return df
+        df[f'{column}日變動'] = self.change(1, column)[stock].reindex(df.index)
+        df[f'{column}{n}日變動'] = self.change(n, column)[stock].reindex(df.index)
+        return df
+
+    def gainers(self, n=5, top=20, column='外資持股比率'):
+        """最後一個交易日相較 n 個交易日前，持股比率增加最多的股票。"""
+        if self.dates.empty:
+            return pd.DataFrame(columns=[column, '變動'])
+        delta = self.change(n, column).iloc[-1].dropna().nlargest(top)
+        out = pd.DataFrame({column: self.ratios[column].iloc[-1].reindex(delta.index), '變動': delta})
+        out.index.name = '代號'
+        return out
+
+
+def _build(days):
+    frames = store.ingest_many('TWT38U', days)
+    rows = {pd.Timestamp(ds): df for ds, df in sorted(frames.items()) if df is not None}
+    ratios = {}
+    for col in RATIOS:
+        wide = pd.DataFrame({ts: df[col] for ts, df in rows.items()}).T
+        wide.index = pd.DatetimeIndex(wide.index, name='date')
+        ratios[col] = wide.astype('float32')
+    p = Panel(ratios)
+    # 存純 dict，不存 Panel 物件，從 CLI（__main__）存的檔在別的模組也讀得回來
+    return {'ratios': p.ratios, 'changes': p.changes}
+
+
+def panel(days):
+    """days（YYYYMMDD，由舊到新）的全市場持股比率寬表；缺的日期先補進 store。
+    已存檔的結果由 store.derived() 留在記憶體，尚未公布完整的每次重算。"""
+    days = tuple(days)
+    return Panel(**store.derived('TWT38U', 'holdings', days, lambda: _build(days)))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="全市場三大法人持股比率與變動")
+    ap.add_argument("--days", type=int, default=60, help="最近幾個平日")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 --days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument("--change", type=int, default=5, help="變動天數（交易日）")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--stock", help="只看單一股票")
+    args = ap.parse_args(argv)
+
+    p = panel(store.span(args.days, args.start, args.end))
+    if p.dates.empty:
+        print("❌ 沒有任何 TWT38U 資料")
+        return 1
+    if args.stock:
+        print(p.trend(args.stock, args.change).to_string())
+    else:
+        if len(p.dates) <= args.change:
+            print(f"⚠️ 只有 {len(p.dates)} 個交易日的資料，算不出 {args.change} 日變動，請加大 --days")
+            return 1
+        print(f"📈 {p.dates[-1]:%Y-%m-%d} 外資持股比率 {args.change} 日增加最多：")
+        print(p.gainers(args.change, args.top).to_string(float_format=lambda v: f"{v:.2f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# indicators.py
+# 技術指標引擎：把多檔股票的 STOCK_DAY（開高低收量、成交金額）排成 交易日 × 代號 的寬表，
+# 均線、RSI、ATR、OBV、VWAP 一次對整張寬表向量化計算，所有股票同時算完，不逐檔迴圈。
+# 結果經 store.derived() 存檔，同一組股票與日期之後直接讀檔；圖表、選股只需切出要的欄位疊上去。
+#
+#   python indicators.py 2382 1301 2330 --days 120          # 各股最新一天的指標
+#   python indicators.py --watchlist --days 120 --sort RSI14
+import sys
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import datasets
+import schema
+import store
+import twse
+from stockrate.lazy import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# 名稱 → (函式, 參數)；名稱也是結果的鍵與輸出欄名
+INDICATORS = {
+    'MA5': ('sma', 5), 'MA20': ('sma', 20), 'MA60': ('sma', 60),
+    'RSI14': ('rsi', 14),
+    'ATR14': ('atr', 14),
+    'OBV': ('obv', None),
+    'VWAP': ('vwap', 1), 'VWAP20': ('vwap', 20),
+}
+
+
+# ─── 指標（輸入輸出皆為 交易日 × 代號 的寬表）────────────
+def sma(p, n):
+    return p['收盤價'].rolling(n, min_periods=n).mean()
+
+
+def rsi(p, n):
+    """Wilder RSI：漲跌幅以 1/n 的指數平滑。"""
+    delta = p['收盤價'].diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    loss = (-delta).clip(lower=0).ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+    return 100 - 100 / (1 + gain / loss)
+
+
+def atr(p, n):
+    prev = p['收盤價'].shift()
+    tr = np.fmax(p['最高價'] - p['最低價'],
+                 np.fmax((p['最高價'] - prev).abs(), (p['最低價'] - prev).abs()))
+    return tr.ewm(alpha=1 / n, adjust=False, min_periods=n).mean()
+
+
+def obv(p, _):
+    """能量潮（張）：收漲加當日量、收跌減當日量。"""
+    step = np.sign(p['收盤價'].diff()).fillna(0) * p['成交量']
+    return step.cumsum()
+
+
+def vwap(p, n):
+    """n 日成交量加權均價＝成交金額合計 ÷ 成交股數合計（成交量為張）。"""
+    amount = p['成交金額'].rolling(n, min_periods=n).sum()
+    shares = (p['成交量'] * 1000).rolling(n, min_periods=n).sum()
+    return amount / shares.where(shares > 0)
+
+
+FUNCS = {'sma': sma, 'rsi': rsi, 'atr': atr, 'obv': obv, 'vwap': vwap}
+
+
+def compute(p, names=None):
+    """p 為 {OHLCV 欄位: 寬表}；回傳 {指標名稱: 寬表（float32）}。"""
+    out = {}
+    for name in names or INDICATORS:
+        fn, n = INDICATORS[name]
+        out[name] = FUNCS[fn](p, n).astype('float32')
+    return out
+
+
+# ─── OHLCV 寬表 ───────────────────────────────────
+def _fetch(stock, month):
+    """回傳 (代號, frame 或 None, 抓取失敗時的「代號/月份」)；查無資料（尚未上市的月份）不算失敗。"""
+    try:
+        return stock, datasets.fetch_stock_day(stock, month), None
+    except (twse.TWSEUnavailable, schema.SchemaDrift):
+        twse.report_missing('STOCK_DAY', [f"{stock}/{month}"])
+        return stock, None, f"{stock}/{month}"
+
+
+def ohlcv_panel(stocks, days, workers=store.DEFAULT_WORKERS, failed=None):
+    """{OHLCV 欄位: 交易日 × 代號 的寬表}；只保留 days 內、至少一檔有成交的日子。
+    抓取失敗的「代號/月份」附加到 failed（list）。"""
+    months = sorted({d[:6] for d in days})
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda sm: _fetch(*sm), [(s, m) for s in stocks for m in months]))
+    per_stock = {}
+    for stock, df, bad in results:
+        if bad and failed is not None:
+            failed.append(bad)
+        if df is not None:
+            per_stock.setdefault(stock, []).append(df)
+    wanted = pd.DatetimeIndex([pd.Timestamp(d) for d in days])
+    long = {s: pd.concat(parts).sort_index() for s, parts in per_stock.items()}
+    long = {s: df[df.index.isin(wanted)] for s, df in long.items()}
+    panel = {}
+    for col in datasets.OHLCV:
+        wide = pd.DataFrame({s: df[col] for s, df in long.items()}, columns=list(stocks))
+        wide.index = pd.DatetimeIndex(wide.index, name='date')
+        # 寬表有缺值（停牌、尚未上市），一律用浮點；成交金額超過 float32 的精確範圍，用 float64
+        panel[col] = wide.sort_index().astype('float64' if col == '成交金額' else 'float32')
+    return panel
+
+
+def _key(stocks):
+    return hashlib.sha1(",".join(stocks).encode("utf-8")).hexdigest()[:12]
+
+
+def _cached(stocks, days):
+    # 最後一天已過 STOCK_DAY 的公布時間（抓取前就判斷）才算完整：假日或停牌沒有那天的收盤價，之後也不會再有
+    published = days[-1] <= twse.latest_published('STOCK_DAY')
+    failed = []
+
+    def build():
+        p = ohlcv_panel(stocks, days, failed=failed)
+        return {'ohlcv': p, 'indicators': compute(p)}
+
+    # 有月份抓取失敗時只算不存，下次重新補抓
+    return store.derived('STOCK_DAY', f"indicators_{_key(stocks)}", days, build,
+                         final=lambda obj: published and not failed)
+
+
+def panel(stocks, days):
+    """回傳 {'ohlcv': {...}, 'indicators': {...}}；同一組股票與日期算好存檔後只讀一次（store.derived 的記憶體快取）。"""
+    return _cached(tuple(str(s) for s in stocks), tuple(days))
+
+
+def frame(result, stock):
+    """單一股票的 OHLCV 加上所有指標，以 date 為索引，可直接與 Frames.prices() 對齊疊圖。"""
+    cols = {**result['ohlcv'], **result['indicators']}
+    df = pd.DataFrame({c: wide[stock] for c, wide in cols.items() if stock in wide})
+    df.index.name = 'date'
+    return df.dropna(subset=['收盤價']) if '收盤價' in df else df
+
+
+def latest(result):
+    """各股最後一個有收盤價的交易日的指標，一檔一列（選股用）。"""
+    close = result['ohlcv']['收盤價']
+    if close.empty:
+        return pd.DataFrame()
+    rows = {}
+    for name, wide in {'收盤價': close, **result['indicators']}.items():
+        rows[name] = wide.ffill().iloc[-1]
+    out = pd.DataFrame(rows)
+    out.index.name = '代號'
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="多檔股票的技術指標（一次向量化計算）")
+    ap.add_argument("stocks", nargs="*")
+    ap.add_argument("--watchlist", action="store_true", help="使用 config.json 的 watchlist")
+    ap.add_argument("--days", type=int, default=120, help="最近幾個平日")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 --days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument("--sort", help="依某個指標排序，例如 RSI14")
+    args = ap.parse_args(argv)
+
+    stocks = list(args.stocks)
+    if args.watchlist or not stocks:
+        stocks += [str(s) for s in twse._load_config().get("watchlist", [])]
+    if not stocks:
+        ap.error("請指定股票代號或 --watchlist")
+    table = latest(panel(stocks, store.span(args.days, args.start, args.end)))
+    if table.empty:
+        print("❌ 沒有任何股價資料")
+        return 1
+    if args.sort:
+        table = table.sort_values(args.sort, ascending=False)
+    print(table.to_string(float_format=lambda v: f"{v:.2f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# metrics.py
+# 各階段耗時統計，輸出 Prometheus 文字格式。
+# Flask 程式用 instrument(app) 掛上 /metrics；批次程式結束時用 write_textfile() 寫檔，
+# 交給 node_exporter 的 textfile collector 收集。
+import os
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+import tracelog
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_lock = threading.Lock()
+_registry = []
+
+
+def _escape(v):
+    return str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.doc = name, doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with _lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def render(self):
+        out = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with _lock:
+            for key, (counts, total, n) in sorted(self._series.items()):
+                for b, c in zip(self.buckets, counts):
+                    out.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", b)])} {c}')
+                out.append(f'{self.name}_bucket{_labels(self.labelnames, key, [("le", "+Inf")])} {n}')
+                out.append(f'{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}')
+                out.append(f'{self.name}_count{_labels(self.labelnames, key)} {n}')
+        return out
+
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc = name, doc
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with _lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def render(self):
+        out = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        with _lock:
+            for key, v in sorted(self._series.items()):
+                out.append(f'{self.name}{_labels(self.labelnames, key)} {v}')
+        return out
+
+
+REQUEST_SECONDS = Histogram('stockrate_http_request_duration_seconds',
+                            'Flask 請求處理時間', ('app', 'route', 'method', 'status'))
+STAGE_SECONDS = Histogram('stockrate_stage_duration_seconds',
+                          '各處理階段耗時（抓取、解析、對齊、繪圖、存檔）', ('stage',))
+UPSTREAM_SECONDS = Histogram('stockrate_upstream_request_duration_seconds',
+                             'TWSE 上游請求耗時', ('endpoint', 'status'))
+CACHE_REQUESTS = Counter('stockrate_cache_requests_total',
+                         '快取查詢次數（result=hit/miss）', ('cache', 'result'))
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    tracelog.stage(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def timed(name):
+    """函式裝飾器版的 stage()。"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def observe_upstream(endpoint, status, seconds):
+    UPSTREAM_SECONDS.observe(seconds, endpoint=endpoint, status=status)
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render():
+    lines = []
+    for m in _registry:
+        lines += m.render()
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """原子寫入 .prom 檔，避免 collector 讀到寫一半的內容。"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(render())
+    os.replace(tmp, path)
+    return path
+
+
+def instrument(app, name=None):
+    """替 Flask app 加上請求計時與 /metrics 端點。"""
+    from flask import Response, g, request
+
+    app_name = name or app.import_name
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        t0 = g.pop('_metrics_t0', None)
+        if t0 is not None:
+            rule = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, app=app_name, route=rule,
+                                    method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    return app
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# notify.py
+# 圖表通知的背景佇列：畫好的圖丟進來就返回，不等通知送出；背景執行緒每隔 flush_interval 秒
+# （或湊滿 digest_size 張）把多檔股票合併成一則摘要送出，失敗以指數退避重試，
+# 未送出的項目存在 data/notify_queue.json，程式重啟後接著送；超過 max_attempts 次的移到 dead 區。
+#
+# 傳送方式可替換（TRANSPORTS）：
+#   line  LINE Notify，config 的 token；url 可指向本地替身
+#   file  寫到 output/notify/（本地測試用，不連外）
+#
+#   python notify.py --status                       # 佇列內容
+#   python notify.py --send 2382 output/2382.png     # 手動加入一張圖並立即送出
+#   python notify.py --retry-dead                    # 把 dead 區的項目放回佇列
+#
+# config.json：
+#   "notify": {"transport": "line", "token": "...", "digest_size": 5, "flush_interval": 60,
+#              "max_attempts": 8, "backoff": 30, "max_backoff": 3600}
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import threading
+import uuid
+from contextlib import contextmanager
+
+import shared
+import tracelog
+import twse
+from stockrate.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+QUEUE_PATH = os.path.join("data", "notify_queue.json")
+NOTIFY_DEFAULTS = {
+    "transport": "file",
+    "token": None,
+    "url": "https://notify-api.line.me/api/notify",
+    "outbox": os.path.join("output", "notify"),
+    "digest_size": 5,           # 一則摘要最多幾張圖
+    "flush_interval": 60,       # 累積多久送一次（秒）；湊滿 digest_size 就提早送
+    "max_attempts": 8,          # 超過就移到 dead 區，不再自動重試
+    "backoff": 30,              # 第 n 次失敗後等 backoff × 2^(n-1) 秒
+    "max_backoff": 3600,
+    "timeout": 20,
+}
+
+
+class DeliveryError(Exception):
+    """sent：失敗前已送出的圖數（LINE Notify 一張一則）；大於 0 表示摘要文字也已送出。"""
+
+    def __init__(self, message, sent=0):
+        super().__init__(message)
+        self.sent = sent
+
+
+# ─── 傳送方式 ─────────────────────────────────────
+class LineNotify:
+    """LINE Notify：一次請求只能附一張圖，摘要文字隨第一張圖送出，其餘圖各帶一行標題。"""
+
+    def __init__(self, token, url=NOTIFY_DEFAULTS["url"], timeout=NOTIFY_DEFAULTS["timeout"]):
+        if not token:
+            raise ValueError("LINE Notify 需要 token（config.json 的 notify.token）")
+        self.token, self.url, self.timeout = token, url, timeout
+
+    def post(self, message, image_path=None):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        try:
+            if image_path:
+                with open(image_path, "rb") as f:
+                    r = requests.post(self.url, headers=headers, data={"message": message},
+                                      files={"imageFile": f}, timeout=self.timeout)
+            else:
+                r = requests.post(self.url, headers=headers, data={"message": message}, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(str(e)) from e
+        if r.status_code != 200:
+            raise DeliveryError(f"HTTP {r.status_code}")
+        return r.status_code
+
+    def send(self, text, images):
+        if not images:
+            return self.post(text)
+        for i, (caption, path) in enumerate(images):
+            try:
+                self.post(text if i == 0 else caption, path)
+            except DeliveryError as e:
+                e.sent = i
+                raise
+
+
+class FileTransport:
+    """本地替身：每則摘要寫成 output/notify/<時間>/message.txt，圖複製進同一目錄。"""
+
+    def __init__(self, outbox=NOTIFY_DEFAULTS["outbox"]):
+        self.outbox = outbox
+
+    def send(self, text, images):
+        d = os.path.join(self.outbox, datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f"))
+        os.makedirs(d, exist_ok=True)
+        for _, path in images:
+            try:
+                shutil.copy(path, d)
+            except OSError as e:
+                raise DeliveryError(f"{path}：{e}") from e
+        with open(os.path.join(d, "message.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+TRANSPORTS = {
+    "line": lambda cfg: LineNotify(cfg["token"], cfg["url"], cfg["timeout"]),
+    "file": lambda cfg: FileTransport(cfg["outbox"]),
+}
+
+
+def load_config():
+    cfg = dict(NOTIFY_DEFAULTS)
+    cfg.update(twse._load_config().get("notify", {}))
+    return cfg
+
+
+def digest(items):
+    """多檔股票合成一則摘要：文字逐行列出，圖依序附上。"""
+    lines = [f"📊 {len(items)} 張圖表更新"]
+    images = []
+    for it in items:
+        caption = f"{it['stock']} {it['chart']}" + (f" {it['days']}天" if it.get("days") else "")
+        lines.append(f"• {caption}" + (f"：{it['message']}" if it.get("message") else ""))
+        if it.get("path"):
+            images.append((caption, it["path"]))
+    return "\n".join(lines), images
+
+
+def delivered(batch, sent):
+    """送出 sent 張圖後中斷時已送達的項目：圖依序對應有 path 的項目；sent > 0 時文字已送出，沒有圖的項目也算送達。"""
+    if sent <= 0:
+        return []
+    out, n = [], 0
+    for it in batch:
+        if not it.get("path"):
+            out.append(it)
+        elif n < sent:
+            out.append(it)
+            n += 1
+    return out
+
+
+# ─── 佇列 ────────────────────────────────────────
+class Queue:
+    """待送項目與 dead 區都存在 path；所有修改都在鎖內（行程內的執行緒鎖加上 shared.lock 跨行程鎖）
+    重讀檔案、修改後立即寫檔，多個行程共用同一個佇列檔也不會互相覆蓋。項目以 id 比對。"""
+
+    def __init__(self, transport, path=QUEUE_PATH, digest_size=5, flush_interval=60,
+                 max_attempts=8, backoff=30, max_backoff=3600, clock=time.time):
+        self.transport = transport
+        self.path = path
+        self.digest_size = digest_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sending = threading.Lock()     # 背景執行緒與 drain() 不會同時送同一批
+        self._wake = threading.Event()
+        self._thread = None
+        self._stop = False
+        self._key = "notify:" + os.path.abspath(path)
+        self.pending, self.dead = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return [], []
+        pending, dead = data.get("pending", []), data.get("dead", [])
+        for it in pending + dead:    # 舊版佇列檔的項目沒有 id
+            it.setdefault("id", f"{it['stock']}-{it['chart']}-{it['queued']}")
+        return pending, dead
+
+    @contextmanager
+    def _locked(self):
+        """進入時重讀檔案，其他行程剛加入或送出的項目才不會被這次寫檔蓋掉。"""
+        with self._lock, shared.lock(self._key):
+            self.pending, self.dead = self._read()
+            yield
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"pending": self.pending, "dead": self.dead}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+    def put(self, stock, chart, path=None, days=None, message=None):
+        """加入一項，立即返回；湊滿一則摘要就叫醒背景執行緒。"""
+        item = {"id": uuid.uuid4().hex, "stock": str(stock), "chart": chart, "path": path, "days": days,
+                "message": message, "queued": self.clock(), "attempts": 0, "next_try": 0, "error": None}
+        with self._locked():
+            self.pending.append(item)
+            self._write()
+            if len(self._due()) >= self.digest_size:
+                self._wake.set()
+        return item
+
+    def _due(self):
+        now = self.clock()
+        return [it for it in self.pending if it["next_try"] <= now]
+
+    def flush(self, force=False):
+        """送出到期的項目，每 digest_size 張一則；force 時不管是否已累積 flush_interval。回傳送出的則數。
+        同一個佇列檔同時只有一個行程在送，不會重複通知。"""
+        with self._sending, shared.lock(self._key + ":send"):
+            return self._flush(force)
+
+    def _flush(self, force):
+        with self._locked():
+            due = self._due()
+            if not due:
+                return 0
+            oldest = min(it["queued"] for it in due)
+            if not force and len(due) < self.digest_size and self.clock() - oldest < self.flush_interval:
+                return 0
+        sent = 0
+        for i in range(0, len(due), self.digest_size):
+            batch = due[i:i + self.digest_size]
+            text, images = digest(batch)
+            try:
+                self.transport.send(text, images)
+            except (DeliveryError, OSError) as e:
+                # 已送出的圖（與隨第一張圖送出的文字）先移出佇列，重試時只送剩下的，不會重複通知
+                done = {it["id"] for it in delivered(batch, getattr(e, "sent", 0))}
+                if done:
+                    self._sent([it for it in batch if it["id"] in done])
+                self._failed([it for it in batch if it["id"] not in done], e)
+                continue
+            self._sent(batch)
+            sent += 1
+        return sent
+
+    def _sent(self, items):
+        with self._locked():
+            ids = {it["id"] for it in items}
+            self.pending = [it for it in self.pending if it["id"] not in ids]
+            self._write()
+        tracelog.event("notify_sent", stocks=[it["stock"] for it in items])
+
+    def _failed(self, batch, error):
+        now = self.clock()
+        ids = {it["id"] for it in batch}
+        with self._locked():
+            keep = []
+            for it in self.pending:
+                if it["id"] not in ids:
+                    keep.append(it)
+                    continue
+                it["attempts"] += 1
+                it["error"] = str(error)
+                if it["attempts"] >= self.max_attempts:
+                    self.dead.append(it)
+                else:
+                    it["next_try"] = now + min(self.backoff * 2 ** (it["attempts"] - 1), self.max_backoff)
+                    keep.append(it)
+            self.pending = keep
+            self._write()
+        print(f"⚠️ 通知送出失敗（{len(batch)} 項）：{error}")
+        tracelog.event("notify_failed", stocks=[it["stock"] for it in batch], error=str(error))
+
+    def retry_dead(self):
+        with self._locked():
+            for it in self.dead:
+                it.update(attempts=0, next_try=0, error=None)
+            self.pending.extend(self.dead)
+            n, self.dead = len(self.dead), []
+            self._write()
+        return n
+
+    # 背景執行緒
+    def _loop(self):
+        while not self._stop:
+            self._wake.wait(timeout=min(self.flush_interval, 5))
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = False
+            self._thread = threading.Thread(target=self._loop, name="notify", daemon=True)
+            self._thread.start()
+        return self
+
+    def drain(self, timeout=30):
+        """結束前盡量送完；仍在退避中的項目留在檔案裡，下次啟動再送。回傳剩下的項目數。"""
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            self.flush(force=True)
+            with self._locked():
+                if not self._due():
+                    break
+        self._stop = True
+        self._wake.set()
+        with self._locked():
+            return len(self.pending)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def queue():
+    """依 config.json 建立的共用佇列（已啟動背景執行緒）；未設定 notify 時回傳 None。"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if "notify" not in twse._load_config():
+                return None
+            cfg = load_config()
+            _queue = Queue(TRANSPORTS[cfg["transport"]](cfg),
+                           **{k: cfg[k] for k in ("digest_size", "flush_interval", "max_attempts",
+                                                  "backoff", "max_backoff")}).start()
+    return _queue
+
+
+def enqueue(stock, chart, path=None, days=None, message=None):
+    """有設定通知才排入；不會阻塞呼叫端。"""
+    q = queue()
+    if q is not None:
+        q.put(stock, chart, path, days, message)
+    return q
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="圖表通知佇列")
+    ap.add_argument("--status", action="store_true", help="列出待送與 dead 區")
+    ap.add_argument("--send", nargs=2, metavar=("STOCK", "IMAGE"), help="加入一張圖並立即送出")
+    ap.add_argument("--retry-dead", action="store_true", help="dead 區的項目重新排入")
+    args = ap.parse_args(argv)
+
+    cfg = load_config()
+    q = Queue(TRANSPORTS[cfg["transport"]](cfg),
+              **{k: cfg[k] for k in ("digest_size", "flush_interval", "max_attempts", "backoff", "max_backoff")})
+    if args.retry_dead:
+        print(f"🔁 {q.retry_dead()} 項重新排入")
+    if args.send:
+        q.put(args.send[0], "manual", args.send[1])
+    if args.send or args.retry_dead:
+        left = q.drain()
+        print(f"📤 送出完成，剩 {left} 項待重試" if left else "📤 送出完成")
+    if args.status or not (args.send or args.retry_dead):
+        print(f"待送 {len(q.pending)} 項，dead {len(q.dead)} 項（{q.path}）")
+        for it in q.pending + q.dead:
+            state = "dead" if it in q.dead else f"第 {it['attempts']} 次失敗" if it["attempts"] else "待送"
+            print(f"  {it['stock']} {it['chart']} {it.get('path') or ''}  {state}  {it.get('error') or ''}")
+    return 1 if q.pending or q.dead else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
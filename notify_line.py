@@ -1,8 +1,12 @@
-import requests
+import notify
+
 
 def notify_line_with_image(token, msg, image_path):
-    headers = {"Authorization": f"Bearer " + token}
-    payload = {"message": msg}
-    files = {"imageFile": open(image_path, "rb")}
-    r = requests.post("https://notify-api.line.me/api/notify", headers=headers, data=payload, files=files)
-    print("📤 LINE 通知送出：", r.status_code)
+    """立即送出一張圖（同步）；批次送圖請用 notify.enqueue()，由背景佇列合併、重試。"""
+    try:
+        status = notify.LineNotify(token).post(msg, image_path)
+    except notify.DeliveryError as e:
+        print("❌ LINE 通知失敗：", e)
+        return None
+    print("📤 LINE 通知送出：", status)
+    return status
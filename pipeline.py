@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# pipeline.py
+# 依圖表宣告的資料需求建立抓取計畫：各圖重疊的輸入（例如四條程式路徑都要的 STOCK_DAY 股價）
+# 合併成最少的抓取單位，彼此獨立的單位同時抓取，抓到的資料交給每個繪圖函式共用。
+#
+#   python pipeline.py 2382 60
+#   python pipeline.py 2382 60 --charts institutional,holdings --workers 6
+#   python pipeline.py 2382 60 --charts borrow
+#   python pipeline.py 2382 120 --charts dashboard
+#   python pipeline.py 2382 --start 20240701 --end 20240930      # 任意區間（例如 2024 Q3）
+import os
+import sys
+import argparse
+import datetime
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+import datasets
+import metrics
+import schema
+import shared
+import store
+import twse
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+OUTPUT_DIR = "output"
+DEFAULT_WORKERS = 4
+# 輸出品質 → dpi。網頁先給 preview（很快就畫好），full 在背景畫好後替換；300 dpi 只在匯出下載時才畫。
+QUALITY = {'preview': 50, 'full': 120, 'export': 300, 'partial': 50}
+
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+_pending = {}
+_plot_lock = threading.Lock()   # pyplot 的「目前圖表」是全域狀態，同一行程內一次只畫一張
+
+
+@dataclass(frozen=True)
+class Need:
+    """一張圖對某個資料集的需求；STOCK_DAY 需指定股票。"""
+    dataset: str
+    dates: tuple
+    stock: str = None
+
+    def units(self):
+        if self.dataset == 'STOCK_DAY':
+            return {('STOCK_DAY', self.stock, d[:6]) for d in self.dates}
+        return {(self.dataset, d) for d in self.dates}
+
+
+@dataclass(frozen=True)
+class Chart:
+    needs: object    # (stock, dates) -> [Need]
+    render: object   # (frames, stock, dates, opts, path) -> 輸出檔路徑
+    filename: str    # 輸出檔名樣板；以天數與最後一個日期區分，排程預先畫好的圖可直接沿用
+
+
+def recent_weekdays(n, end=None):
+    days = []
+    dt = end or datetime.date.today()
+    while len(days) < n:
+        if dt.weekday() < 5:
+            days.append(dt.strftime("%Y%m%d"))
+        dt -= datetime.timedelta(days=1)
+    return tuple(reversed(days))
+
+
+def window(days, start=None, end=None):
+    """圖表的日期：給了 start 就是 start～end 之間的平日，否則是到 end 為止的最近 days 個平日（見 store.span）。"""
+    return tuple(store.span(days, start, end))
+
+
+def plan(needs):
+    """把所有需求合併成不重複的抓取單位。"""
+    units = set()
+    for need in needs:
+        units |= need.units()
+    return sorted(units)
+
+
+def fetch_unit(unit):
+    return datasets.FETCHERS[unit[0]](*unit[1:])
+
+
+@metrics.timed('pipeline_fetch')
+def execute(units, workers=DEFAULT_WORKERS):
+    """同時抓取各單位；請求速率由 twse.governor 統一調節，執行緒只是讓等待時間重疊。
+    回傳 (各單位的結果, 重試後仍失敗的單位)。"""
+    results, failed = {}, []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {u: pool.submit(fetch_unit, u) for u in units}
+        for u, fut in futures.items():
+            try:
+                results[u] = fut.result()
+            except (twse.TWSEUnavailable, schema.SchemaDrift, ValueError):
+                results[u] = None
+                failed.append(u)
+    for ep in sorted({u[0] for u in failed}):
+        twse.report_missing(ep, ['_'.join(u[1:]) for u in failed if u[0] == ep])
+    return results, failed
+
+
+class Frames:
+    """抓取結果的共用檢視：各繪圖函式從這裡切出自己要的股票與日期。
+    missing 是抓取失敗的單位（不是查無資料），畫出來的圖不完整。"""
+
+    def __init__(self, results, missing=()):
+        self.results = results
+        self.missing = list(missing)
+
+    def missing_for(self, chart, stock, dates):
+        """該圖用到、但抓取失敗的單位。"""
+        return [u for u in plan(CHARTS[chart].needs(stock, dates)) if u in self.missing]
+
+    def daily(self, dataset, stock, dates):
+        return datasets.select({d: self.results.get((dataset, d)) for d in dates}, stock)
+
+    def panel(self, dataset, dates):
+        """整個市場的長表，見 datasets.stack()。"""
+        return datasets.stack({d: self.results.get((dataset, d)) for d in dates})
+
+    def prices(self, stock, dates):
+        months = sorted({d[:6] for d in dates})
+        frames = [self.results.get(('STOCK_DAY', stock, m)) for m in months]
+        frames = [f for f in frames if f is not None]
+        if not frames:
+            return pd.DataFrame(columns=['收盤價', '成交量'])
+        df = pd.concat(frames)
+        wanted = pd.DatetimeIndex([pd.Timestamp(d) for d in dates])
+        return df[df.index.isin(wanted)].sort_index()
+
+
+def chart_path(chart, stock, dates, quality='full', partial=False):
+    """圖檔路徑；partial=True 是資料不完整的圖，另存 *_partial 檔，不佔用 prerendered() 沿用的檔名。"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    name = CHARTS[chart].filename.format(stock=stock, days=len(dates), end=dates[-1])
+    tag = '' if quality == 'full' else quality
+    if partial and tag != 'partial':
+        tag = f"{tag}_partial" if tag else 'partial'
+    if tag:
+        root, ext = os.path.splitext(name)
+        name = f"{root}_{tag}{ext}"
+    return os.path.join(OUTPUT_DIR, name)
+
+
+def incomplete(data):
+    """資料的 attrs 裡逾時（late）或抓取失敗（missing）的日期／單位；都沒有時回傳空 list。"""
+    attrs = getattr(data, 'attrs', {})
+    return list(attrs.get('late') or []) + list(attrs.get('missing') or [])
+
+
+def _dpi(opts):
+    return opts.get('dpi') or QUALITY['full']
+
+
+def render_institutional(frames, stock, dates, opts, path):
+    from stockrate import institutional
+    df = frames.daily('T86', stock, dates).join(frames.prices(stock, dates), how='inner')
+    if df.empty:
+        return None
+    return institutional.plot_institutional_chart(df, stock, len(dates), path, dpi=_dpi(opts))
+
+
+def render_holdings(frames, stock, dates, opts, path):
+    from stockrate import institutional
+    df = frames.daily('TWT38U', stock, dates).join(frames.prices(stock, dates)[['收盤價']], how='inner')
+    if df.empty:
+        return None
+    return institutional.plot_holdings_chart(df, stock, path, dpi=_dpi(opts))
+
+
+def render_thousand(frames, stock, dates, opts, path):
+    from stockrate import institutional
+    ratio = frames.daily('BWIBBU_d', stock, dates)
+    t86 = frames.daily('T86', stock, dates)
+    px = frames.prices(stock, dates)
+    idx = [pd.Timestamp(d) for d in dates]
+    col = lambda df, c: df[c].reindex(idx).tolist() if c in df else [None] * len(idx)
+    return institutional.plot_thousand_chart(
+        stock, list(dates), col(ratio, '千張大戶持股比率'), col(t86, '外資'), col(t86, '投信'),
+        col(t86, '自營商'), col(px, '收盤價'), path, dpi=_dpi(opts))
+
+
+def render_borrow(frames, stock, dates, opts, path):
+    import borrow_analysis1
+    borrow = frames.daily('TWT93U', stock, dates).reset_index()
+    borrow['日期'] = borrow['date'].dt.date
+    borrow['代號'] = stock
+    px = frames.prices(stock, dates).reset_index()
+    px['日期'] = px['date'].dt.date
+    px['成交量'] = px['成交量'].astype('int64') * 1000   # merge_borrow_price 以股為單位
+    df = borrow_analysis1.merge_borrow_price(stock, borrow, px[['日期', '收盤價', '成交量']])
+    if df.empty:
+        return None
+    borrow_analysis1.render_borrow_chart(stock, df, opts.get('float_shares'), len(dates),
+                                         fname=os.path.basename(path), dpi=_dpi(opts))
+    return path
+
+
+def render_dashboard(frames, stock, dates, opts, path):
+    import dashboard
+    df = dashboard.dashboard_frame(frames, stock, dates)
+    if df.empty:
+        return None
+    return dashboard.plot_dashboard(df, stock, len(dates), path, dpi=_dpi(opts))
+
+
+def _dashboard_needs(stock, dates):
+    import dashboard
+    return dashboard.needs(stock, dates)
+
+
+CHARTS = {
+    'institutional': Chart(
+        needs=lambda stock, dates: [Need('T86', dates), Need('STOCK_DAY', dates, stock)],
+        render=render_institutional, filename='{stock}_chart_{days}d_{end}.png'),
+    'holdings': Chart(
+        needs=lambda stock, dates: [Need('TWT38U', dates), Need('STOCK_DAY', dates, stock)],
+        render=render_holdings, filename='{stock}_holdings_price_{days}d_{end}.png'),
+    'thousand': Chart(
+        needs=lambda stock, dates: [Need('BWIBBU_d', dates), Need('T86', dates), Need('STOCK_DAY', dates, stock)],
+        render=render_thousand, filename='{stock}_compare_{days}d_{end}.png'),
+    'borrow': Chart(
+        needs=lambda stock, dates: [Need('TWT93U', dates), Need('STOCK_DAY', dates, stock)],
+        render=render_borrow, filename='{stock}_borrow_analysis_{days}d_{end}.png'),
+    'dashboard': Chart(needs=_dashboard_needs, render=render_dashboard,
+                       filename='{stock}_dashboard_{days}d_{end}.png'),
+}
+
+
+def latest_end(chart, stock):
+    """該圖所有輸入都已公布的最後一天（YYYYMMDD）。"""
+    return min(twse.latest_published(n.dataset) for n in CHARTS[chart].needs(stock, ()))
+
+
+def prerendered(chart, stock, dates, quality='full'):
+    """排程器預先畫好的圖；有就回傳路徑，並計入 render 快取命中率。
+    資料不完整的圖都存成 *_partial 檔（見 chart_path），不會在這裡被當成畫好的圖。"""
+    path = chart_path(chart, stock, dates, quality)
+    hit = os.path.exists(path)
+    metrics.cache_lookup('render', hit)
+    return path if hit else None
+
+
+def render_once(chart, stock, dates, draw, quality='full'):
+    """有預先畫好的圖就直接用；沒有才呼叫 draw(path, dpi)。多行程模式下同一張圖同時只有一個 worker 在畫，
+    其他 worker 等它畫完直接沿用。draw 查無資料時回傳 None。"""
+    path = prerendered(chart, stock, dates, quality)
+    if path:
+        return path
+    path = chart_path(chart, stock, dates, quality)
+    if not twse.governor.shared:
+        return draw(path, QUALITY[quality])
+    with shared.single_flight('render:' + path) as owner:
+        if not owner and os.path.exists(path):
+            return path
+        return draw(path, QUALITY[quality])
+
+
+def progressive(chart, stock, dates, load, plot):
+    """網頁用：full 已畫好（排程預先畫好或先前畫過）就直接回傳；否則先畫 preview 回傳，
+    full 交給背景執行緒，頁面再把圖換成 full。load() 取資料（查無資料回傳 None），
+    plot(data, path, dpi) 只負責畫圖，preview 與 full 共用同一份資料。
+    資料的 attrs['late']（請求期限到了還有日期沒抓回來）或 attrs['missing']（重試後仍抓取失敗）不為空時
+    只畫 partial，不存成可沿用的圖，下次請求重新補抓。
+    回傳 (路徑, 狀態)，狀態為 'full'、'preview' 或 'partial'。"""
+    full = prerendered(chart, stock, dates)
+    if full:
+        return full, 'full'
+    data = load()
+    if data is None:
+        return None, None
+
+    def draw(path, dpi):
+        with _plot_lock:
+            return plot(data, path, dpi)
+
+    if incomplete(data):
+        return draw(chart_path(chart, stock, dates, 'partial'), QUALITY['partial']), 'partial'
+
+    preview = render_once(chart, stock, dates, draw, 'preview')
+    if preview:
+        key = chart_path(chart, stock, dates)
+        if key not in _pending or _pending[key].done():
+            _pending[key] = _background.submit(render_once, chart, stock, dates, draw)
+    return preview, 'preview'
+
+
+
+def export(chart, stock, days, end=None, start=None, **opts):
+    """匯出下載用的高解析度圖（QUALITY['export']），畫過一次之後直接沿用；有單位抓取失敗時另存 partial，下次重畫。"""
+    dates = window(days, start, end)
+
+    def draw(path, dpi):
+        _, frames = collect(stock, days, [chart], end=end, start=start)
+        if frames.missing_for(chart, stock, dates):
+            path = chart_path(chart, stock, dates, 'export', partial=True)
+        with _plot_lock:
+            return CHARTS[chart].render(frames, stock, dates, dict(opts, dpi=dpi), path)
+
+    return render_once(chart, stock, dates, draw, 'export')
+
+
+def collect(stock, days, charts, workers=DEFAULT_WORKERS, end=None, start=None):
+    """抓齊指定圖表所需的資料，回傳 (dates, frames)。end 為最後一天（YYYYMMDD），預設今天；
+    給了 start 時取 start～end 的區間，不看 days。"""
+    dates = window(days, start, end)
+    needs = [n for c in charts for n in CHARTS[c].needs(stock, dates)]
+    units = plan(needs)
+    separate = sum(len(n.units()) for n in needs)
+    print(f"▶️ {len(charts)} 張圖、{len(needs)} 項需求 → {len(units)} 個抓取單位（各自抓取需 {separate} 個）")
+    return dates, Frames(*execute(units, workers))
+
+
+def run(stock, days, charts=('institutional', 'holdings', 'thousand', 'borrow'),
+        workers=DEFAULT_WORKERS, end=None, quality='full', start=None, **opts):
+    """抓齊資料後畫出各圖，回傳 {圖: 路徑}；有單位抓取失敗的圖存成 partial（見 chart_path），不佔用正式檔名。"""
+    dates, frames = collect(stock, days, charts, workers, end, start)
+    opts['dpi'] = QUALITY[quality]
+    return {c: CHARTS[c].render(frames, stock, dates, opts,
+                                chart_path(c, stock, dates, quality, partial=bool(frames.missing_for(c, stock, dates))))
+            for c in charts}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="一次抓取、多張圖共用資料")
+    ap.add_argument('stock')
+    ap.add_argument('days', type=int, nargs='?', default=60)
+    ap.add_argument('--charts', default='institutional,holdings,thousand,borrow',
+                    help=f"逗號分隔：{','.join(CHARTS)}")
+    ap.add_argument('--start', help="第一天 YYYYMMDD；給了就不看天數")
+    ap.add_argument('--end', help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    ap.add_argument('--quality', choices=list(QUALITY), default='full', help="輸出品質（dpi 見 QUALITY）")
+    ap.add_argument('--float-shares', type=float, help="借券圖換手率用的股數（預設查 shares.py 的發行股數）")
+    args = ap.parse_args(argv)
+
+    charts = [c.strip() for c in args.charts.split(',') if c.strip()]
+    unknown = [c for c in charts if c not in CHARTS]
+    if unknown:
+        ap.error(f"未知的圖表：{', '.join(unknown)}")
+    try:
+        window(args.days, args.start, args.end)
+    except ValueError as e:
+        ap.error(f"日期格式錯誤：{e}")
+    out = run(args.stock, args.days, charts, args.workers, end=args.end, quality=args.quality,
+              start=args.start, float_shares=args.float_shares)
+    for c, path in out.items():
+        print(f"✅ {c}：{path}" if path else f"❌ {c}：查無資料")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
-import os
 import io
-import time
-import requests
 import pandas as pd
 import datetime
 import matplotlib.pyplot as plt
+import twse
 
 # ─── 參數設定 ───────────────────────────────────
 IN_CSV = "t86_2382.csv"   # 本地 T86 CSV 檔
@@ -27,9 +25,9 @@ def fetch_price_data(dates):
     months = sorted({d.strftime('%Y%m01') for d in dt_idx})
     records = []
     for m in months:
-        url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
+        url = f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
         try:
-            raw = requests.get(url, timeout=5).text
+            raw = twse.get(url, timeout=5).text
             lines = raw.splitlines()
             idx = next(i for i, ln in enumerate(lines) if '日期' in ln)
             csv_text = '\n'.join(lines[idx:])
@@ -43,7 +41,6 @@ def fetch_price_data(dates):
             records.append(df[['date','成交量']])
         except Exception as e:
             print(f"⚠️ {m} 下載失敗：{e}")
-        time.sleep(0.1)
     if not records:
         return pd.DataFrame()
     df_all = pd.concat(records).drop_duplicates('date').set_index('date').sort_index()
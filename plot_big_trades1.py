@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
-import os, io, time, requests, pandas as pd
+import os, io, pandas as pd
 import datetime
 import matplotlib.pyplot as plt
 from matplotlib.dates import DateFormatter
+import schema
+import twse
 
 # ─── 參數設定 ───────────────────────────────────
 STOCK_NO = "2382"
@@ -16,7 +18,7 @@ plt.rcParams['axes.unicode_minus'] = False
 
 # 動態取得最近交易日
 def get_trading_dates_api(stock_no, days):
-    dates = []
+    dates, missing = [], []
     today = datetime.date.today()
     offset = 0
     while len(dates) < days:
@@ -24,65 +26,62 @@ def get_trading_dates_api(stock_no, days):
         offset += 1
         if d.weekday() >= 5:
             continue
-        url = (f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv"
+        url = (f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv"
                f"&date={d.strftime('%Y%m%d')}&stockNo={stock_no}")
         try:
-            r = requests.get(url, timeout=5)
-        except:
+            r = twse.get(url, timeout=5)
+        except twse.TWSEUnavailable:
+            missing.append(d.strftime('%Y%m%d'))
             continue
         if '日期' in r.text:
             dates.append(d)
+    twse.report_missing('STOCK_DAY', missing)
     return sorted(dates)
 
 # 抓取三大法人買賣超
 def fetch_institutional(dates):
-    recs = []
-    API = "https://www.twse.com.tw/fund/T86?response=json&date={}&selectType=ALL"
+    recs, missing = [], []
+    API = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
     for d in dates:
         ds = d.strftime('%Y%m%d')
         try:
-            j = requests.get(API.format(ds), timeout=5).json()
-        except:
+            j = twse.get(API.format(ds), timeout=5).json()
+        except (twse.TWSEUnavailable, ValueError):     # 連線失敗或回應不是 JSON
+            missing.append(ds)
             continue
         if j.get('stat') != 'OK':
             continue
-        fields, data = j['fields'], j['data']
-        if '證券代號' not in fields:
-            continue
-        idx = fields.index('證券代號')
-        for row in data:
-            if str(row[idx]).strip('=" ') == STOCK_NO:
-                recs.append({'date': d,
-                             '外資': int(str(row[fields.index('外陸資買賣超股數(不含外資自營商)')]).replace(',', '')),
-                             '投信': int(str(row[fields.index('投信買賣超股數')]).replace(',', '')),
-                             '自營商': int(str(row[fields.index('自營商買賣超股數')]).replace(',', ''))})
-                break
-        time.sleep(0.1)
+        ex = schema.extractor('T86', j['fields'])
+        row = ex.find(j['data'], STOCK_NO)
+        if row is not None:
+            recs.append({'date': d, **{c: int(str(ex.get(row, c)).replace(',', '')) for c in ('外資', '投信', '自營商')}})
+    twse.report_missing('T86', missing)
     df = pd.DataFrame(recs)
     return df.set_index('date').sort_index() if not df.empty else df
 
 # 抓取收盤價與成交量
 def fetch_price_volume(dates):
-    recs = []
+    recs, missing = [], []
     for d in dates:
         ds = d.strftime('%Y%m%d')
-        url = (f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv"
+        url = (f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv"
                f"&date={ds}&stockNo={STOCK_NO}")
         try:
-            raw = requests.get(url, timeout=5).text
+            raw = twse.get(url, timeout=5).text
             lines = raw.splitlines()
             idx = next(i for i, ln in enumerate(lines) if '日期' in ln)
             dfm = pd.read_csv(io.StringIO('\n'.join(lines[idx:])), encoding='big5')
-        except:
+            dfm.columns = [c.strip() for c in dfm.columns]
+            dfm = dfm[dfm['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
+            ymd = dfm['日期'].str.split('/', expand=True).astype(int)
+            dfm['date'] = [datetime.date(y+1911, mo, d) for y, mo, d in zip(ymd[0], ymd[1], ymd[2])]
+            dfm['收盤價'] = pd.to_numeric(dfm['收盤價'].astype(str).str.replace(',', ''), errors='coerce')
+            dfm['成交量'] = pd.to_numeric(dfm['成交股數'].astype(str).str.replace(',', ''), errors='coerce')
+        except (twse.TWSEUnavailable, StopIteration, ValueError, KeyError):   # 連線失敗、沒有表頭或欄位不符
+            missing.append(ds)
             continue
-        dfm.columns = [c.strip() for c in dfm.columns]
-        dfm = dfm[dfm['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
-        ymd = dfm['日期'].str.split('/', expand=True).astype(int)
-        dfm['date'] = [datetime.date(y+1911, mo, d) for y, mo, d in zip(ymd[0], ymd[1], ymd[2])]
-        dfm['收盤價'] = pd.to_numeric(dfm['收盤價'].astype(str).str.replace(',', ''), errors='coerce')
-        dfm['成交量'] = pd.to_numeric(dfm['成交股數'].astype(str).str.replace(',', ''), errors='coerce')
         recs.append(dfm[['date','收盤價','成交量']])
-        time.sleep(0.1)
+    twse.report_missing('STOCK_DAY', missing)
     if recs:
         dfpv = pd.concat(recs).drop_duplicates('date')
         return dfpv.set_index('date').sort_index()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# scheduler.py
+# 收盤後的預熱排程：依 twse.PUBLISH_TIMES 在各資料集預計公布後開始輪詢，
+# 當天資料一出現就抓下來（全市場每日資料存進 store，回應寫進 cache），某張圖需要的資料集都到齊了就替觀察清單預先畫好，
+# 隔天早上 Flask 的請求（app.py 的 / 與 /dashboard）直接命中快取與已畫好的圖。
+#
+#   python scheduler.py                  # 常駐，每個平日收盤後自動執行
+#   python scheduler.py --once           # 只處理今天，做完即結束（可交給工作排程器）
+#   python scheduler.py --once --date 20250425
+#
+# 觀察清單與參數放在 config.json：
+#   "watchlist": ["2382", "1301"],
+#   "scheduler": {"charts": [...], "days": [60], "poll_interval": 300, "give_up": "23:59",
+#                 "float_shares": {"2382": 3862645000}}
+#   "notify": {...}     # 有設定就把畫好的圖排進 notify.py 的通知佇列，合併成摘要送出
+import os
+import sys
+import time
+import argparse
+import datetime
+
+import alerts
+import cache
+import datasets
+import metrics
+import notify
+import pipeline
+import schema
+import store
+import tracelog
+import twse
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+SCHEDULER_DEFAULTS = {
+    "charts": ["institutional", "holdings", "thousand", "dashboard"],
+    "days": [60],               # 預先畫好的天數，需與 Flask 表單常用的天數一致才會命中
+    "poll_interval": 300,       # 到了公布時間仍查無資料時，每隔幾秒再問一次
+    "give_up": "23:59",         # 超過這個時間仍未公布（例如颱風假、國定假日）就放棄當天
+    "float_shares": {},         # 借券圖換手率的股數覆寫，{股票: 股數}；未列出的查 shares.py
+    "alert_days": 30,           # 警示規則（alerts.py）評估用的平日數，需涵蓋規則裡最長的 .pct(n)／.mean(n)
+}
+METRICS_FILE = os.path.join("output", "scheduler.prom")
+
+
+def load_config():
+    cfg = twse._load_config()
+    sched = dict(SCHEDULER_DEFAULTS)
+    sched.update(cfg.get("scheduler", {}))
+    watchlist = cfg.get("watchlist") or [cfg.get("stock_code", "2382")]
+    return [str(s) for s in watchlist], sched
+
+
+class DayPlan:
+    """某個交易日的工作：每個 (股票, 圖, 天數) 要等哪些資料集當天公布後才能畫；
+    每條警示規則要等哪些資料集公布後才能評估。"""
+
+    def __init__(self, day, watchlist, charts, horizons, rules=()):
+        self.day = day
+        self.jobs = {}
+        for stock in watchlist:
+            for chart in charts:
+                deps = {n.dataset for n in pipeline.CHARTS[chart].needs(stock, ())}
+                for days in horizons:
+                    self.jobs[(stock, chart, days)] = deps
+        self.rules = list(rules)
+        self.datasets = set().union(*self.jobs.values(), *(r.datasets for r in self.rules))
+        self.ready = set()
+        self.done = set()
+        self.alerted = set()
+
+    def pending(self):
+        return self.datasets - self.ready
+
+    def runnable(self):
+        return [job for job, deps in self.jobs.items() if job not in self.done and deps <= self.ready]
+
+    def alertable(self):
+        return [r for r in self.rules if r not in self.alerted and r.datasets <= self.ready]
+
+    def finished(self):
+        return len(self.done) == len(self.jobs) and len(self.alerted) == len(self.rules)
+
+
+def probe(dataset, day, watchlist):
+    """當天的資料是否已公布；抓到的完整回應同時寫入快取，之後畫圖不必再連上游。"""
+    try:
+        if dataset != "STOCK_DAY":
+            return store.ingest(dataset, day) is not None
+        ok = True
+        for stock in watchlist:
+            df = datasets.fetch_stock_day(stock, day[:6])
+            if df is None or pd.Timestamp(day) not in df.index:
+                # 當月檔在當天公布前就快取了，丟掉舊版本，下次輪詢重新下載
+                cache.evict(datasets.stock_day_url(stock, day[:6]))
+                ok = False
+        return ok
+    except (twse.TWSEUnavailable, schema.SchemaDrift, ValueError):
+        return False
+
+
+def check_alerts(plan, watchlist, sched):
+    """相依資料集都已公布、尚未評估過的規則一起向量化評估；觸發的排進通知佇列。"""
+    due = plan.alertable()
+    if not due:
+        return None
+    plan.alerted |= set(due)
+    end = datetime.datetime.strptime(plan.day, "%Y%m%d").date()
+    try:
+        out = alerts.evaluate(due, store.weekdays(sched["alert_days"], end), watchlist, on=plan.day)
+    except (twse.TWSEUnavailable, ValueError) as e:
+        print(f"❌ 警示評估失敗：{e}")
+        return None
+    for row in out.itertuples(index=False):
+        print(f"🚨 {row.代號} {row.規則}：{row.數值}")
+        notify.enqueue(row.代號, "alert", message=f"{row.規則}（{row.數值}）")
+    tracelog.event("alerts", day=plan.day, rules=[r.name for r in due], hits=len(out))
+    return out
+
+
+def prerender(job, day, sched):
+    """畫好一張圖並排進通知佇列；回傳這個工作是否做完。
+    有資料抓取失敗時 pipeline.run 只畫 partial 檔：刪掉它、不通知，留到下次輪詢重畫。"""
+    stock, chart, days = job
+    opts = {"float_shares": sched["float_shares"].get(stock)}
+    try:
+        path = pipeline.run(stock, days, [chart], end=day, **opts)[chart]
+    except Exception as e:   # 單張圖失敗不影響其他股票
+        print(f"❌ {stock} {chart} {days}d 繪圖失敗：{e}")
+        tracelog.event("prerender_failed", stock=stock, chart=chart, days=days, error=str(e))
+        return True
+    if path and path != pipeline.chart_path(chart, stock, pipeline.window(days, end=day)):
+        os.remove(path)
+        print(f"⏳ {stock} {chart} {days}d 有資料抓取失敗，下次輪詢重畫")
+        tracelog.event("prerender_partial", stock=stock, chart=chart, days=days)
+        return False
+    print(f"🖼️ {stock} {chart} {days}d → {path}")
+    notify.enqueue(stock, chart, path, days)
+    return True
+
+
+def _at(day, hhmm):
+    hh, mm = hhmm.split(":")
+    return datetime.datetime.strptime(day, "%Y%m%d").replace(hour=int(hh), minute=int(mm))
+
+
+@metrics.timed("scheduler_day")
+def run_day(day, watchlist, sched, now=datetime.datetime.now, sleep=time.sleep):
+    """等當天各資料集公布、抓取，依相依關係預先畫圖；全部完成或超過 give_up 時間即返回。"""
+    try:
+        rules = alerts.load_rules()
+    except ValueError as e:
+        print(f"❌ 警示規則設定錯誤，今天不評估：{e}")
+        rules = []
+    plan = DayPlan(day, watchlist, sched["charts"], sched["days"], rules)
+    deadline = _at(day, sched["give_up"])
+    print(f"▶️ {day} 預熱：{len(watchlist)} 檔 × {len(sched['charts'])} 張圖，等待 {', '.join(sorted(plan.datasets))}")
+    with tracelog.run("scheduler", day=day, watchlist=watchlist):
+        while True:
+            t = now()
+            for ds in sorted(plan.pending()):
+                if twse.published_at(ds, day) <= t and probe(ds, day, watchlist):
+                    plan.ready.add(ds)
+                    print(f"✅ {ds} {day} 已公布（{t:%H:%M}）")
+                    tracelog.event("dataset_ready", dataset=ds, day=day)
+            check_alerts(plan, watchlist, sched)
+            for job in plan.runnable():
+                if prerender(job, day, sched):
+                    plan.done.add(job)
+            if plan.finished():
+                break
+            t = now()
+            if t >= deadline:
+                for ds in sorted(plan.pending()):
+                    twse.report_missing(ds, [day], reason="超過等待時間仍未公布")
+                for stock, chart, days in plan.runnable():
+                    print(f"❌ {stock} {chart} {days}d 到了放棄時間仍有資料抓取失敗，不預先畫圖")
+                break
+            upcoming = [twse.published_at(ds, day) for ds in plan.pending() if twse.published_at(ds, day) > t]
+            wake = min(upcoming + [t + datetime.timedelta(seconds=sched["poll_interval"]), deadline])
+            sleep(max(1.0, (wake - t).total_seconds()))
+    return plan
+
+
+def next_weekday(d):
+    d += datetime.timedelta(days=1)
+    while d.weekday() >= 5:
+        d += datetime.timedelta(days=1)
+    return d
+
+
+def serve(watchlist, sched):
+    """常駐模式：每個平日處理當天，做完睡到下一個平日最早公布的資料集。"""
+    day = datetime.date.today()
+    if day.weekday() >= 5:
+        day = next_weekday(day)
+    while True:
+        run_day(day.strftime("%Y%m%d"), watchlist, sched)
+        metrics.write_textfile(METRICS_FILE)
+        day = next_weekday(day)
+        first = min(twse.published_at(ep, day.strftime("%Y%m%d")) for ep in twse.PUBLISH_TIMES)
+        wait = (first - datetime.datetime.now()).total_seconds()
+        if wait > 0:
+            print(f"💤 下次預熱：{first:%Y-%m-%d %H:%M}")
+            time.sleep(wait)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="收盤後預熱快取與觀察清單圖表")
+    ap.add_argument("--once", action="store_true", help="只處理一天，做完即結束")
+    ap.add_argument("--date", help="要處理的日期 YYYYMMDD（預設今天）")
+    ap.add_argument("--stocks", help="逗號分隔，覆寫 config.json 的 watchlist")
+    args = ap.parse_args(argv)
+
+    watchlist, sched = load_config()
+    if args.stocks:
+        watchlist = [s.strip() for s in args.stocks.split(",") if s.strip()]
+    if args.once or args.date:
+        plan = run_day(args.date or datetime.date.today().strftime("%Y%m%d"), watchlist, sched)
+        metrics.write_textfile(METRICS_FILE)
+        if notify.queue() is not None:
+            left = notify.queue().drain()
+            if left:
+                print(f"📨 {left} 則通知尚未送出，留在 {notify.QUEUE_PATH}，下次執行時重試")
+        return 0 if plan.finished() else 1
+    serve(watchlist, sched)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# schema.py
+# TWSE 回應欄位（JSON 的 fields、CSV 的表頭）的登錄表：每個端點列出需要的欄位與已知的各版本名稱，
+# 同一組 fields 只解析一次成「欄位名稱 → 位置」的 Extractor，之後每一天、每個呼叫端共用。
+# TWSE 改了欄位名稱時丟出 SchemaDrift（附上新的 fields），不再被 except ValueError 默默略過、當成查無資料。
+import hashlib
+import threading
+
+import tracelog
+
+# 端點 → {輸出名稱: 已知的來源欄位名稱（新版在前）}；名稱前加 ? 的欄位可有可無
+SCHEMAS = {
+    'T86': {
+        '代號': ('證券代號',),
+        '外資': ('外陸資買賣超股數(不含外資自營商)', '外資買賣超股數'),   # 2017 年前的舊名
+        '投信': ('投信買賣超股數',),
+        '自營商': ('自營商買賣超股數',),
+        '?三大法人': ('三大法人買賣超股數',),
+    },
+    'TWT38U': {
+        '代號': ('證券代號',),
+        '外資持股比率': ('全體外資及陸資持股比率(%)',),
+        '投信持股比率': ('投信持股比率(%)',),
+        '自營商持股比率': ('自營商持股比率(%)',),
+        '?發行股數': ('發行股數',),
+    },
+    'BWIBBU_d': {
+        '代號': ('證券代號',),
+        '千張大戶持股比率': ('千張大戶持股比率(%)', '千張大戶持股比率'),
+    },
+    'STOCK_DAY': {
+        '日期': ('日期',),
+        '成交股數': ('成交股數',),
+        '成交金額': ('成交金額',),
+        '開盤價': ('開盤價',),
+        '最高價': ('最高價',),
+        '最低價': ('最低價',),
+        '收盤價': ('收盤價',),
+    },
+}
+
+
+class SchemaDrift(Exception):
+    """回應的欄位與登錄表對不上（TWSE 改了欄位名稱）；不是 ValueError，呼叫端不會當成查無資料略過。"""
+
+    def __init__(self, endpoint, missing, fields):
+        self.endpoint, self.missing, self.fields = endpoint, list(missing), list(fields)
+        super().__init__(f"{endpoint} 欄位變動（{fingerprint(fields)}）：找不到 {', '.join(self.missing)}；"
+                         f"目前的欄位：{self.fields}")
+
+
+def fingerprint(fields):
+    return hashlib.sha1("\x1f".join(fields).encode("utf-8")).hexdigest()[:10]
+
+
+class Extractor:
+    """某端點某一版 fields 的欄位位置；row(...)、find(...) 取單列，frame(...) 一次取整欄。"""
+
+    def __init__(self, endpoint, fields):
+        self.endpoint = endpoint
+        self.fields = tuple(f.strip() for f in fields)
+        self.fingerprint = fingerprint(self.fields)
+        self.positions, missing = {}, []
+        for name, aliases in SCHEMAS[endpoint].items():
+            optional = name.startswith('?')
+            name = name.lstrip('?')
+            pos = next((self.fields.index(a) for a in aliases if a in self.fields), None)
+            if pos is not None:
+                self.positions[name] = pos
+            elif not optional:
+                missing.append(name)
+        if missing:
+            raise SchemaDrift(endpoint, missing, self.fields)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def source(self, name):
+        """輸出名稱對應的原始欄位名稱（CSV 表頭用）。"""
+        return self.fields[self.positions[name]]
+
+    def get(self, row, name):
+        return row[self.positions[name]]
+
+    def find(self, data, code, key='代號'):
+        """data 中代號為 code 的那一列；沒有回傳 None。"""
+        k = self.positions[key]
+        return next((row for row in data if str(row[k]).strip('=" ') == code), None)
+
+    def columns(self, data, names=None):
+        """{輸出名稱: 該欄所有值（tuple）}；整份 data 只轉置一次。"""
+        cols = list(zip(*data)) if data else [()] * len(self.fields)
+        return {n: cols[self.positions[n]] for n in (names or self.positions) if n in self.positions}
+
+
+_compiled = {}
+_lock = threading.Lock()
+
+
+def extractor(endpoint, fields):
+    """同一端點、同一組 fields 只編譯一次；欄位對不上時每一版只記一次 schema_drift 事件，之後照樣丟出。"""
+    key = (endpoint, tuple(fields))
+    hit = _compiled.get(key)
+    if hit is None:
+        try:
+            hit = Extractor(endpoint, fields)
+        except SchemaDrift as e:
+            hit = e
+            print(f"❌ {e}")
+            tracelog.event("schema_drift", endpoint=endpoint, fingerprint=fingerprint(fields),
+                           missing=e.missing, fields=list(fields))
+        with _lock:
+            _compiled[key] = hit
+    if isinstance(hit, SchemaDrift):
+        raise hit
+    return hit
@@ -0,0 +1,104 @@
+# shared.py
+# 多行程部署（wsgi.py，gunicorn 多個 worker）時的跨行程協調，用 data/cache/shared.db（SQLite WAL）：
+#   single_flight(key)：同一份資料／同一張圖同時只讓一個行程抓取或繪製，其他行程等它完成後直接讀快取；
+#   lock(key)：跨行程互斥鎖，例如 notify.py 的佇列檔讀改寫；
+#   pace(name, interval)：所有行程共用同一個 TWSE 請求時間槽，worker 變多也不會加快打上游的速度。
+# 快取內容本身仍放在 data/cache/ 與 output/ 的檔案，寫入一律先寫暫存檔再 os.replace，讀取端不會讀到寫一半的檔。
+import os
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.path.join("data", "cache", "shared.db")
+LEASE_SECONDS = 120        # 持有者當掉時，鎖最久保留這麼久
+POLL_SECONDS = 0.05
+
+_local = threading.local()
+
+
+def _conn():
+    """每個行程、每個執行緒各自的連線；fork 之後的子行程（或換了 DB_PATH）會重新連線。"""
+    pid = os.getpid()
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != pid or _local.path != DB_PATH:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS flights (key TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS slots (name TEXT PRIMARY KEY, next REAL)")
+        _local.conn, _local.pid, _local.path = conn, pid, DB_PATH
+    return conn
+
+
+def _owner():
+    return f"{os.getpid()}:{threading.get_ident()}"
+
+
+def _try_acquire(key, lease):
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM flights WHERE key = ? AND expires < ?", (key, now))
+        cur = conn.execute("INSERT OR IGNORE INTO flights (key, owner, expires) VALUES (?, ?, ?)",
+                           (key, _owner(), now + lease))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cur.rowcount == 1
+
+
+@contextmanager
+def single_flight(key, lease=LEASE_SECONDS):
+    """取得 key 的獨占權就 yield True；若已有其他行程在做，等它結束後 yield False，
+    呼叫端應先重新查快取，查不到再自己做。等待中對方的租約過期、由本呼叫接手時也 yield True。"""
+    acquired = _try_acquire(key, lease)
+    while not acquired:
+        time.sleep(POLL_SECONDS)
+        if not _conn().execute("SELECT 1 FROM flights WHERE key = ?", (key,)).fetchone():
+            break           # 對方做完了
+        acquired = _try_acquire(key, lease)
+    try:
+        yield acquired
+    finally:
+        _conn().execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, _owner()))
+
+
+@contextmanager
+def lock(key, lease=LEASE_SECONDS):
+    """跨行程互斥鎖：拿到 key 的租約才進入，離開時釋放；持有者當掉時租約到期後由下一個人接手。
+    同一個執行緒不可重入。"""
+    while not _try_acquire(key, lease):
+        time.sleep(POLL_SECONDS)
+    try:
+        yield
+    finally:
+        _conn().execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, _owner()))
+
+
+def pace(name, interval):
+    """跨行程的時間槽：回傳本次應等待的秒數，並把下一個槽往後推 interval。"""
+    conn = _conn()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT next FROM slots WHERE name = ?", (name,)).fetchone()
+        slot = max(now, row[0] if row else 0.0)
+        conn.execute("INSERT OR REPLACE INTO slots (name, next) VALUES (?, ?)", (name, slot + interval))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return slot - now
+
+
+def savefig(fig, path, **kwargs):
+    """先存到暫存檔再換名，多個 worker 同時讀寫同一張圖也不會拿到半張。"""
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+    fig.savefig(tmp, **kwargs)
+    os.replace(tmp, path)
+    return path
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# shares.py
+# 發行股數參考表：取自 store 裡最新一份 TWT38U（外資持股統計本來就附「發行股數」），
+# 存成 data/store/shares.csv，每 REFRESH_DAYS 天才重建一次；換手率、借券餘額占發行股數比
+# 都以這張表對 交易日 × 代號 的寬表一次向量化計算，不必再手動提供 float_shares。
+#
+#   python shares.py --refresh                         # 立即重建參考表
+#   python shares.py --lending --days 20 --top 20      # 全市場借券餘額占比最高的股票
+#   python shares.py --turnover 2382 1301 --days 20    # 指定股票的每日換手率
+import os
+import sys
+import time
+import argparse
+
+import schema
+import store
+import twse
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+REFRESH_DAYS = 7        # 發行股數只在增資、減資、轉換時才變，一週更新一次已足夠
+LOOKBACK = 10           # 往回找最近幾個平日的 TWT38U
+
+_memo = {}
+
+
+def _path():
+    return os.path.join(store.STORE_DIR, "shares.csv")
+
+
+def _stale(path):
+    return not os.path.exists(path) or time.time() - os.path.getmtime(path) > REFRESH_DAYS * 86400
+
+
+def refresh(end=None):
+    """由最近一份有「發行股數」的 TWT38U 重建參考表；找不到就保留舊表，回傳 None。"""
+    for ds in reversed(store.weekdays(LOOKBACK, end)):
+        try:
+            df = store.ingest('TWT38U', ds)
+        except (twse.TWSEUnavailable, schema.SchemaDrift, ValueError):
+            continue
+        if df is None or '發行股數' not in df:
+            continue
+        out = df[['發行股數']][df['發行股數'] > 0].copy()
+        out['資料日期'] = ds
+        path = _path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        out.to_csv(tmp, encoding="utf-8-sig")
+        os.replace(tmp, path)
+        _memo.clear()
+        return out
+    return None
+
+
+def table():
+    """代號 → 發行股數（int64）；表過期時先嘗試重建。"""
+    path = _path()
+    if _stale(path):
+        refresh()
+    if not os.path.exists(path):
+        return pd.Series(dtype='int64', name='發行股數')
+    mtime = os.path.getmtime(path)
+    if _memo.get(path, (None,))[0] != mtime:
+        df = pd.read_csv(path, dtype={'代號': str, '資料日期': str}, encoding="utf-8-sig", index_col='代號')
+        _memo[path] = (mtime, df['發行股數'].astype('int64'))
+    return _memo[path][1]
+
+
+def lookup(stock):
+    n = table().get(str(stock))
+    return int(n) if n is not None else None
+
+
+def turnover(volume, shares=None):
+    """換手率（%）：volume 為 交易日 × 代號 的成交量寬表（張）。"""
+    shares = table() if shares is None else shares
+    return (volume * 1000).div(shares.reindex(volume.columns), axis=1).mul(100).astype('float32')
+
+
+def lending_ratio(balance, shares=None):
+    """借券餘額占發行股數（%）：balance 為借券餘額寬表（股）。"""
+    shares = table() if shares is None else shares
+    return balance.div(shares.reindex(balance.columns), axis=1).mul(100).astype('float32')
+
+
+def _wide(frames, col):
+    rows = {pd.Timestamp(ds): df[col] for ds, df in sorted(frames.items()) if df is not None}
+    wide = pd.DataFrame(rows).T
+    wide.index = pd.DatetimeIndex(wide.index, name='date')
+    return wide
+
+
+def lending_panel(days):
+    """全市場每日借券餘額占發行股數（%），交易日 × 代號。"""
+    return store.derived('TWT93U', 'lending_pct', days,
+                         lambda: lending_ratio(_wide(store.ingest_many('TWT93U', days), '借券餘額')))
+
+
+def turnover_panel(stocks, days):
+    """指定股票的每日換手率（%）；成交量取自 indicators 的 OHLCV 寬表。"""
+    import indicators
+    return turnover(indicators.panel(stocks, days)['ohlcv']['成交量'])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="發行股數參考表、換手率與借券占比")
+    ap.add_argument("--refresh", action="store_true", help="立即重建參考表")
+    ap.add_argument("--lending", action="store_true", help="全市場借券餘額占發行股數排行")
+    ap.add_argument("--turnover", nargs="+", metavar="STOCK", help="指定股票的每日換手率")
+    ap.add_argument("--days", type=int, default=20, help="最近幾個平日")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 --days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    if args.refresh:
+        out = refresh(store.parse_day(args.end))
+        if out is None:
+            print(f"❌ 最近 {LOOKBACK} 個平日都沒有 TWT38U 發行股數，保留舊表")
+            return 1
+        print(f"✅ 發行股數參考表：{len(out)} 檔（{out['資料日期'].iloc[0]}）→ {_path()}")
+    days = store.span(args.days, args.start, args.end)
+    if args.lending:
+        pct = lending_panel(days)
+        if pct.empty:
+            print("❌ 沒有任何 TWT93U 資料")
+            return 1
+        last = pct.iloc[-1].dropna().nlargest(args.top)
+        print(f"📊 {pct.index[-1]:%Y-%m-%d} 借券餘額占發行股數最高：")
+        print(last.to_string(float_format=lambda v: f"{v:.2f}%"))
+    if args.turnover:
+        rates = turnover_panel(args.turnover, days)
+        print(rates.to_string(float_format=lambda v: f"{v:.2f}%"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
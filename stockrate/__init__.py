@@ -0,0 +1,17 @@
+# stockrate：抓取、解析、繪圖的核心函式庫，不依賴 Flask。
+# pandas、matplotlib 在第一次用到時才載入（stockrate.lazy），
+# 命令列程式與批次程式 import 後可以馬上開始工作，不必先等重量級套件載入。
+#
+#   from stockrate import institutional
+#   df = institutional.fetch_institutional_data(dates, "2382")
+import importlib
+
+_SUBMODULES = ("institutional", "lazy", "plotting")
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,296 @@
+# stockrate/institutional.py
+# 三大法人買賣超（T86）與個股日成交（STOCK_DAY）的抓取、解析與繪圖，原本放在 app.py；
+# daily_foreign_analysis.py、pipeline.py 等不需要 Flask 的程式直接從這裡 import。
+import io
+import os
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+import datasets
+import metrics
+import schema
+import shared
+import twse
+from stockrate.lazy import lazy_import
+from stockrate.plotting import Sampler, figwidth, pyplot, shade_gaps
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+FLOW_COLUMNS = ['外資', '投信', '自營商']
+
+def get_trading_days(n, end=None):
+    days = []
+    dt = end or datetime.date.today()
+    while len(days) < n:
+        if dt.weekday() < 5:
+            days.append(dt.strftime("%Y%m%d"))
+        dt -= datetime.timedelta(days=1)
+    return list(reversed(days))
+
+@metrics.timed('parse_t86')
+def parse_institutional(resp, stock_no):
+    j = resp.json()
+    if j.get('stat') != 'OK':
+        return None
+    if not j.get('fields'):
+        return None
+    ex = schema.extractor('T86', j['fields'])
+    row = ex.find(j.get('data', []), stock_no)
+    if row is None:
+        return None
+    # 外資、投信、自營商（張）
+    return tuple(int(str(ex.get(row, c)).replace(',', '')) // 1000 for c in FLOW_COLUMNS)
+
+@metrics.timed('fetch_institutional')
+def fetch_institutional_data(dates, stock_no):
+    """逐日解析後直接填進 int32 陣列，不再為每一天建一個 dict。"""
+    flows = np.zeros((len(dates), len(FLOW_COLUMNS)), dtype=np.int32)
+    got = np.zeros(len(dates), dtype=bool)
+    missing = []
+    api = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
+    for i, d in enumerate(dates):
+        try:
+            rec = parse_institutional(twse.get(api.format(d), timeout=5), stock_no)
+        except (twse.TWSEUnavailable, schema.SchemaDrift, ValueError):
+            missing.append(d)
+            continue
+        if rec is None:
+            continue
+        flows[i] = rec
+        got[i] = True
+    twse.report_missing('T86', missing)
+    index = pd.DatetimeIndex(pd.to_datetime(np.asarray(dates, dtype=object)[got], format="%Y%m%d"), name='date')
+    df = pd.DataFrame(flows[got], columns=FLOW_COLUMNS, index=index).sort_index()
+    df.attrs['missing'] = missing
+    return df
+
+@metrics.timed('parse_stock_day')
+def parse_price_csv(raw):
+    lines = raw.splitlines()
+    header = next(i for i, ln in enumerate(lines) if '日期' in ln)
+    df = pd.read_csv(io.StringIO('\n'.join(lines[header:])), encoding='big5')
+    df.columns = [c.strip() for c in df.columns]
+    df = df[df['日期'].astype(str).str.match(r'^\d{3}/\d{1,2}/\d{1,2}$')]
+    ymd = df['日期'].str.split('/', expand=True).astype(int)
+    return datasets.typed(pd.DataFrame({
+        'date': pd.to_datetime(pd.DataFrame({'year': ymd[0] + 1911, 'month': ymd[1], 'day': ymd[2]})),
+        **datasets.ohlcv(df),
+    }))
+
+@metrics.timed('fetch_price')
+def fetch_price_data(dates, stock_no):
+    # 如果前端一开始就没给 days，dates 可能为空
+    if not dates:
+        return pd.DataFrame()
+
+    months = sorted({pd.to_datetime(d, format='%Y%m%d').strftime('%Y%m01') for d in dates})
+    records, missing = [], []
+    for m in months:
+        url = f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={stock_no}"
+        try:
+            raw = twse.get(url, timeout=5).text
+        except twse.TWSEUnavailable:
+            missing.append(m[:6])
+            continue
+        try:
+            records.append(parse_price_csv(raw))
+        except schema.SchemaDrift:
+            missing.append(m[:6])
+        except (StopIteration, KeyError, ValueError):
+            continue   # 该月无交易资料（例如尚未开盘的月份）
+    twse.report_missing('STOCK_DAY', missing)
+
+    # 如果一条都没抓到，直接返回空 DF
+    if not records:
+        dfp = pd.DataFrame()
+    else:
+        dfp = pd.concat(records)\
+                .drop_duplicates('date')\
+                .set_index('date')\
+                .sort_index()
+    dfp.attrs['missing'] = missing
+    return dfp
+
+def iter_records(dates, stock_no, workers=4, deadline=None):
+    """边抓边产出：每一天的 T86、每个月的 STOCK_DAY 一抓完就 yield，不等最慢的那个。
+    产出 ('price', 日期, 收盘价, 成交量)、('institutional', 日期, (外资, 投信, 自营商) 或 None)、
+    ('missing', 端点, 键)。股价只有几个月份，先送出请求，页面可以先画出价格线。
+    给了 deadline（twse.deadline()）时，期限到了对还没回来的各产出一笔 ('late', 端点, 键) 后结束，
+    那些请求留在背景继续跑，完成后照常写入快取。"""
+    api = twse.BASE_URL + "/fund/T86?response=json&date={}&selectType=ALL"
+    wanted = set(dates)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {}
+    for m in sorted({d[:6] for d in dates}):
+        futures[pool.submit(twse.get, datasets.stock_day_url(stock_no, m), timeout=5)] = ('STOCK_DAY', m)
+    for d in dates:
+        futures[pool.submit(twse.get, api.format(d), timeout=5)] = ('T86', d)
+    missing = {'T86': [], 'STOCK_DAY': []}
+    timed_out = False
+    try:
+        for fut in _completed(futures, deadline):
+            if fut is None:
+                timed_out = True
+                for f, (endpoint, key) in futures.items():
+                    if not f.done():
+                        yield ('late', endpoint, key)
+                return
+            endpoint, key = futures[fut]
+            try:
+                r = fut.result()
+                if endpoint == 'T86':
+                    yield ('institutional', key, parse_institutional(r, stock_no))
+                    continue
+                df = parse_price_csv(r.text)
+            except (twse.TWSEUnavailable, schema.SchemaDrift, StopIteration, KeyError, ValueError):
+                missing[endpoint].append(key)
+                yield ('missing', endpoint, key)
+                continue
+            for ts, close, vol in zip(df['date'], df['收盤價'], df['成交量']):
+                ds = ts.strftime('%Y%m%d')
+                if ds in wanted:
+                    yield ('price', ds, None if close != close else float(close), int(vol))
+    finally:
+        # 浏览器中途离开时不再等剩下的请求；逾时的则让它们在背景做完、写进快取
+        pool.shutdown(wait=False, cancel_futures=not timed_out)
+        for endpoint, keys in missing.items():
+            twse.report_missing(endpoint, keys)
+
+def _completed(futures, deadline):
+    """as_completed 加上期限：逾时时产出 None 后结束。"""
+    try:
+        yield from as_completed(futures, timeout=twse.remaining(deadline))
+    except FuturesTimeout:
+        yield None
+
+@metrics.timed('fetch_within')
+def fetch_within(dates, stock_no, deadline=None):
+    """期限内抓得到的法人与股价，依 dates 排好（没抓到的日子为 NaN）；
+    attrs['late'] 是逾时仍在背景抓取的日期，attrs['missing'] 是重试后仍失败的。"""
+    flows, prices, late, missing = {}, {}, set(), set()
+    months = {}
+    for d in dates:
+        months.setdefault(d[:6], []).append(d)
+    for rec in iter_records(dates, stock_no, deadline=deadline):
+        kind = rec[0]
+        if kind == 'institutional' and rec[2] is not None:
+            flows[rec[1]] = rec[2]
+        elif kind == 'price':
+            prices[rec[1]] = rec[2:]
+        elif kind in ('late', 'missing'):
+            keys = months.get(rec[2], []) if rec[1] == 'STOCK_DAY' else [rec[2]]
+            (late if kind == 'late' else missing).update(keys)
+    index = pd.DatetimeIndex(pd.to_datetime(dates, format="%Y%m%d"), name='date')
+    df = pd.DataFrame({
+        **{c: [flows[d][i] if d in flows else np.nan for d in dates] for i, c in enumerate(FLOW_COLUMNS)},
+        '收盤價': [prices[d][0] if d in prices else np.nan for d in dates],
+        '成交量': [prices[d][1] if d in prices else np.nan for d in dates],
+    }, index=index)
+    # 两边都没有的日子（假日）不留空位；只缺一边的保留为 NaN，图上标出缺口
+    df = df[df.notna().any(axis=1) | index.strftime('%Y%m%d').isin(late | missing)]
+    df.attrs['late'] = sorted(late)
+    df.attrs['missing'] = sorted(missing - late)
+    return df
+
+@metrics.timed('render')
+def plot_institutional_chart(df, stock_no, days, filepath, dpi=300):
+    plt = pyplot()
+    fig, ax1 = plt.subplots(figsize=(figwidth(len(df)), 5))
+    s = Sampler(len(df))
+
+    ax1.plot(*s.line(df['外資'].values), label='外資', color='blue')
+    ax1.plot(*s.line(df['投信'].values), label='投信', color='orange', linestyle='--')
+    ax1.plot(*s.line(df['自營商'].values), label='自營商', color='green', linestyle=':')
+    ax1.set_ylabel("法人買賣超 (張)")
+    ax1.grid(True, linestyle="--", alpha=0.3)
+
+    ax2 = ax1.twinx()
+    ax2.plot(*s.line(df['收盤價'].values), color='red', label='收盤價')
+    ax2.set_ylabel("收盤價", color='red')
+    ax2.tick_params(axis='y', labelcolor='red')
+
+    ax3 = ax1.twinx()
+    ax3.spines['right'].set_position(('outward',60))
+    bx, bh, bw = s.bar(df['成交量'].values)
+    ax3.bar(bx, bh, color='gray', alpha=0.3, width=bw)
+    ax3.set_ylabel("成交量 (張)" if not s.active else "成交量 (張，區間日均)", color='gray')
+    ax3.tick_params(axis='y', labelcolor='gray')
+
+    ticks = s.ticks()
+    ax1.set_xticks(ticks)
+    ax1.set_xticklabels([df.index[i].strftime("%m/%d") for i in ticks], rotation=45, fontsize=8)
+    ax1.set_xlim(-0.5, len(df)-0.5)
+    shade_gaps(ax1, df[['外資', '收盤價']].isna().any(axis=1).values)
+
+    lines1, lbls1 = ax1.get_legend_handles_labels()
+    lines2, lbls2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines1+lines2, lbls1+lbls2, loc='upper left')
+
+    plt.title(f"{stock_no}｜法人買賣超、收盤價、成交量（近{days}交易日）")
+    fig.tight_layout()
+
+    with metrics.stage('savefig'):
+        shared.savefig(fig, filepath, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return filepath
+
+
+# ─── 持股比率、千張大戶（原本在 fetch_and_plot.py、app_bwi_full.py）───
+def plot_holdings_chart(df, stock_no, fig_path, dpi=300):
+    """三大法人持股比率與收盤價；df 以日期為索引。"""
+    plt = pyplot()
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+    ax1.plot(df.index, df['外資持股比率'], label='外資持股比率', linewidth=2)
+    ax1.plot(df.index, df['投信持股比率'], label='投信持股比率', linewidth=2)
+    ax1.plot(df.index, df['自營商持股比率'], label='自營商持股比率', linewidth=2)
+    ax1.set_ylabel('持股比率 (%)')
+    ax1.legend(loc='upper left')
+
+    ax2 = ax1.twinx()
+    ax2.plot(df.index, df['收盤價'], label='收盤價', color='black', linestyle='--')
+    ax2.set_ylabel('收盤價 (元)')
+    ax2.legend(loc='upper right')
+
+    plt.title(f"{stock_no} 三大法人持股比率與收盤價")
+    fig.autofmt_xdate()
+
+    os.makedirs(os.path.dirname(fig_path) or '.', exist_ok=True)
+    shared.savefig(fig, fig_path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return fig_path
+
+
+@metrics.timed('render')
+def plot_thousand_chart(stock_id, dates, thousand_ratios, foreigns, trusts, dealers, prices, chart_path, dpi=None,
+                        gaps=()):
+    """千張大戶持股比例、三大法人累積買賣超與收盤價；gaps 為資料未到的日期（灰底）。"""
+    plt = pyplot()
+    import matplotlib.ticker as mticker
+    fig, ax1 = plt.subplots(figsize=(12, 6))
+    ax2 = ax1.twinx()
+    s = Sampler(len(dates))
+
+    ax1.plot(*s.line(pd.Series(thousand_ratios, dtype=float)), label='千張大戶比例(%)',
+             marker=None if s.active else 'o')
+    ax1.plot(*s.line(pd.Series(foreigns, dtype=float).cumsum()), label='外資持股變動(累積張)', linestyle='--')
+    ax1.plot(*s.line(pd.Series(trusts, dtype=float).cumsum()), label='投信持股變動(累積張)', linestyle='--')
+    ax1.plot(*s.line(pd.Series(dealers, dtype=float).cumsum()), label='自營商持股變動(累積張)', linestyle='--')
+    ax1.set_ylabel('持股比例 / 持股變動')
+    ax1.legend(loc='upper left')
+
+    ax2.plot(*s.line(pd.Series(prices, dtype=float)), label='收盤價', color='black')
+    ax2.set_ylabel('股價')
+    ax2.yaxis.set_major_formatter(mticker.FuncFormatter(lambda x, _: f'{x:.0f}'))
+
+    ticks = s.ticks(40)
+    ax1.set_xticks(ticks)
+    ax1.set_xticklabels([dates[i][4:] for i in ticks], rotation=45)
+    shade_gaps(ax1, [d in set(gaps) for d in dates])
+    ax1.set_title(f"{stock_id}｜千張大戶與三大法人比較")
+
+    fig.tight_layout()
+    with metrics.stage('savefig'):
+        shared.savefig(fig, chart_path, dpi=dpi)
+    plt.close(fig)
+    return chart_path
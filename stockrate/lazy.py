@@ -0,0 +1,18 @@
+# stockrate/lazy.py
+# 延遲載入：lazy_import("pandas") 先放一個空殼模組，第一次存取屬性時才真正執行 import。
+import sys
+import importlib.util
+
+
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,105 @@
+# stockrate/plotting.py
+# matplotlib 的共用設定；第一次要畫圖時才載入 pyplot。
+_pyplot = None
+
+
+def pyplot(backend="Agg"):
+    """載入並設定 pyplot（中文字型、負號）。backend=None 保留 matplotlib 預設的互動視窗。"""
+    global _pyplot
+    if _pyplot is None:
+        import matplotlib
+        if backend:
+            matplotlib.use(backend)   # 使用非 GUI 後端，避免 RuntimeError
+        import matplotlib.pyplot as plt
+        plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
+        plt.rcParams['axes.unicode_minus'] = False
+        _pyplot = plt
+    return _pyplot
+
+
+# ─── 長期間的圖：降採樣、標籤疏化、圖寬上限 ─────────────
+# 圖寬原本隨天數線性成長、每天一個標籤，1000 天的圖有上千個 artist，存檔要幾分鐘；
+# 超過 MAX_POINTS 點時折線改用 LTTB 取點（保留高低點與轉折）、長條按區間取每日平均，
+# 標籤最多 MAX_LABELS 個，圖寬不超過 MAX_WIDTH 吋，繪圖時間不再隨天數成長。
+MAX_POINTS = 300
+MAX_LABELS = 60
+MAX_WIDTH = 24
+
+
+def figwidth(n, per_day=0.24, base=12):
+    return min(max(base, n * per_day), MAX_WIDTH)
+
+
+def lttb(y, n_out):
+    """Largest-Triangle-Three-Buckets：回傳要保留的索引（含頭尾），缺值以線性內插參與計算。"""
+    import numpy as np
+    y = np.asarray(y, dtype='float64')
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    ok = ~np.isnan(y)
+    if not ok.any():
+        return np.linspace(0, n - 1, n_out).astype(int)
+    x = np.arange(n, dtype='float64')
+    y = np.interp(x, x[ok], y[ok])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nxt_lo, nxt_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[nxt_lo:max(nxt_hi, nxt_lo + 1)].mean(), y[nxt_lo:max(nxt_hi, nxt_lo + 1)].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+class Sampler:
+    """依天數決定怎麼畫：n <= max_points 時原樣輸出；超過時折線取 LTTB 點、長條依區間取每日平均。
+    x 一律是原本的交易日序號，不同序列（折線、長條）仍對齊同一條 x 軸。"""
+
+    def __init__(self, n, max_points=MAX_POINTS):
+        import numpy as np
+        self.n = n
+        self.active = n > max_points
+        self.max_points = max_points
+        if self.active:
+            self.starts = np.unique(np.linspace(0, n, max_points + 1).astype(int)[:-1])
+        else:
+            self.starts = np.arange(n)
+        self.sizes = np.diff(np.append(self.starts, n))
+
+    def line(self, y):
+        """回傳 (x, y)。"""
+        import numpy as np
+        y = np.asarray(y, dtype='float64')
+        idx = lttb(y, self.max_points) if self.active else np.arange(self.n)
+        return idx, y[idx]
+
+    def bar(self, y, width=0.6):
+        """回傳 (x, 每區間的每日平均, 寬度)；未降採樣時就是每天一根。"""
+        import numpy as np
+        y = np.nan_to_num(np.asarray(y, dtype='float64'))
+        if not self.active:
+            return np.arange(self.n), y, width
+        mean = np.add.reduceat(y, self.starts) / self.sizes
+        return self.starts + (self.sizes - 1) / 2, mean, self.sizes * width
+
+    def ticks(self, max_labels=MAX_LABELS):
+        """要標日期的 x 位置（等距疏化）。"""
+        step = max(1, -(-self.n // max_labels))
+        return list(range(0, self.n, step))
+
+
+def shade_gaps(ax, mask, label='資料未到'):
+    """把 mask 為 True 的連續區段塗成灰底（逾時或抓取失敗的日子），每段一個 artist。"""
+    import numpy as np
+    mask = np.asarray(mask, dtype=bool)
+    if not mask.any():
+        return 0
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(int), [0]))))
+    for i, (start, stop) in enumerate(zip(edges[::2], edges[1::2])):
+        ax.axvspan(start - 0.5, stop - 0.5, color='gray', alpha=0.15, label=label if i == 0 else None)
+    return len(edges) // 2
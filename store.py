@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# store.py
+# 全市場每日資料的本地歷史：每個資料集（T86／TWT38U／BWIBBU_d／TWT93U）每個交易日只下載一次，
+# 解析成精簡型別（datasets.DTYPES）存到 data/store/<資料集>/<YYYYMMDD>.pkl。
+# 之後任何股票、任何天數都是本地切片，不必再為每一檔重抓整份全市場檔案。
+#
+# 已入庫的日期另有排序索引（index()），任意區間用二分搜尋切出（window()），不必逐日檢查檔案或連網。
+# 查無資料的日期留一個空的 <YYYYMMDD>.none 紀錄檔：假日永久不再下載，尚未公布的依 twse.nodata_expires()
+# 過一陣子再問，歷史區間裡的假日不必每次連網確認。
+#
+#   python store.py BWIBBU_d --days 250        # 補齊最近 250 個平日
+#   python store.py T86 BWIBBU_d --days 60
+#   python store.py T86 --start 20240701 --end 20240930
+import os
+import sys
+import bisect
+import argparse
+import datetime
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import datasets
+import schema
+import twse
+from stockrate.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+STORE_DIR = os.path.join("data", "store")
+DEFAULT_WORKERS = 4
+PKL, NONE = ".pkl", ".none"     # 入庫的資料、查無資料的紀錄
+
+_index = {}                     # (STORE_DIR, 資料集, 副檔名) → 日期的排序 list
+_index_lock = threading.Lock()
+DERIVED_MEMO = 32               # 記憶體裡留幾份已存檔的衍生結果
+_memo = OrderedDict()           # derived 檔案路徑 → 結果；只放已存檔（不會再變）的
+_memo_lock = threading.Lock()
+
+
+def _path(dataset, ds, ext=PKL):
+    return os.path.join(STORE_DIR, dataset, f"{ds}{ext}")
+
+
+def has(dataset, ds):
+    return os.path.exists(_path(dataset, ds))
+
+
+def load(dataset, ds):
+    """讀出某天的全市場 frame；沒有存檔回傳 None。讀過的留在記憶體，呼叫端不要就地修改。"""
+    if not has(dataset, ds):
+        return None
+    return _read(dataset, ds)
+
+
+@functools.lru_cache(maxsize=2048)
+def _read(dataset, ds):
+    return pd.read_pickle(_path(dataset, ds))
+
+
+def save(dataset, ds, df):
+    path = _path(dataset, ds)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+    _read.cache_clear()
+    _remember(dataset, ds)
+    try:
+        os.remove(_path(dataset, ds, NONE))
+    except OSError:
+        pass
+    return path
+
+
+def mark_nodata(dataset, ds):
+    """記下 ds 查無資料（紀錄檔的修改時間就是問到的時間）。"""
+    path = _path(dataset, ds, NONE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w"):
+        pass
+    _remember(dataset, ds, NONE)
+
+
+def nodata_since(dataset, ds):
+    try:
+        return os.path.getmtime(_path(dataset, ds, NONE))
+    except OSError:
+        return None
+
+
+def known_empty(dataset, ds):
+    """ds 查無資料的紀錄是否仍有效：假日永遠有效，尚未公布的到 twse.nodata_expires() 為止。"""
+    return twse.nodata_fresh(dataset, ds, nodata_since(dataset, ds))
+
+
+def settled(dataset, ds):
+    """ds 不會再變：已入庫，或確定沒有資料（假日）。"""
+    if has(dataset, ds):
+        return True
+    since = nodata_since(dataset, ds)
+    return since is not None and twse.nodata_expires(dataset, ds, datetime.datetime.fromtimestamp(since)) is None
+
+
+def all_settled(dataset, days):
+    """days 每一天都不會再變；中途抓取失敗（重試用盡、欄位變動）而沒入庫的日期不算。"""
+    if not days:
+        return True
+    stored = set(window(dataset, min(days), max(days)))
+    return all(ds in stored or settled(dataset, ds) for ds in days)
+
+
+def _remember(dataset, ds, ext=PKL):
+    with _index_lock:
+        idx = _index.get((STORE_DIR, dataset, ext))
+        if idx is not None:
+            i = bisect.bisect_left(idx, ds)
+            if i == len(idx) or idx[i] != ds:
+                idx.insert(i, ds)
+
+
+def dates(dataset, ext=PKL):
+    """已存檔的日期（YYYYMMDD），由舊到新；ext=NONE 時列出記過查無資料的日期。"""
+    folder = os.path.join(STORE_DIR, dataset)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:8] for f in os.listdir(folder) if f.endswith(ext))
+
+
+def index(dataset, ext=PKL):
+    """已入庫日期的排序索引：第一次用時讀一次目錄，之後由 save() 以二分插入維護。呼叫端不要修改。"""
+    key = (STORE_DIR, dataset, ext)
+    with _index_lock:
+        if key not in _index:
+            _index[key] = dates(dataset, ext)
+        return _index[key]
+
+
+def window(dataset, start, end, ext=PKL):
+    """已入庫、介於 start 與 end（YYYYMMDD，含）之間的日期；二分搜尋，O(log n) 加上切片長度。"""
+    idx = index(dataset, ext)
+    with _index_lock:
+        return idx[bisect.bisect_left(idx, start):bisect.bisect_right(idx, end)]
+
+
+def ingest(dataset, ds):
+    """有存檔就直接讀；沒有才下載整個市場並存檔。查無資料（假日、尚未公布）回傳 None，只留紀錄檔。
+    fetcher 只有在 TWSE 明確回覆查無資料時才回傳 None；空白、不完整的回應會丟出例外，不留紀錄、下次重抓。"""
+    df = load(dataset, ds)
+    if df is not None:
+        _remember(dataset, ds)      # 別的行程存的檔
+        return df
+    if known_empty(dataset, ds):
+        return None
+    df = datasets.FETCHERS[dataset](ds)
+    if df is not None:
+        save(dataset, ds, df)
+    else:
+        mark_nodata(dataset, ds)
+    return df
+
+
+def _todo(dataset, days):
+    """days 中尚未入庫、也沒有有效查無資料紀錄的日期；用排序索引切出區間比對，不逐日查檔。"""
+    if not days:
+        return []
+    lo, hi = min(days), max(days)
+    skip = set(window(dataset, lo, hi))
+    skip.update(ds for ds in window(dataset, lo, hi, NONE) if ds not in skip and known_empty(dataset, ds))
+    return [ds for ds in days if ds not in skip]
+
+
+def ingest_many(dataset, days, workers=DEFAULT_WORKERS):
+    """回傳 {YYYYMMDD: frame 或 None}；重試後仍取不到的日期列為缺漏。"""
+    frames, missing = {}, []
+    todo = _todo(dataset, days)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {ds: pool.submit(ingest, dataset, ds) for ds in todo}
+        for ds, fut in futures.items():
+            try:
+                fut.result()
+            except (twse.TWSEUnavailable, schema.SchemaDrift, ValueError):
+                missing.append(ds)
+    twse.report_missing(dataset, missing)
+    for ds in days:
+        frames[ds] = load(dataset, ds)
+    return frames
+
+
+def ingest_within(dataset, days, deadline):
+    """網頁用的 ingest_many：期限（twse.deadline()）到了就回傳，沒抓完的日期在背景繼續入庫。
+    回傳 ({YYYYMMDD: frame 或 None}, 逾時的日期)。"""
+    todo = _todo(dataset, days)
+    results, late = twse.within({ds: (ingest, dataset, ds) for ds in todo}, deadline)
+    missing = []
+    for ds, r in results.items():
+        if isinstance(r, (twse.TWSEUnavailable, schema.SchemaDrift, ValueError)):
+            missing.append(ds)
+        elif isinstance(r, Exception):
+            raise r
+    twse.report_missing(dataset, missing)
+    return {ds: None if ds in late else load(dataset, ds) for ds in days}, late
+
+
+def series(dataset, stock, days, deadline=None):
+    """單一股票在 days 的各欄位，以 date 為索引；缺的日期先補抓整個市場。
+    給了 deadline 時，逾時仍在補抓的日期列在 attrs['late']。"""
+    if deadline is None:
+        return datasets.select(ingest_many(dataset, days), stock)
+    frames, late = ingest_within(dataset, days, deadline)
+    df = datasets.select(frames, stock)
+    df.attrs['late'] = late
+    return df
+
+
+def history(dataset, days):
+    """全市場長表（date、代號、各欄位），見 datasets.stack()。"""
+    return datasets.stack(ingest_many(dataset, days))
+
+
+def derived(dataset, name, days, build, final=None):
+    """由已存檔的每日資料衍生的結果（寬表、指標…），存在 data/store/derived/。
+    過去的交易日不會再變，同一組日期算過一次就永久有效；只要有一天尚未入庫（還沒公布、抓取失敗）
+    就只算不存，下次重新補抓；確定沒有資料的假日不影響存檔。
+    不在 store 裡的資料集（STOCK_DAY）由 final(結果) 判斷是否已包含最後一天。
+    已存檔的結果另外留在記憶體（最近 DERIVED_MEMO 份），只算不存的每次重算，公布後就會補進來。
+    呼叫端不要就地修改回傳的結果。"""
+    days = list(days)
+    path = os.path.join(STORE_DIR, "derived", dataset, f"{name}_{days[0]}_{days[-1]}_{len(days)}.pkl")
+    with _memo_lock:
+        if path in _memo:
+            _memo.move_to_end(path)
+            return _memo[path]
+    if os.path.exists(path):
+        return _keep(path, pd.read_pickle(path))
+    obj = build()
+    if (final(obj) if final else all_settled(dataset, days)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        pd.to_pickle(obj, tmp)
+        os.replace(tmp, path)
+        _keep(path, obj)
+    return obj
+
+
+def _keep(path, obj):
+    with _memo_lock:
+        _memo[path] = obj
+        while len(_memo) > DERIVED_MEMO:
+            _memo.popitem(last=False)
+    return obj
+
+
+def parse_day(s):
+    """YYYYMMDD 或 YYYY-MM-DD（網頁的日期欄位）→ date；空字串回傳 None。"""
+    s = (s or "").strip().replace("-", "").replace("/", "")
+    return datetime.datetime.strptime(s, "%Y%m%d").date() if s else None
+
+
+def between(start, end):
+    """start 到 end（date，含）之間的平日（YYYYMMDD），由舊到新。"""
+    out, dt = [], start
+    while dt <= end:
+        if dt.weekday() < 5:
+            out.append(dt.strftime("%Y%m%d"))
+        dt += datetime.timedelta(days=1)
+    return out
+
+
+def span(n=None, start=None, end=None):
+    """CLI 與網頁共用的日期範圍：給了 start 就取 start～end 之間的平日，否則取到 end 為止的最近 n 個平日。
+    start、end 為 date 或 YYYYMMDD 字串，end 預設今天。"""
+    start = parse_day(start) if isinstance(start, str) else start
+    end = (parse_day(end) if isinstance(end, str) else end) or datetime.date.today()
+    if start:
+        if start > end:
+            raise ValueError(f"起始日 {start} 晚於結束日 {end}")
+        return between(start, end)
+    return weekdays(n, end)
+
+
+def weekdays(n, end=None):
+    out = []
+    dt = end or datetime.date.today()
+    while len(out) < n:
+        if dt.weekday() < 5:
+            out.append(dt.strftime("%Y%m%d"))
+        dt -= datetime.timedelta(days=1)
+    return list(reversed(out))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="補齊全市場每日資料的本地歷史")
+    ap.add_argument("datasets", nargs="+", choices=datasets.DAILY)
+    ap.add_argument("--days", type=int, default=60, help="最近幾個平日")
+    ap.add_argument("--start", help="第一天 YYYYMMDD；給了就不看 --days")
+    ap.add_argument("--end", help="最後一天 YYYYMMDD（預設今天）")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = ap.parse_args(argv)
+
+    days = span(args.days, args.start, args.end)
+    for dataset in args.datasets:
+        before = len(dates(dataset))
+        frames = ingest_many(dataset, days, args.workers)
+        got = sum(1 for df in frames.values() if df is not None)
+        empty = sum(1 for ds in days if frames[ds] is None and known_empty(dataset, ds))
+        print(f"✅ {dataset}：{days[0]} → {days[-1]} 有資料 {got} 天，新增 {len(dates(dataset)) - before} 天"
+              + (f"，查無資料 {empty} 天" if empty else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,8 @@
 # fetch_price_test.py
-import requests, io
+import io
 import pandas as pd
-import datetime, time
+import datetime
+import twse
 
 DAYS = 60  # 或其他你要的天數
 
@@ -12,9 +13,9 @@ def fetch_price_data():
     months = sorted({(today - datetime.timedelta(days=30*i)).strftime('%Y%m01') for i in range((DAYS//20)+2)})
     dfs = []
     for m in months:
-        url = f"https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
+        url = f"{twse.BASE_URL}/exchangeReport/STOCK_DAY?response=csv&date={m}&stockNo={STOCK_NO}"
         try:
-            r = requests.get(url)
+            r = twse.get(url)
             df = pd.read_csv(io.StringIO(r.text), skiprows=1, encoding='big5')
             df = df[df.columns[:9]]
             df.columns = [c.strip() for c in df.columns]
@@ -27,7 +28,6 @@ def fetch_price_data():
             dfs.append(df[['date','收盤價','成交量']])
         except Exception as e:
             print(f"⚠️ {m} 發生錯誤：", e)
-        time.sleep(0.1)
     if dfs:
         return pd.concat(dfs).drop_duplicates('date').set_index('date').sort_index()
     return pd.DataFrame()
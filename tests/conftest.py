@@ -0,0 +1,6 @@
+# tests/conftest.py
+# 測試從專案根目錄 import 各模組（專案是平放的腳本，不是套件）。
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
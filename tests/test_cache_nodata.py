@@ -0,0 +1,82 @@
+# tests/test_cache_nodata.py
+# 只有 TWSE 明確回覆「查無資料」才記住；空白、截斷的回應當作暫時錯誤，不進快取、不留紀錄。
+import json
+
+import pytest
+
+import cache
+import datasets
+import store
+import twse
+import twse_replay
+
+BWIBBU_URL = f"{twse.BASE_URL}/fund/BWIBBU_d?response=csv&date=20240115&selectType=ALL"
+BWIBBU_CSV = twse_replay.synth_bwibbu("20240115", ["2330", "2317"])
+T86_OK = {"stat": "OK", "fields": ["證券代號"], "data": [["2330"]]}
+T86_NODATA = {"stat": "很抱歉，沒有符合條件的資料!"}
+
+
+class Upstream:
+    """依網址回應預先排好的內容，並記錄被呼叫的次數。"""
+
+    def __init__(self, monkeypatch, replies):
+        self.replies = replies
+        self.calls = []
+        monkeypatch.setattr(twse.requests, "get", self.get)
+
+    def get(self, url, **kwargs):
+        self.calls.append(url)
+        queue = self.replies[twse.endpoint_of(url)]
+        body = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(body, dict):
+            body = json.dumps(body, ensure_ascii=False)
+        return cache.CachedResponse(url, 200, body.encode("utf-8"), encoding="utf-8")
+
+    def count(self, endpoint):
+        return sum(1 for u in self.calls if twse.endpoint_of(u) == endpoint)
+
+
+@pytest.fixture(autouse=True)
+def sandbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache, "ENABLED", True)
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(twse.governor, "shared", False)
+
+
+def test_empty_body_is_not_cached(monkeypatch):
+    up = Upstream(monkeypatch, {"BWIBBU_d": ["", BWIBBU_CSV], "T86": [T86_OK]})
+
+    with pytest.raises(ValueError):
+        store.ingest("BWIBBU_d", "20240115")      # 交易日卻回空白：算抓取失敗
+    assert store.nodata_since("BWIBBU_d", "20240115") is None
+    assert cache.lookup(BWIBBU_URL) is None
+
+    df = store.ingest("BWIBBU_d", "20240115")
+    assert list(df.index) == ["2330", "2317"]
+    assert up.count("BWIBBU_d") == 2
+
+
+def test_positive_nodata_is_remembered(monkeypatch):
+    up = Upstream(monkeypatch, {"T86": [T86_NODATA]})
+
+    assert store.ingest("T86", "20240113") is None
+    assert store.ingest("T86", "20240113") is None
+    assert store.nodata_since("T86", "20240113") is not None
+    assert up.count("T86") == 1
+
+
+def test_empty_csv_on_closed_day_is_nodata(monkeypatch):
+    up = Upstream(monkeypatch, {"BWIBBU_d": [""], "T86": [T86_NODATA]})
+
+    assert store.ingest("BWIBBU_d", "20240113") is None     # 休市：T86 明確回覆查無資料
+    assert store.ingest("BWIBBU_d", "20240113") is None
+    assert up.count("BWIBBU_d") == 1
+
+
+def test_unexpected_stat_is_an_error():
+    assert cache.nodata_stat(T86_NODATA["stat"])
+    with pytest.raises(ValueError):
+        datasets.parse_t86({"stat": "系統忙碌中，請稍後再試"})
+    r = cache.CachedResponse("x", 200, b'{"stat": "OK", "data": [')
+    assert not cache.empty(r) and not cache.complete(r)
@@ -0,0 +1,16 @@
+# tests/test_holdings_panel.py
+import pandas as pd
+
+import holdings
+
+
+def test_change_leaves_memo_untouched():
+    idx = pd.DatetimeIndex(pd.to_datetime(["20240108", "20240109", "20240110"]), name="date")
+    ratios = {c: pd.DataFrame({"2330": [70.0, 70.5, 71.0]}, index=idx, dtype="float32") for c in holdings.RATIOS}
+    memo = holdings.Panel(ratios).changes
+    saved = dict(memo)
+
+    p = holdings.Panel(ratios, memo)
+    assert p.change(2)["2330"].iloc[-1] == 1.0
+    p.trend("2330", n=2)
+    assert set(memo) == set(saved)           # n=2 沒有寫回快取
@@ -0,0 +1,41 @@
+# tests/test_indicators_final.py
+# 最後一天是假日（沒有收盤價）時，公布時間過了結果仍要存檔；還沒公布的只算不存。
+import pandas as pd
+import pytest
+
+import datasets
+import indicators
+import store
+import twse
+
+DAYS = ("20240208", "20240209")      # 0209 是春節休市
+
+
+@pytest.fixture
+def builds(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path))
+    monkeypatch.setattr(store, "_memo", type(store._memo)())
+    calls = []
+
+    def ohlcv_panel(stocks, days, failed=None):
+        calls.append(days)
+        idx = pd.DatetimeIndex([pd.Timestamp(DAYS[0])], name="date")
+        return {c: pd.DataFrame({s: [100.0] for s in stocks}, index=idx) for c in datasets.OHLCV}
+
+    monkeypatch.setattr(indicators, "ohlcv_panel", ohlcv_panel)
+    return calls
+
+
+def test_holiday_last_day_is_final(builds, monkeypatch):
+    monkeypatch.setattr(twse, "latest_published", lambda endpoint, now=None: "20240215")
+    indicators.panel(["2330"], DAYS)
+    store._memo.clear()
+    indicators.panel(["2330"], DAYS)
+    assert len(builds) == 1
+
+
+def test_unpublished_last_day_is_rebuilt(builds, monkeypatch):
+    monkeypatch.setattr(twse, "latest_published", lambda endpoint, now=None: "20240208")
+    indicators.panel(["2330"], DAYS)
+    indicators.panel(["2330"], DAYS)
+    assert len(builds) == 2
@@ -0,0 +1,57 @@
+# tests/test_notify_queue.py
+# 兩個 Queue 共用同一個佇列檔（模擬兩個 worker 行程）：各自的修改都要留在檔案裡。
+import json
+
+import pytest
+
+import notify
+import shared
+
+
+class Broken:
+    def send(self, text, images):
+        raise notify.DeliveryError("down")
+
+
+class Sink:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, text, images):
+        self.sent.append(text)
+
+
+@pytest.fixture
+def path(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "DB_PATH", str(tmp_path / "shared.db"))
+    return str(tmp_path / "queue.json")
+
+
+def _saved(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_workers_do_not_overwrite_each_other(path):
+    a = notify.Queue(Sink(), path=path, digest_size=10)
+    b = notify.Queue(Sink(), path=path, digest_size=10)
+    a.put("2330", "institutional")
+    b.put("2382", "institutional")
+    a.put("1301", "holdings")
+    assert [it["stock"] for it in _saved(path)["pending"]] == ["2330", "2382", "1301"]
+
+
+def test_failed_items_matched_by_id(path):
+    a = notify.Queue(Broken(), path=path, digest_size=10, max_attempts=1)
+    b = notify.Queue(Sink(), path=path, digest_size=10)
+    a.put("2330", "institutional")
+    b.put("2382", "institutional")          # a 送出前由另一個行程加入
+    a.flush(force=True)
+    saved = _saved(path)
+    assert {it["stock"] for it in saved["dead"]} == {"2330", "2382"}
+    assert saved["pending"] == []
+
+    a.transport = Sink()
+    assert a.retry_dead() == 2
+    assert a.flush(force=True) == 1
+    assert _saved(path)["pending"] == [] and a.transport.sent
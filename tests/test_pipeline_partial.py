@@ -0,0 +1,50 @@
+# tests/test_pipeline_partial.py
+# 有日期抓取失敗（attrs['missing']）的資料只畫 partial，不寫出正式檔名，之後也不會被當成畫好的圖。
+import os
+
+import pandas as pd
+import pytest
+
+import pipeline
+
+DATES = ("20240112", "20240115")
+
+
+@pytest.fixture(autouse=True)
+def output(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "OUTPUT_DIR", str(tmp_path))
+
+
+def _plot(data, path, dpi):
+    with open(path, "wb") as f:
+        f.write(b"png")
+    return path
+
+
+def _data(**attrs):
+    df = pd.DataFrame({"外資": [1.0, None]}, index=pd.DatetimeIndex(DATES))
+    df.attrs.update(attrs)
+    return df
+
+
+def test_missing_dates_render_partial():
+    path, state = pipeline.progressive("institutional", "2330", DATES,
+                                       lambda: _data(late=[], missing=["20240115"]), _plot)
+    assert state == "partial"
+    assert path == pipeline.chart_path("institutional", "2330", DATES, partial=True)
+    assert not os.path.exists(pipeline.chart_path("institutional", "2330", DATES))
+    assert pipeline.prerendered("institutional", "2330", DATES) is None
+
+
+def test_complete_data_renders_full():
+    path, state = pipeline.progressive("institutional", "2330", DATES, lambda: _data(late=[], missing=[]), _plot)
+    assert state == "preview"
+    pipeline._pending[pipeline.chart_path("institutional", "2330", DATES)].result(5)
+    assert pipeline.prerendered("institutional", "2330", DATES)
+
+
+def test_partial_paths():
+    full = pipeline.chart_path("borrow", "2330", DATES)
+    assert pipeline.chart_path("borrow", "2330", DATES, "partial") == pipeline.chart_path("borrow", "2330", DATES,
+                                                                                          partial=True)
+    assert pipeline.chart_path("borrow", "2330", DATES, "export", partial=True) != full
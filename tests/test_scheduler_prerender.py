@@ -0,0 +1,43 @@
+# tests/test_scheduler_prerender.py
+# 預熱時有資料抓取失敗：不留下圖檔、不通知，留到下次輪詢重畫。
+import os
+
+import pytest
+
+import notify
+import pipeline
+import scheduler
+
+DAY = "20240119"
+SCHED = {"float_shares": {}}
+
+
+@pytest.fixture
+def sent(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "OUTPUT_DIR", str(tmp_path))
+    out = []
+    monkeypatch.setattr(notify, "enqueue", lambda *a, **kw: out.append(a))
+    return out
+
+
+def _run(partial):
+    def run(stock, days, charts, end=None, **opts):
+        path = pipeline.chart_path(charts[0], stock, pipeline.window(days, end=end), partial=partial)
+        with open(path, "wb") as f:
+            f.write(b"png")
+        return {charts[0]: path}
+    return run
+
+
+def test_partial_render_is_retried(sent, monkeypatch):
+    monkeypatch.setattr(pipeline, "run", _run(partial=True))
+    assert scheduler.prerender(("2330", "institutional", 10), DAY, SCHED) is False
+    assert os.listdir(pipeline.OUTPUT_DIR) == []
+    assert sent == []
+
+
+def test_complete_render_is_done(sent, monkeypatch):
+    monkeypatch.setattr(pipeline, "run", _run(partial=False))
+    assert scheduler.prerender(("2330", "institutional", 10), DAY, SCHED) is True
+    assert pipeline.prerendered("institutional", "2330", pipeline.window(10, end=DAY))
+    assert len(sent) == 1
@@ -0,0 +1,48 @@
+# tests/test_shared.py
+import threading
+import time
+
+import shared
+
+
+def _flights():
+    return shared._conn().execute("SELECT key, owner FROM flights").fetchall()
+
+
+def _hold(key, lease, entered, release):
+    with shared.single_flight(key, lease=lease) as owner:
+        assert owner
+        entered.set()
+        release.wait(5)
+
+
+def test_holder_releases_mid_wait(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "DB_PATH", str(tmp_path / "shared.db"))
+    entered, release = threading.Event(), threading.Event()
+    t = threading.Thread(target=_hold, args=("k", 60, entered, release))
+    t.start()
+    assert entered.wait(5)
+    threading.Timer(0.2, release.set).start()
+
+    with shared.single_flight("k") as owner:
+        assert owner is False       # 對方做完了，呼叫端重新查快取
+    t.join(5)
+    assert _flights() == []
+
+
+def test_takes_over_expired_lease(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "DB_PATH", str(tmp_path / "shared.db"))
+    entered, release = threading.Event(), threading.Event()
+    t = threading.Thread(target=_hold, args=("k", 0.2, entered, release))
+    t.start()
+    assert entered.wait(5)
+
+    t0 = time.time()
+    with shared.single_flight("k") as owner:
+        assert owner is True        # 租約過期後由這次呼叫接手
+        assert len(_flights()) == 1
+    assert time.time() - t0 < 5
+    assert _flights() == []
+    release.set()
+    t.join(5)
+    assert _flights() == []
@@ -0,0 +1,26 @@
+# tests/test_trace_summary.py
+import io
+
+import trace_summary
+
+RECORDS = [
+    {"run": "r1", "kind": "run_start", "name": "daily", "ts": "2025-04-25T17:00:00"},
+    {"run": "r1", "kind": "missing_dates", "stock_no": "2382", "dates": ["20250424"]},
+    {"run": "r1", "kind": "missing", "endpoint": "T86", "keys": ["20250424", "20250425"], "reason": None},
+    {"run": "r1", "kind": "missing", "endpoint": "TWT93U", "keys": ["20250425"], "reason": "存檔無法解析"},
+    {"run": "r2", "kind": "run_start", "name": "daily", "ts": "2025-04-26T17:00:00"},
+    {"run": "r2", "kind": "missing", "endpoint": "T86", "keys": ["20250425"], "reason": None},
+]
+
+
+def test_missing_events_grouped_by_endpoint_and_reason():
+    *_, missing, failures = trace_summary.summarize(RECORDS)
+    assert set(missing) == {"20250424"}
+    assert failures[("T86", "重試後仍失敗")] == {"keys": {"20250424", "20250425"}, "runs": {"r1", "r2"}}
+    assert failures[("TWT93U", "存檔無法解析")]["keys"] == {"20250425"}
+
+    out = io.StringIO()
+    trace_summary.report(RECORDS, out=out)
+    text = out.getvalue()
+    assert "缺漏日期" in text and "取得失敗（依端點與原因）" in text
+    assert "存檔無法解析：20250425" in text
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# trace_summary.py
+# 彙整 logs/trace/*.jsonl：列出各次執行、最慢的端點、最慢的日期、各階段耗時與取得失敗的項目。
+#
+#   python trace_summary.py              # 全部紀錄
+#   python trace_summary.py --last       # 只看最近一次執行
+#   python trace_summary.py --since 20250501 --top 20
+import os
+import sys
+import json
+import argparse
+from collections import defaultdict
+
+import tracelog
+
+
+def load(trace_dir, since=None, last=False):
+    if not os.path.isdir(trace_dir):
+        return []
+    files = sorted(f for f in os.listdir(trace_dir) if f.endswith('.jsonl'))
+    if since:
+        files = [f for f in files if f[:8] >= since]
+    if last:
+        files = files[-1:]
+    records = []
+    for f in files:
+        with open(os.path.join(trace_dir, f), encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue   # 執行中斷時最後一行可能不完整
+    return records
+
+
+def pct(values, q):
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = (len(s) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(s) - 1)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def summarize(records):
+    runs = {}
+    by_endpoint = defaultdict(list)
+    by_date = defaultdict(list)
+    by_stage = defaultdict(list)
+    missing = defaultdict(set)
+    failures = defaultdict(lambda: {'keys': set(), 'runs': set()})   # (端點, 原因) → 失敗的日期／月份與執行
+    for r in records:
+        kind = r.get('kind')
+        if kind == 'run_start':
+            runs[r['run']] = {'run': r['run'], 'name': r.get('name'), 'start': r['ts'], 'status': 'incomplete'}
+        elif kind == 'run_end':
+            runs.setdefault(r['run'], {'run': r['run'], 'name': r.get('name'), 'start': ''}).update(
+                status=r.get('status'), duration=r.get('duration'),
+                requests=r.get('requests'), failed=r.get('failed_requests'))
+        elif kind == 'request':
+            by_endpoint[r.get('endpoint')].append(r)
+            if r.get('date'):
+                by_date[r['date']].append(r)
+        elif kind == 'stage':
+            by_stage[r.get('stage')].append(r.get('duration', 0.0))
+        elif kind == 'missing_dates':
+            for d in r.get('dates', []):
+                missing[d].add(r['run'])
+        elif kind == 'missing':     # twse.report_missing()
+            f = failures[(r.get('endpoint'), r.get('reason') or '重試後仍失敗')]
+            f['keys'].update(r.get('keys', []))
+            f['runs'].add(r.get('run'))
+    return runs, by_endpoint, by_date, by_stage, missing, dict(failures)
+
+
+def report(records, top=10, out=sys.stdout):
+    runs, by_endpoint, by_date, by_stage, missing, failures = summarize(records)
+    p = lambda *a: print(*a, file=out)
+
+    p(f"▶️ 執行紀錄 {len(runs)} 次")
+    for r in sorted(runs.values(), key=lambda r: r['start']):
+        dur = r.get('duration')
+        p(f"  {r['run']:<24} {r.get('name') or '':<24} {r['status']:<10} "
+          f"{(f'{dur:.1f}s' if dur is not None else '-'):>9} "
+          f"請求 {r.get('requests', '-')} / 失敗 {r.get('failed', '-')}")
+
+    p("\n▶️ 端點（依 p95 排序）")
+    p(f"  {'endpoint':<12}{'count':>7}{'fail':>6}{'retries':>9}{'p50(s)':>9}{'p95(s)':>9}{'max(s)':>9}{'total(s)':>10}{'avg KB':>9}")
+    rows = []
+    for ep, reqs in by_endpoint.items():
+        d = [x.get('duration', 0.0) for x in reqs]
+        rows.append((pct(d, 0.95), ep, reqs, d))
+    for p95, ep, reqs, d in sorted(rows, key=lambda t: t[0], reverse=True)[:top]:
+        fail = sum(1 for x in reqs if not x.get('ok'))
+        retries = sum(x.get('retries', 0) for x in reqs)
+        kb = sum(x.get('bytes', 0) for x in reqs) / len(reqs) / 1024
+        p(f"  {ep:<12}{len(reqs):>7}{fail:>6}{retries:>9}{pct(d, 0.5):>9.2f}{p95:>9.2f}"
+          f"{max(d):>9.2f}{sum(d):>10.1f}{kb:>9.1f}")
+
+    p(f"\n▶️ 最慢的日期（前 {top}，依該日請求總耗時）")
+    p(f"  {'date':<10}{'requests':>9}{'fail':>6}{'retries':>9}{'max(s)':>9}{'total(s)':>10}  slowest endpoint")
+    rows = []
+    for ds, reqs in by_date.items():
+        total = sum(x.get('duration', 0.0) for x in reqs)
+        rows.append((total, ds, reqs))
+    for total, ds, reqs in sorted(rows, key=lambda t: t[0], reverse=True)[:top]:
+        worst = max(reqs, key=lambda x: x.get('duration', 0.0))
+        fail = sum(1 for x in reqs if not x.get('ok'))
+        retries = sum(x.get('retries', 0) for x in reqs)
+        p(f"  {ds:<10}{len(reqs):>9}{fail:>6}{retries:>9}{worst.get('duration', 0.0):>9.2f}{total:>10.2f}"
+          f"  {worst.get('endpoint')}")
+
+    if by_stage:
+        p("\n▶️ 處理階段")
+        p(f"  {'stage':<26}{'count':>7}{'p50(s)':>9}{'p95(s)':>9}{'max(s)':>9}")
+        for st, d in sorted(by_stage.items(), key=lambda kv: sum(kv[1]), reverse=True):
+            p(f"  {st:<26}{len(d):>7}{pct(d, 0.5):>9.3f}{pct(d, 0.95):>9.3f}{max(d):>9.3f}")
+
+    if missing:
+        p("\n⚠️ 缺漏日期（出現在幾次執行）")
+        for ds in sorted(missing):
+            p(f"  {ds}  ×{len(missing[ds])}")
+
+    if failures:
+        p("\n⚠️ 取得失敗（依端點與原因）")
+        p(f"  {'endpoint':<12}{'keys':>6}{'runs':>6}  reason / keys")
+        for (ep, reason), f in sorted(failures.items(), key=lambda kv: len(kv[1]['keys']), reverse=True):
+            keys = sorted(f['keys'])
+            shown = ', '.join(keys[:top]) + (f" …（另 {len(keys) - top} 筆）" if len(keys) > top else '')
+            p(f"  {ep or '-':<12}{len(keys):>6}{len(f['runs']):>6}  {reason}：{shown}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="彙整批次追蹤紀錄")
+    ap.add_argument('--dir', default=tracelog.TRACE_DIR)
+    ap.add_argument('--since', help="只看此日期(YYYYMMDD)之後的執行")
+    ap.add_argument('--last', action='store_true', help="只看最近一次執行")
+    ap.add_argument('--top', type=int, default=10)
+    args = ap.parse_args(argv)
+
+    records = load(args.dir, args.since, args.last)
+    if not records:
+        print(f"❌ {args.dir} 沒有追蹤紀錄")
+        return 1
+    report(records, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# tracelog.py
+# 批次執行的結構化追蹤紀錄（JSON Lines）。每次執行寫一個檔：logs/trace/<run_id>.jsonl，
+# 每行一筆：run_start / request（一次上游請求）/ stage（一個處理階段）/ run_end。
+# twse.get() 與 metrics.stage() 會在有執行中的 run 時自動寫入；用 trace_summary.py 彙整。
+import os
+import json
+import time
+import socket
+import datetime
+import threading
+from contextlib import contextmanager
+
+TRACE_DIR = os.path.join("logs", "trace")
+
+_lock = threading.Lock()      # 寫檔與計數共用；iter_records 的執行緒池、背景抓取會同時呼叫
+_run = None
+
+
+class _Run:
+    def __init__(self, name, meta):
+        now = datetime.datetime.now()
+        self.name = name
+        self.id = f"{now.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.t0 = time.perf_counter()
+        self.path = os.path.join(TRACE_DIR, f"{self.id}.jsonl")
+        self.requests = 0
+        self.failures = 0
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        self.fh = open(self.path, "a", encoding="utf-8")
+        self.write("run_start", name=name, host=socket.gethostname(), **meta)
+
+    def write(self, kind, **fields):
+        rec = {"ts": datetime.datetime.now().isoformat(timespec="milliseconds"),
+               "run": self.id, "kind": kind}
+        rec.update(fields)
+        line = json.dumps(rec, ensure_ascii=False, default=str)
+        with _lock:
+            if self.fh.closed:      # run 結束後才回來的背景請求
+                return
+            self.fh.write(line + "\n")
+            self.fh.flush()
+
+    def count(self, ok):
+        with _lock:
+            self.requests += 1
+            if not ok:
+                self.failures += 1
+
+    def close(self):
+        with _lock:
+            self.fh.close()
+
+
+def active():
+    return _run is not None
+
+
+@contextmanager
+def run(name, **meta):
+    """包住一次批次執行；結束時寫 run_end（含狀態、總耗時、請求與失敗數）。
+    已在某個 run 之內時直接沿用，不另開檔。"""
+    global _run
+    if _run is not None:
+        yield _run
+        return
+    r = _Run(name, meta)
+    _run = r
+    status, error = "ok", None
+    try:
+        yield r
+    except BaseException as e:
+        status, error = "error", repr(e)
+        raise
+    finally:
+        with _lock:
+            requests, failures = r.requests, r.failures
+        r.write("run_end", name=name, status=status, error=error,
+                duration=round(time.perf_counter() - r.t0, 6),
+                requests=requests, failed_requests=failures)
+        r.close()
+        _run = None
+
+
+def request(endpoint, url, date=None, status=None, nbytes=0, duration=0.0, retries=0, error=None):
+    r = _run
+    if r is None:
+        return
+    ok = error is None and isinstance(status, int) and status < 400
+    r.count(ok)
+    r.write("request", endpoint=endpoint, date=date, status=status, bytes=nbytes,
+            duration=round(duration, 6), retries=retries, ok=ok, error=error, url=url)
+
+
+def stage(name, duration, **fields):
+    r = _run
+    if r is None:
+        return
+    r.write("stage", stage=name, duration=round(duration, 6), **fields)
+
+
+def event(kind, **fields):
+    """其他需要留底的事件，例如缺漏的日期。"""
+    r = _run
+    if r is not None:
+        r.write(kind, **fields)
@@ -0,0 +1,364 @@
+# twse.py
+# TWSE 站台設定：所有腳本組網址時都用 twse.BASE_URL，
+# 所有請求都經過 twse.get()：統一計時與追蹤，並由共用的 Governor 調節請求速率、
+# 重試暫時性錯誤，上游明顯故障時暫停所有呼叫端（斷路器）；
+# 可用環境變數 TWSE_BASE_URL 或 config.json 的 twse_base_url 指向本地替身伺服器（twse_standin.py）。
+import os
+import json
+import time
+import datetime
+import random
+import threading
+from urllib.parse import urlparse, parse_qs
+
+import cache
+import metrics
+import shared
+import tracelog
+from stockrate.lazy import lazy_import
+
+requests = lazy_import("requests")
+
+DEFAULT_BASE_URL = "https://www.twse.com.tw"
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+
+def _load_config():
+    try:
+        with open(CONFIG_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _base_url():
+    url = os.environ.get("TWSE_BASE_URL") or _load_config().get("twse_base_url") or DEFAULT_BASE_URL
+    return url.rstrip("/")
+
+
+BASE_URL = _base_url()
+
+# 速率調節參數，可用 config.json 的 twse_governor 覆寫
+GOVERNOR_DEFAULTS = {
+    "interval": 0.1,          # 起始請求間隔（秒）
+    "min_interval": 0.02,     # 回應正常時最快的間隔
+    "max_interval": 10.0,     # 被限流時最慢的間隔
+    "speedup": 0.9,           # 每次成功，間隔乘上此值
+    "slowdown": 2.0,          # 每次失敗／被擋，間隔乘上此值
+    "max_retries": 4,
+    "backoff_base": 0.5,      # 重試退避：0 ~ backoff_base * 2^n 之間隨機
+    "backoff_cap": 30.0,
+    "breaker_threshold": 5,   # 連續失敗幾次就打開斷路器
+    "breaker_cooldown": 30.0, # 斷路器打開後暫停的秒數，再次失敗會加倍
+    "breaker_cooldown_cap": 300.0,
+    "timeout": 10,
+    "shared": False,          # 多個 worker 共用請求時間槽（wsgi.py 會打開）
+}
+
+# 各資料集收盤後大約的公布時間（台北時間），可用 config.json 的 twse_publish_times 覆寫。
+# 排程器在這之後才開始輪詢；快取依此判斷當月 STOCK_DAY 何時會多一筆。
+PUBLISH_TIMES = {
+    "STOCK_DAY": "14:30",
+    "T86": "16:30",
+    "TWT38U": "16:30",
+    "BWIBBU_d": "17:00",
+    "TWT93U": "22:30",        # 晚間 20:30、22:30 各更新一次，以第二次為準
+}
+PUBLISH_TIMES.update(_load_config().get("twse_publish_times", {}))
+
+
+def published_at(endpoint, ds):
+    """ds（YYYYMMDD）當天該端點預計公布的時間。"""
+    hh, mm = PUBLISH_TIMES[endpoint].split(":")
+    return datetime.datetime.strptime(ds, "%Y%m%d").replace(hour=int(hh), minute=int(mm))
+
+
+def latest_published(endpoint, now=None):
+    """最近一個應該已公布資料的平日（YYYYMMDD）；收盤公布前查詢就回前一個平日。"""
+    now = now or datetime.datetime.now()
+    d = now.date()
+    while d.weekday() >= 5 or published_at(endpoint, d.strftime("%Y%m%d")) > now:
+        d -= datetime.timedelta(days=1)
+    return d.strftime("%Y%m%d")
+
+
+def next_publish(endpoint, now=None):
+    """now 之後下一次公布的時間。"""
+    now = now or datetime.datetime.now()
+    d = now.date()
+    while d.weekday() >= 5 or published_at(endpoint, d.strftime("%Y%m%d")) <= now:
+        d += datetime.timedelta(days=1)
+    return published_at(endpoint, d.strftime("%Y%m%d"))
+
+
+# 「查無資料」也要記住，否則每次重新整理、每個網頁請求都會再問一次同樣問不到的日期：
+#   尚未公布：公布時間前記到公布時間為止；過了公布時間仍查無資料，每隔 retry 秒再問一次
+#             （比排程器的 poll_interval 短，排程器每次輪詢都會真的問到上游）
+#   確定沒有：公布時間過了 final_after 秒仍查無資料（國定假日、颱風假），或過去月份的 STOCK_DAY，永久有效
+# 可用 config.json 的 twse_nodata 覆寫。
+NODATA = {"retry": 240, "final_after": 8 * 3600}
+NODATA.update(_load_config().get("twse_nodata", {}))
+
+
+def nodata_expires(endpoint, ds, now=None):
+    """now 時問到 ds（YYYYMMDD）查無資料，這個結果可沿用到何時（epoch 秒）；None 表示永久（那天確定沒有資料）。"""
+    now = now or datetime.datetime.now()
+    retry = now + datetime.timedelta(seconds=NODATA["retry"])
+    if endpoint not in PUBLISH_TIMES or not ds:
+        return retry.timestamp()
+    if endpoint == "STOCK_DAY":     # 以月為單位：過去的月份不會再多資料，當月隨時可能出現第一筆
+        return None if ds[:6] < now.strftime("%Y%m") else retry.timestamp()
+    pub = published_at(endpoint, ds)
+    if now < pub:
+        return pub.timestamp()
+    final = pub + datetime.timedelta(seconds=NODATA["final_after"])
+    if now >= final:
+        return None
+    return min(retry, final).timestamp()
+
+
+def nodata_fresh(endpoint, ds, since):
+    """since（epoch 秒）記下的查無資料現在是否仍有效；since 為 None（沒記過）時回傳 False。"""
+    if since is None:
+        return False
+    expires = nodata_expires(endpoint, ds, datetime.datetime.fromtimestamp(since))
+    return expires is None or expires > time.time()
+
+
+RETRIES = metrics.Counter("stockrate_upstream_retries_total", "TWSE 請求重試次數", ("endpoint", "reason"))
+BREAKER_OPENS = metrics.Counter("stockrate_upstream_breaker_open_total", "斷路器打開次數")
+
+
+class TWSEUnavailable(Exception):
+    """重試用盡仍拿不到有效回應；呼叫端應記錄為缺漏日期，而不是默默略過。"""
+
+    def __init__(self, url, reason):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+
+class _Retryable(Exception):
+    def __init__(self, reason, response=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.response = response
+
+
+def is_block_page(r):
+    """TWSE 限流時回 HTTP 200 的 HTML 頁面；本程式用到的端點都只回 CSV 或 JSON。"""
+    ctype = r.headers.get("Content-Type", "").lower()
+    if "html" in ctype:
+        return True
+    head = r.content[:256].lstrip().lower()
+    return head.startswith(b"<!doctype html") or head.startswith(b"<html")
+
+
+class Governor:
+    """同一行程內所有執行緒共用的請求調節器。
+
+    每次請求前 acquire() 取得時間槽；成功時縮短間隔，失敗或遇到限流頁面時加長間隔。
+    連續失敗達門檻即打開斷路器，冷卻時間內所有呼叫端都會在 acquire() 等待。
+    shared=True 時時間槽改由 shared.pace() 跨行程分配，多個 worker 合計仍是同一個速率。
+    """
+
+    def __init__(self, **overrides):
+        cfg = dict(GOVERNOR_DEFAULTS)
+        cfg.update(overrides)
+        self.cfg = cfg
+        self.interval = cfg["interval"]
+        self.shared = cfg["shared"]
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._failures = 0
+        self._open_until = 0.0
+        self._cooldown = cfg["breaker_cooldown"]
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                paused = self._open_until - now
+                if paused <= 0:
+                    if self.shared:
+                        wait = shared.pace("twse", self.interval)
+                    else:
+                        slot = max(now, self._next_slot)
+                        self._next_slot = slot + self.interval
+                        wait = slot - now
+                    break
+            time.sleep(paused)   # 斷路器打開中：等冷卻結束再排隊
+        if wait > 0:
+            time.sleep(wait)
+
+    def success(self):
+        with self._lock:
+            self.interval = max(self.cfg["min_interval"], self.interval * self.cfg["speedup"])
+            self._failures = 0
+            self._cooldown = self.cfg["breaker_cooldown"]
+
+    def failure(self):
+        with self._lock:
+            self.interval = min(self.cfg["max_interval"], self.interval * self.cfg["slowdown"])
+            self._failures += 1
+            if self._failures >= self.cfg["breaker_threshold"]:
+                self._open_until = time.monotonic() + self._cooldown
+                self._cooldown = min(self.cfg["breaker_cooldown_cap"], self._cooldown * 2)
+                self._failures = 0
+                BREAKER_OPENS.inc()
+                print(f"⚠️ TWSE 連續失敗，暫停所有請求 {self._open_until - time.monotonic():.0f} 秒")
+
+    def backoff(self, attempt):
+        cap = min(self.cfg["backoff_cap"], self.cfg["backoff_base"] * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    @property
+    def breaker_open(self):
+        return self._open_until > time.monotonic()
+
+
+governor = Governor(**_load_config().get("twse_governor", {}))
+
+
+def _attempt(url, endpoint, kwargs):
+    t0 = time.perf_counter()
+    try:
+        r = requests.get(url, **kwargs)
+    except requests.RequestException as e:
+        metrics.observe_upstream(endpoint, "error", time.perf_counter() - t0)
+        raise _Retryable(type(e).__name__)
+    metrics.observe_upstream(endpoint, r.status_code, time.perf_counter() - t0)
+    if r.status_code == 429 or r.status_code >= 500:
+        raise _Retryable(f"HTTP {r.status_code}", r)
+    if r.status_code < 400 and is_block_page(r):
+        raise _Retryable("blocked", r)
+    return r
+
+
+def endpoint_of(url):
+    """URL 路徑最後一段即端點名稱，例如 /fund/T86 → T86。"""
+    return urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+def date_of(url):
+    return parse_qs(urlparse(url).query).get("date", [None])[0]
+
+
+def _expires(endpoint, url):
+    """當月的 STOCK_DAY 每天收盤後會多一筆，快取到下次公布為止；其餘已完整的回應不會再變。"""
+    if endpoint != "STOCK_DAY":
+        return None
+    month = (date_of(url) or "")[:6]
+    if month < datetime.date.today().strftime("%Y%m"):
+        return None
+    return next_publish(endpoint).timestamp()
+
+
+def get(url, retries=None, use_cache=True, **kwargs):
+    """requests.get 的替代品：經 Governor 排程、重試暫時性錯誤（連線錯誤、5xx、429、限流頁面），
+    記錄各端點的上游耗時，批次執行中另寫入追蹤紀錄。重試用盡時丟出 TWSEUnavailable。
+    已公布且完整的回應會存進 cache，之後同一網址直接讀檔；查無資料的回應依 nodata_expires() 暫存或永久記住。
+    多行程模式下同一網址同時只有一個行程下載。"""
+    endpoint = endpoint_of(url)
+    if not (use_cache and cache.ENABLED):
+        return _fetch(url, endpoint, retries, kwargs, store=False)
+    hit = cache.lookup(url)
+    metrics.cache_lookup("http", hit is not None)
+    if hit is not None:
+        return hit
+    if not governor.shared:
+        return _fetch(url, endpoint, retries, kwargs, store=True)
+    with shared.single_flight("http:" + url) as owner:
+        if not owner:
+            hit = cache.lookup(url)   # 其他 worker 剛下載完
+            if hit is not None:
+                return hit
+        return _fetch(url, endpoint, retries, kwargs, store=True)
+
+
+def _fetch(url, endpoint, retries, kwargs, store):
+    kwargs.setdefault("timeout", governor.cfg["timeout"])
+    max_retries = governor.cfg["max_retries"] if retries is None else retries
+    t0 = time.perf_counter()
+    attempt, status, nbytes, error = 0, "error", 0, None
+    try:
+        while True:
+            governor.acquire()
+            try:
+                r = _attempt(url, endpoint, kwargs)
+            except _Retryable as e:
+                governor.failure()
+                if e.response is not None:
+                    status = e.response.status_code
+                if attempt >= max_retries:
+                    error = e.reason
+                    raise TWSEUnavailable(url, e.reason)
+                RETRIES.inc(endpoint=endpoint, reason=e.reason)
+                attempt += 1
+                time.sleep(governor.backoff(attempt))
+                continue
+            governor.success()
+            status, nbytes = r.status_code, len(r.content)
+            if store and not cache.store(url, r, expires=_expires(endpoint, url)):
+                cache.store(url, r, expires=nodata_expires(endpoint, date_of(url)), nodata=True)
+            return r
+    finally:
+        tracelog.request(endpoint, url, date=date_of(url), status=status, nbytes=nbytes,
+                         duration=time.perf_counter() - t0, retries=attempt, error=error)
+
+
+def report_missing(endpoint, keys, reason=None):
+    """把重試後仍取不到的日期／月份印出並寫入追蹤紀錄，不讓缺漏被默默吞掉。"""
+    if not keys:
+        return
+    print(f"⚠️ {endpoint} 有 {len(keys)} 筆取得失敗：{', '.join(keys)}" + (f"（{reason}）" if reason else ""))
+    tracelog.event("missing", endpoint=endpoint, keys=list(keys), reason=reason)
+
+
+# ─── 網頁請求的時間上限 ─────────────────────────────
+# 網頁請求等上游的總時間（秒），config.json 的 request_deadline 可覆寫。
+# 期限到了就先用已抓到的部分畫圖；還沒回來的抓取留在背景執行緒繼續跑，完成後照常寫入快取，
+# 使用者稍後重新整理就會看到完整的圖。
+DEFAULT_DEADLINE = 20.0
+_background = None
+_background_lock = threading.Lock()
+
+
+def deadline(seconds=None):
+    """回傳期限的 time.monotonic() 時間點。"""
+    if seconds is None:
+        seconds = float(_load_config().get("request_deadline", DEFAULT_DEADLINE))
+    return time.monotonic() + seconds
+
+
+def remaining(deadline):
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def background():
+    """期限內沒做完的抓取在這個執行緒池裡繼續跑，不隨請求結束而取消。"""
+    global _background
+    with _background_lock:
+        if _background is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _background = ThreadPoolExecutor(max_workers=8, thread_name_prefix="twse-bg")
+    return _background
+
+
+def within(calls, deadline=None):
+    """calls 為 {key: (函式, 參數...)}，全部丟進背景執行緒池同時執行（速率仍由 governor 調節）。
+    回傳 (results, late)：results 是期限內完成的 {key: 結果或例外}，late 是逾時仍在背景執行的 key。"""
+    from concurrent.futures import wait
+    futures = {key: background().submit(fn, *args) for key, (fn, *args) in calls.items()}
+    wait(futures.values(), timeout=remaining(deadline))
+    results, late = {}, []
+    for key, fut in futures.items():
+        if not fut.done():
+            late.append(key)
+        elif fut.exception() is not None:
+            results[key] = fut.exception()
+        else:
+            results[key] = fut.result()
+    if late:
+        tracelog.event("deadline_exceeded", keys=[str(k) for k in late])
+    return results, late
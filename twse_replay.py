@@ -0,0 +1,240 @@
+# twse_replay.py
+# 離線重播 TWSE 回應：優先讀取 data/recorded/ 下錄存的原始回應，
+# 沒有錄存時依日期、股票代號產生格式一致的合成資料（固定亂數種子，可重現）。
+import os
+import re
+import json
+import random
+import zlib
+import datetime
+from urllib.parse import urlparse, parse_qs
+
+import archive
+import twse
+
+RECORDED_DIR = os.path.join('data', 'recorded')
+TWT93U_DIR = os.path.join('data', 'twt93u')
+DEFAULT_CODES = ['0050', '1101', '1301', '2002', '2317', '2330', '2382', '2412', '2454', '2881']
+
+T86_FIELDS = [
+    '證券代號', '證券名稱',
+    '外陸資買進股數(不含外資自營商)', '外陸資賣出股數(不含外資自營商)', '外陸資買賣超股數(不含外資自營商)',
+    '外資自營商買進股數', '外資自營商賣出股數', '外資自營商買賣超股數',
+    '投信買進股數', '投信賣出股數', '投信買賣超股數',
+    '自營商買賣超股數',
+    '自營商買進股數(自行買賣)', '自營商賣出股數(自行買賣)', '自營商買賣超股數(自行買賣)',
+    '自營商買進股數(避險)', '自營商賣出股數(避險)', '自營商買賣超股數(避險)',
+    '三大法人買賣超股數',
+]
+TWT38U_FIELDS = [
+    '證券代號', '證券名稱', '發行股數',
+    '外資及陸資尚可投資股數', '全體外資及陸資持有股數', '全體外資及陸資持股比率(%)',
+    '投信持股比率(%)', '自營商持股比率(%)',
+]
+STOCK_DAY_FIELDS = ['日期', '成交股數', '成交金額', '開盤價', '最高價', '最低價', '收盤價', '漲跌價差', '成交筆數']
+BWIBBU_FIELDS = ['證券代號', '證券名稱', '收盤價', '殖利率(%)', '股利年度', '本益比',
+                 '股價淨值比', '財報年/季', '千張大戶持股比率(%)', '千張大戶人數', '集保總張數']
+
+_codes_cache = None
+
+
+class ReplayResponse:
+    """模擬 requests.Response 的最小介面（status_code / ok / content / text / json）。"""
+
+    def __init__(self, url, status_code, content, encoding='utf-8', content_type='text/csv'):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = {'Content-Type': content_type}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def _rng(*parts):
+    return random.Random(zlib.crc32('|'.join(parts).encode('utf-8')))
+
+
+def _fmt(n):
+    return f"{int(n):,}"
+
+
+def _roc(d):
+    return f"{d.year - 1911}/{d.month:02d}/{d.day:02d}"
+
+
+def market_codes():
+    """全市場股票代號：取自最新一份 TWT93U 檔，沒有檔案時用內建清單。"""
+    global _codes_cache
+    if _codes_cache is not None:
+        return _codes_cache
+    codes = []
+    if os.path.isdir(TWT93U_DIR):
+        for f in reversed(archive.names(TWT93U_DIR, 'TWT93U_')):
+            text = archive.read(TWT93U_DIR, f).decode('cp950', errors='replace')
+            codes = re.findall(r'^=?"(\d\w{3,5})",', text, flags=re.M)
+            if codes:
+                break
+    _codes_cache = codes or list(DEFAULT_CODES)
+    return _codes_cache
+
+
+def is_trading_day(ds):
+    d = datetime.datetime.strptime(ds, '%Y%m%d').date()
+    return d.weekday() < 5
+
+
+# ─── 合成資料 ─────────────────────────────────────
+def synth_t86(ds, codes=None):
+    if not is_trading_day(ds):
+        return {'stat': '很抱歉，沒有符合條件的資料!'}
+    data = []
+    for code in codes or market_codes():
+        r = _rng('T86', ds, code)
+        fb, fs = r.randrange(0, 5_000_000), r.randrange(0, 5_000_000)
+        xb, xs = r.randrange(0, 50_000), r.randrange(0, 50_000)
+        ib, is_ = r.randrange(0, 800_000), r.randrange(0, 800_000)
+        db, ds_ = r.randrange(0, 600_000), r.randrange(0, 600_000)
+        hb, hs = r.randrange(0, 300_000), r.randrange(0, 300_000)
+        dealer = (db - ds_) + (hb - hs)
+        total = (fb - fs) + (xb - xs) + (ib - is_) + dealer
+        data.append([code, f'股票{code}',
+                     _fmt(fb), _fmt(fs), _fmt(fb - fs),
+                     _fmt(xb), _fmt(xs), _fmt(xb - xs),
+                     _fmt(ib), _fmt(is_), _fmt(ib - is_),
+                     _fmt(dealer),
+                     _fmt(db), _fmt(ds_), _fmt(db - ds_),
+                     _fmt(hb), _fmt(hs), _fmt(hb - hs),
+                     _fmt(total)])
+    return {'stat': 'OK', 'date': ds, 'title': f'{ds} 三大法人買賣超日報',
+            'fields': T86_FIELDS, 'data': data}
+
+
+def synth_twt38u(ds, codes=None):
+    if not is_trading_day(ds):
+        return {'stat': '很抱歉，沒有符合條件的資料!'}
+    data = []
+    for code in codes or market_codes():
+        base = _rng('TWT38U', code)
+        drift = _rng('TWT38U', ds, code)
+        issued = base.randrange(50_000_000, 5_000_000_000)
+        f_ratio = min(99.0, max(0.0, base.uniform(5, 75) + drift.uniform(-0.5, 0.5)))
+        data.append([code, f'股票{code}', _fmt(issued),
+                     _fmt(issued * (1 - f_ratio / 100) * 0.5), _fmt(issued * f_ratio / 100),
+                     f'{f_ratio:.2f}',
+                     f'{max(0.0, base.uniform(0, 8) + drift.uniform(-0.1, 0.1)):.2f}',
+                     f'{max(0.0, base.uniform(0, 3) + drift.uniform(-0.05, 0.05)):.2f}'])
+    return {'stat': 'OK', 'date': ds, 'title': f'{ds} 外資及陸資持股統計',
+            'fields': TWT38U_FIELDS, 'data': data}
+
+
+def synth_stock_day(stock, month_ds):
+    """整月 STOCK_DAY CSV（民國日期、千分位逗號），與 TWSE 下載格式相同。"""
+    first = datetime.datetime.strptime(month_ds[:6] + '01', '%Y%m%d').date()
+    r = _rng('STOCK_DAY', stock, first.strftime('%Y%m'))
+    price = _rng('STOCK_DAY', stock).uniform(20, 800)
+    lines = [f'"{first.year - 1911}年{first.month:02d}月 {stock} 股票{stock}           各日成交資訊"',
+             ','.join(f'"{c}"' for c in STOCK_DAY_FIELDS) + ',']
+    d = first
+    while d.month == first.month:
+        if d.weekday() < 5:
+            prev = price
+            price = max(1.0, price * (1 + r.gauss(0, 0.02)))
+            high = max(prev, price) * (1 + r.uniform(0, 0.01))
+            low = min(prev, price) * (1 - r.uniform(0, 0.01))
+            shares = r.randrange(200_000, 30_000_000)
+            row = [_roc(d), _fmt(shares), _fmt(shares * price), f'{prev:.2f}', f'{high:.2f}',
+                   f'{low:.2f}', f'{price:.2f}', f'{price - prev:+.2f}', _fmt(shares // 900)]
+            lines.append(','.join(f'"{v}"' for v in row) + ',')
+        d += datetime.timedelta(days=1)
+    lines += ['"說明:"', '"符號說明:+/-/X表示漲/跌/不比價"']
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def synth_bwibbu(ds, codes=None):
+    if not is_trading_day(ds):
+        return ''
+    d = datetime.datetime.strptime(ds, '%Y%m%d').date()
+    lines = [f'"{d.year - 1911}年{d.month:02d}月{d.day:02d}日 個股日本益比、殖利率及股價淨值比"',
+             ','.join(f'"{c}"' for c in BWIBBU_FIELDS) + ',']
+    for code in codes or market_codes():
+        base = _rng('BWIBBU', code)
+        drift = _rng('BWIBBU', ds, code)
+        ratio = min(99.0, max(0.0, base.uniform(20, 90) + drift.uniform(-0.3, 0.3)))
+        row = [code, f'股票{code}', f'{base.uniform(20, 800):.2f}', f'{base.uniform(0, 8):.2f}',
+               '113', f'{base.uniform(5, 40):.2f}', f'{base.uniform(0.5, 6):.2f}', '113/3',
+               f'{ratio:.2f}', _fmt(base.randrange(50, 5_000)), _fmt(base.randrange(10_000, 5_000_000))]
+        lines.append(','.join(f'"{v}"' for v in row) + ',')
+    lines.append('"備註:"')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+# ─── 錄存檔 ───────────────────────────────────────
+def recorded_path(endpoint, key, ext):
+    return os.path.join(RECORDED_DIR, endpoint, f'{key}.{ext}')
+
+
+def _read_recorded(endpoint, key, ext):
+    path = recorded_path(endpoint, key, ext)
+    if os.path.exists(path):
+        with open(path, 'rb') as fh:
+            return fh.read()
+    return None
+
+
+def payload(endpoint, params):
+    """回傳 (status_code, content_bytes, encoding, content_type)。"""
+    ds = params.get('date', '')
+    fmt = params.get('response', 'json')
+    if endpoint == 'T86' or endpoint == 'TWT38U':
+        raw = _read_recorded(endpoint, ds, fmt)
+        if raw is not None:
+            enc = 'utf-8' if fmt == 'json' else 'cp950'
+            return 200, raw, enc, 'application/json' if fmt == 'json' else 'text/csv'
+        body = synth_t86(ds) if endpoint == 'T86' else synth_twt38u(ds)
+        if fmt == 'csv':
+            return 200, _json_to_csv(body).encode('cp950', errors='replace'), 'cp950', 'text/csv'
+        return 200, json.dumps(body, ensure_ascii=False).encode('utf-8'), 'utf-8', 'application/json'
+    if endpoint == 'STOCK_DAY':
+        stock = params.get('stockNo', '')
+        key = f'{stock}_{ds[:6]}'
+        raw = _read_recorded(endpoint, key, 'csv')
+        if raw is None:
+            raw = synth_stock_day(stock, ds).encode('cp950')
+        return 200, raw, 'cp950', 'text/csv'
+    if endpoint == 'BWIBBU_d':
+        raw = _read_recorded(endpoint, ds, 'csv')
+        if raw is None:
+            raw = synth_bwibbu(ds).encode('cp950')
+        return 200, raw, 'cp950', 'text/csv'
+    if endpoint == 'TWT93U':
+        raw = _read_recorded(endpoint, ds, 'csv')
+        if raw is None:
+            raw = archive.read(TWT93U_DIR, f'TWT93U_{ds}.csv') or b''
+        return 200, raw, 'cp950', 'text/csv'
+    return 404, b'Not Found', 'utf-8', 'text/plain'
+
+
+def _json_to_csv(body):
+    if body.get('stat') != 'OK':
+        return ''
+    lines = [f'"{body["title"]}"', ','.join(f'"{c}"' for c in body['fields']) + ',']
+    lines += [','.join(f'"{v}"' for v in row) + ',' for row in body['data']]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def replay_get(url, params=None, **kwargs):
+    """可直接取代 requests.get 的重播函式。"""
+    q = {k: v[0] for k, v in parse_qs(urlparse(url).query).items()}
+    q.update(params or {})
+    status, content, encoding, ctype = payload(twse.endpoint_of(url), q)
+    return ReplayResponse(url, status, content, encoding, ctype)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# twse_standin.py
+# 本地 TWSE 替身伺服器：以 twse_replay 的錄存／合成資料回應
+# T86、STOCK_DAY、BWIBBU_d、TWT38U、TWT93U，可逐端點設定延遲、限流與錯誤注入，
+# 用來離線壓測 app.py 與每日批次，並重現 TWSE 高負載時回傳的「請求過於頻繁」頁面。
+#
+#   python twse_standin.py --port 8000 --latency T86=0.2-0.8 --rate-limit T86=3/5 --error STOCK_DAY=0.1:500
+#   set TWSE_BASE_URL=http://127.0.0.1:8000  (Linux: export TWSE_BASE_URL=...)
+#   python app.py
+#
+# 設定也可以放在 JSON 檔（--config standin.json），格式：
+#   {"T86": {"latency": "0.2-0.8", "rate_limit": "3/5", "block_seconds": 30,
+#            "error_rate": 0.1, "error_kind": "500"}}
+# 執行中可用 POST /__config 更新設定，GET /__stats 查看各端點計數。
+import time
+import json
+import random
+import argparse
+import threading
+from collections import defaultdict, deque
+
+from flask import Flask, Response, request, jsonify
+
+import twse_replay
+
+ENDPOINTS = ('T86', 'STOCK_DAY', 'BWIBBU_d', 'TWT38U', 'TWT93U')
+ERROR_KINDS = ('500', 'block', 'empty', 'stat', 'hang')
+
+# TWSE 被限流時回傳的是 HTTP 200 的 HTML 頁面，不是錯誤碼
+BLOCK_PAGE = """<html><head><meta charset="utf-8"><title>臺灣證券交易所</title></head>
+<body><h3>因為請求過於頻繁，您的網路位址已暫時被拒絕存取，請稍後再試。</h3></body></html>"""
+NO_DATA = {'stat': '很抱歉，沒有符合條件的資料!'}
+
+app = Flask(__name__)
+
+_lock = threading.Lock()
+_config = {ep: {} for ep in ENDPOINTS}
+_windows = defaultdict(deque)        # (endpoint, client) -> 最近請求時間
+_blocked_until = {}                  # (endpoint, client) -> 解除封鎖時間
+_stats = defaultdict(lambda: defaultdict(int))
+
+
+def parse_latency(spec):
+    """'0.3' 為固定秒數，'0.1-0.5' 為均勻分布區間。"""
+    if spec in (None, '', 0):
+        return 0.0, 0.0
+    if isinstance(spec, (int, float)):
+        return float(spec), float(spec)
+    lo, _, hi = str(spec).partition('-')
+    return float(lo), float(hi or lo)
+
+
+def parse_rate(spec):
+    """'3/5' 表示每個用戶端 5 秒內最多 3 次；'10' 表示每秒 10 次。"""
+    if spec in (None, '', 0):
+        return None
+    n, _, window = str(spec).partition('/')
+    return int(n), float(window or 1)
+
+
+def _throttled(ep, cfg):
+    rate = parse_rate(cfg.get('rate_limit'))
+    if rate is None:
+        return False
+    key = (ep, request.remote_addr)
+    now = time.monotonic()
+    with _lock:
+        if _blocked_until.get(key, 0) > now:
+            return True
+        win = _windows[key]
+        while win and now - win[0] > rate[1]:
+            win.popleft()
+        if len(win) >= rate[0]:
+            _blocked_until[key] = now + float(cfg.get('block_seconds', 0))
+            return True
+        win.append(now)
+    return False
+
+
+def _error_response(kind, fmt):
+    if kind == 'block':
+        return Response(BLOCK_PAGE, status=200, mimetype='text/html')
+    if kind == 'empty':
+        return Response(b'', status=200, mimetype='text/csv')
+    if kind == 'stat':
+        if fmt == 'json':
+            return Response(json.dumps(NO_DATA, ensure_ascii=False), mimetype='application/json')
+        return Response(b'', status=200, mimetype='text/csv')
+    if kind == 'hang':
+        time.sleep(60)
+    return Response('Internal Server Error', status=500, mimetype='text/plain')
+
+
+@app.route('/fund/<endpoint>')
+@app.route('/exchangeReport/<endpoint>')
+def serve(endpoint):
+    if endpoint not in ENDPOINTS:
+        return Response('Not Found', status=404)
+    cfg = _config.get(endpoint, {})
+    params = request.args.to_dict()
+    stats = _stats[endpoint]
+    stats['requests'] += 1
+
+    lo, hi = parse_latency(cfg.get('latency'))
+    if hi > 0:
+        time.sleep(random.uniform(lo, hi))
+
+    if _throttled(endpoint, cfg):
+        stats['throttled'] += 1
+        return Response(BLOCK_PAGE, status=int(cfg.get('throttle_status', 200)), mimetype='text/html')
+
+    if random.random() < float(cfg.get('error_rate', 0)):
+        stats['errors'] += 1
+        return _error_response(str(cfg.get('error_kind', '500')), params.get('response', 'json'))
+
+    status, content, encoding, ctype = twse_replay.payload(endpoint, params)
+    stats['ok'] += 1
+    stats['bytes'] += len(content)
+    if ctype.startswith('text/'):
+        ctype = f'{ctype}; charset={encoding}'
+    return Response(content, status=status, content_type=ctype)
+
+
+@app.route('/__stats')
+def stats():
+    return jsonify({ep: dict(v) for ep, v in _stats.items()})
+
+
+@app.route('/__config', methods=['GET', 'POST'])
+def config():
+    if request.method == 'POST':
+        update(request.get_json(force=True) or {})
+    return jsonify(_config)
+
+
+def update(cfg):
+    with _lock:
+        for ep, opts in cfg.items():
+            if ep == '*':
+                for name in ENDPOINTS:
+                    _config[name].update(opts)
+            elif ep in _config:
+                _config[ep].update(opts)
+
+
+def _kv(items, key, cast=str):
+    """把 'T86=0.3' 形式的參數轉成設定，端點寫 * 代表全部。"""
+    out = {}
+    for item in items or []:
+        ep, _, val = item.partition('=')
+        out.setdefault(ep, {})[key] = cast(val)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="本地 TWSE 替身伺服器")
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8000)
+    ap.add_argument('--config', help="JSON 設定檔")
+    ap.add_argument('--latency', action='append', metavar='EP=SEC[-SEC]')
+    ap.add_argument('--rate-limit', action='append', metavar='EP=N/SEC')
+    ap.add_argument('--block-seconds', action='append', metavar='EP=SEC')
+    ap.add_argument('--error', action='append', metavar='EP=RATE[:KIND]',
+                    help=f"錯誤注入機率與種類 {'/'.join(ERROR_KINDS)}")
+    args = ap.parse_args(argv)
+
+    if args.config:
+        with open(args.config, encoding='utf-8') as f:
+            update(json.load(f))
+    update(_kv(args.latency, 'latency'))
+    update(_kv(args.rate_limit, 'rate_limit'))
+    update(_kv(args.block_seconds, 'block_seconds', float))
+    for item in args.error or []:
+        ep, _, spec = item.partition('=')
+        rate, _, kind = spec.partition(':')
+        update({ep: {'error_rate': float(rate), 'error_kind': kind or '500'}})
+
+    print(f"▶️ TWSE 替身伺服器：http://{args.host}:{args.port}")
+    print(f"   設定 TWSE_BASE_URL=http://{args.host}:{args.port} 後執行各腳本")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+# wsgi.py
+# 正式部署入口（多個 worker）：
+#   gunicorn -w 4 -b 0.0.0.0:8000 wsgi:application        # Linux，prefork 多行程
+#   waitress-serve --threads 8 --port 8000 wsgi:application  # Windows，單行程多執行緒
+#
+# 所有 worker 共用 data/cache/ 的回應快取與 output/ 的圖檔；shared.py 讓同一份資料、同一張圖
+# 同時只有一個 worker 去抓去畫，TWSE 請求的時間槽也由所有 worker 共同分配，
+# 增加 worker 只會提高處理量，不會讓打上游的次數與速度跟著倍增。
+import twse
+
+twse.governor.shared = True
+
+from app import app as application